@@ -3,9 +3,61 @@ const router = express.Router();
 const pythonBridge = require('../../services/pythonBridge');
 const { body, validationResult } = require('express-validator');
 
-// Chat endpoint - POST (main)
+// Relay a Python response body untouched (compressed columnar JSON or binary results)
+function relay(upstream, res) {
+  res.status(upstream.status);
+  ['content-type', 'content-encoding', 'content-length', 'vary'].forEach((header) => {
+    if (upstream.headers[header]) {
+      res.setHeader(header, upstream.headers[header]);
+    }
+  });
+  res.on('close', () => {
+    if (!res.writableFinished) {
+      upstream.data.destroy();
+    }
+  });
+  upstream.data.on('error', (error) => {
+    console.error('Relay error:', error.message);
+    res.destroy(error);
+  });
+  upstream.data.pipe(res);
+}
+
+// Time budget the client gave the whole request (X-Request-Timeout-Ms), passed on to Python
+function clientBudget(req) {
+  const budgetMs = parseInt(req.headers['x-request-timeout-ms'], 10);
+  return Number.isFinite(budgetMs) && budgetMs >= 0 ? budgetMs : undefined;
+}
+
+// Cancel the Python call when the client disconnects before the answer is sent
+function abortOnClose(res) {
+  const controller = new AbortController();
+  res.on('close', () => {
+    if (!res.writableFinished) {
+      controller.abort();
+    }
+  });
+  return controller.signal;
+}
+
+function sendError(res, error) {
+  if (error.cancelled || res.headersSent) {
+    return;
+  }
+  if (error.retryAfter) {
+    res.setHeader('Retry-After', error.retryAfter);
+  }
+  res.status(error.status || 500).json({
+    success: false,
+    error: error.message
+  });
+}
+
+// Chat endpoint - POST (main); result_format "columnar" or "binary" adds the result rows
 router.post('/', [
-  body('message').isString().isLength({ min: 1, max: 500 }).trim()
+  body('message').isString().isLength({ min: 1, max: 500 }).trim(),
+  body('result_format').optional().isIn(['columnar', 'binary']),
+  body('max_rows').optional().isInt({ min: 0, max: 100000 }).toInt()
 ], async (req, res) => {
   try {
     const errors = validationResult(req);
@@ -13,23 +65,116 @@ router.post('/', [
       return res.status(400).json({ errors: errors.array() });
     }
 
-    const { message } = req.body;
+    const { message, result_format: resultFormat, max_rows: maxRows } = req.body;
     const sessionId = req.headers['x-session-id'];
+    const budgetMs = clientBudget(req);
+    const signal = abortOnClose(res);
     
-    const result = await pythonBridge.sendMessage(message, sessionId);
+    if (resultFormat) {
+      const upstream = await pythonBridge.sendStructuredMessage(
+        message, sessionId, { resultFormat, maxRows, budgetMs, signal }, req.headers['accept-encoding'] || ''
+      );
+      if (upstream.headers['retry-after']) {
+        res.setHeader('Retry-After', upstream.headers['retry-after']);
+      }
+      return relay(upstream, res);
+    }
+    
+    const result = await pythonBridge.sendMessage(message, sessionId, { budgetMs, signal });
     
     res.json({
       success: true,
       response: result.response,
       csv_available: result.csv_available,
+      result: result.result,
       timestamp: new Date().toISOString()
     });
     
   } catch (error) {
-    res.status(500).json({
-      success: false,
-      error: error.message
+    sendError(res, error);
+  }
+});
+
+// Chat endpoint - POST, streamed as server-sent events
+router.post('/stream', [
+  body('message').isString().isLength({ min: 1, max: 500 }).trim()
+], async (req, res) => {
+  const errors = validationResult(req);
+  if (!errors.isEmpty()) {
+    return res.status(400).json({ errors: errors.array() });
+  }
+
+  try {
+    const { message } = req.body;
+    const sessionId = req.headers['x-session-id'];
+    
+    const eventStream = await pythonBridge.streamMessage(message, sessionId, {
+      budgetMs: clientBudget(req),
+      signal: abortOnClose(res)
+    });
+    
+    res.setHeader('Content-Type', 'text/event-stream');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.setHeader('Connection', 'keep-alive');
+    res.setHeader('X-Accel-Buffering', 'no');
+    res.flushHeaders();
+    
+    // Relay events as they arrive; stop reading from Python if the client goes away
+    res.on('close', () => {
+      if (!res.writableFinished) {
+        eventStream.data.destroy();
+      }
+    });
+    eventStream.data.on('error', (error) => {
+      console.error('Chat stream error:', error.message);
+      res.end();
+    });
+    eventStream.data.pipe(res);
+    
+  } catch (error) {
+    sendError(res, error);
+  }
+});
+
+// Batch endpoint - POST, many questions at once (NDJSON when stream is true)
+router.post('/batch', [
+  body('questions').isArray({ min: 1, max: 500 }),
+  body('questions.*').isString().isLength({ min: 1, max: 500 }).trim(),
+  body('stream').optional().isBoolean()
+], async (req, res) => {
+  const errors = validationResult(req);
+  if (!errors.isEmpty()) {
+    return res.status(400).json({ errors: errors.array() });
+  }
+
+  try {
+    const { questions, stream = false } = req.body;
+    const sessionId = req.headers['x-session-id'];
+    
+    const result = await pythonBridge.processBatch(questions, sessionId, stream, {
+      budgetMs: clientBudget(req),
+      signal: abortOnClose(res)
+    });
+    
+    if (!stream) {
+      return res.json({ success: true, ...result.data, timestamp: new Date().toISOString() });
+    }
+    
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.setHeader('X-Accel-Buffering', 'no');
+    res.on('close', () => {
+      if (!res.writableFinished) {
+        result.data.destroy();
+      }
     });
+    result.data.on('error', (error) => {
+      console.error('Batch stream error:', error.message);
+      res.end();
+    });
+    result.data.pipe(res);
+    
+  } catch (error) {
+    sendError(res, error);
   }
 });
 
@@ -39,7 +184,10 @@ router.get('/', async (req, res) => {
     const message = req.query.message || 'Hello, this is a test message';
     const sessionId = req.headers['x-session-id'];
     
-    const result = await pythonBridge.sendMessage(message, sessionId);
+    const result = await pythonBridge.sendMessage(message, sessionId, {
+      budgetMs: clientBudget(req),
+      signal: abortOnClose(res)
+    });
     
     res.json({
       success: true,
@@ -48,6 +196,36 @@ router.get('/', async (req, res) => {
       timestamp: new Date().toISOString()
     });
     
+  } catch (error) {
+    sendError(res, error);
+  }
+});
+
+// Result rows endpoint - one page of a stored result (keyset cursor via ?after=)
+router.get('/results/:id/rows', async (req, res) => {
+  try {
+    const { after, offset, limit } = req.query;
+    const page = await pythonBridge.getResultRows(req.params.id, { after, offset, limit });
+    
+    res.json({ success: true, ...page });
+    
+  } catch (error) {
+    res.status(error.status || 500).json({
+      success: false,
+      error: error.message
+    });
+  }
+});
+
+// Result data endpoint - a stored result's rows as columnar JSON (?format=columnar) or binary (?format=binary)
+router.get('/results/:id/data', async (req, res) => {
+  try {
+    const { format, limit } = req.query;
+    const upstream = await pythonBridge.getResultData(
+      req.params.id, { format, limit }, req.headers['accept-encoding'] || ''
+    );
+    relay(upstream, res);
+    
   } catch (error) {
     res.status(500).json({
       success: false,
@@ -56,14 +234,32 @@ router.get('/', async (req, res) => {
   }
 });
 
-// Download CSV endpoint
+// Download CSV endpoint (?result_id= picks the CSV of a specific answer, whichever worker produced it;
+// otherwise the last answer of the X-Session-ID session is used)
 router.get('/download-csv', async (req, res) => {
   try {
-    const csvStream = await pythonBridge.downloadCsv();
+    const csvStream = await pythonBridge.downloadCsv(
+      req.headers['accept-encoding'] || '', req.query.result_id, req.headers['x-session-id']
+    );
     
     res.setHeader('Content-Type', 'text/csv');
     res.setHeader('Content-Disposition', 'attachment; filename=query_results.csv');
+    ['content-encoding', 'content-length', 'vary'].forEach((header) => {
+      if (csvStream.headers[header]) {
+        res.setHeader(header, csvStream.headers[header]);
+      }
+    });
     
+    // Stream chunk by chunk; stop reading from Python if the client goes away
+    res.on('close', () => {
+      if (!res.writableFinished) {
+        csvStream.data.destroy();
+      }
+    });
+    csvStream.data.on('error', (error) => {
+      console.error('CSV stream error:', error.message);
+      res.destroy(error);
+    });
     csvStream.data.pipe(res);
     
   } catch (error) {
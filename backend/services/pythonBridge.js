@@ -3,28 +3,180 @@ const axios = require('axios');
 class PythonBridge {
   constructor() {
     this.pythonServiceUrl = process.env.PYTHON_SERVICE_URL || 'http://localhost:5001';
+    this.chatTimeoutMs = parseInt(process.env.PYTHON_CHAT_TIMEOUT_MS || '60000', 10);
+    this.batchTimeoutMs = parseInt(process.env.PYTHON_BATCH_TIMEOUT_MS || '600000', 10);
+    // Python gives up this much earlier than we do, so its 503 arrives before our timeout fires
+    this.deadlineMarginMs = parseInt(process.env.PYTHON_DEADLINE_MARGIN_MS || '500', 10);
   }
 
-  async sendMessage(message, sessionId = null) {
+  // Time budget of one call: our own timeout, shortened to the client's deadline when it sent one
+  deadline(timeoutMs, budgetMs) {
+    const limits = [timeoutMs, budgetMs].filter((ms) => Number.isFinite(ms) && ms > 0);
+    if (!limits.length) {
+      return { timeout: 0, headers: {} };
+    }
+    const timeout = Math.min(...limits);
+    return {
+      timeout,
+      headers: { 'X-Request-Timeout-Ms': String(Math.max(0, timeout - this.deadlineMarginMs)) }
+    };
+  }
+
+  serviceError(error, label) {
+    if (axios.isCancel(error)) {
+      const cancelled = new Error('Request cancelled by the client');
+      cancelled.cancelled = true;
+      return cancelled;
+    }
+    if (error.response && error.response.status === 503) {
+      // Load shed or deadline reached in Python: the client may retry later
+      const overloaded = new Error((error.response.data && error.response.data.error) || 'Chatbot service overloaded');
+      overloaded.status = 503;
+      overloaded.retryAfter = error.response.headers['retry-after'] || '1';
+      return overloaded;
+    }
+    if (error.code === 'ECONNABORTED' || error.code === 'ETIMEDOUT') {
+      const timedOut = new Error('Chatbot service timed out');
+      timedOut.status = 504;
+      return timedOut;
+    }
+    console.error(`${label}:`, error.message);
+    return new Error('Chatbot service unavailable');
+  }
+
+  async sendMessage(message, sessionId = null, { budgetMs, signal } = {}) {
+    const { timeout, headers } = this.deadline(this.chatTimeoutMs, budgetMs);
     try {
       const response = await axios.post(`${this.pythonServiceUrl}/api/chat`, {
         message,
         session_id: sessionId
       }, {
-        timeout: 60000
+        timeout,
+        headers,
+        signal
+      });
+      
+      return response.data;
+    } catch (error) {
+      throw this.serviceError(error, 'Python service error');
+    }
+  }
+
+  async sendStructuredMessage(message, sessionId = null, { resultFormat, maxRows, budgetMs, signal } = {}, acceptEncoding = '') {
+    const { timeout, headers } = this.deadline(this.chatTimeoutMs, budgetMs);
+    try {
+      // Columnar JSON or binary body relayed as is (still compressed), so Node never re-parses the rows
+      const response = await axios.post(`${this.pythonServiceUrl}/api/chat`, {
+        message,
+        session_id: sessionId,
+        result_format: resultFormat,
+        max_rows: maxRows
+      }, {
+        responseType: 'stream',
+        decompress: false,
+        headers: { ...headers, 'Accept-Encoding': acceptEncoding },
+        validateStatus: (status) => status < 500 || status === 503,
+        timeout,
+        signal
+      });
+      
+      return response;
+    } catch (error) {
+      throw this.serviceError(error, 'Python service error');
+    }
+  }
+
+  async streamMessage(message, sessionId = null, { budgetMs, signal } = {}) {
+    // No timeout of our own: a stream ends when the answer does, unless the client set a deadline
+    const { headers } = this.deadline(0, budgetMs);
+    try {
+      // Server-sent events: progress events first, then NL answer chunks
+      const response = await axios.post(`${this.pythonServiceUrl}/api/chat/stream`, {
+        message,
+        session_id: sessionId
+      }, {
+        responseType: 'stream',
+        decompress: false,
+        headers: { ...headers, Accept: 'text/event-stream' },
+        signal
+      });
+      
+      return response;
+    } catch (error) {
+      throw this.serviceError(error, 'Python stream error');
+    }
+  }
+
+  async processBatch(questions, sessionId = null, stream = false, { budgetMs, signal } = {}) {
+    const { timeout, headers } = this.deadline(stream ? 0 : this.batchTimeoutMs, budgetMs);
+    try {
+      // NDJSON when streaming: one JSON line per question as it completes
+      const response = await axios.post(`${this.pythonServiceUrl}/api/chat/batch`, {
+        questions,
+        session_id: sessionId,
+        stream
+      }, {
+        responseType: stream ? 'stream' : 'json',
+        timeout: stream ? 0 : timeout,
+        headers,
+        signal
+      });
+      
+      return response;
+    } catch (error) {
+      throw this.serviceError(error, 'Python batch error');
+    }
+  }
+
+  async getResultRows(resultId, { after, offset, limit } = {}) {
+    try {
+      const response = await axios.get(`${this.pythonServiceUrl}/api/results/${encodeURIComponent(resultId)}/rows`, {
+        params: { after, offset, limit },
+        timeout: 30000
       });
       
       return response.data;
     } catch (error) {
-      console.error('Python service error:', error.message);
+      if (error.response && [400, 404].includes(error.response.status)) {
+        const notAvailable = new Error(error.response.data.error || 'Result not available');
+        notAvailable.status = error.response.status;
+        throw notAvailable;
+      }
+      console.error('Result page error:', error.message);
+      throw new Error('Chatbot service unavailable');
+    }
+  }
+
+  async getResultData(resultId, { format, limit } = {}, acceptEncoding = '') {
+    try {
+      // 404 (expired) and 400 (bad format) bodies are relayed like the data itself
+      const response = await axios.get(`${this.pythonServiceUrl}/api/results/${encodeURIComponent(resultId)}/data`, {
+        params: { format, limit },
+        responseType: 'stream',
+        decompress: false,
+        headers: { 'Accept-Encoding': acceptEncoding },
+        validateStatus: (status) => status < 500,
+        timeout: 60000
+      });
+      
+      return response;
+    } catch (error) {
+      console.error('Result data error:', error.message);
       throw new Error('Chatbot service unavailable');
     }
   }
 
-  async downloadCsv() {
+  async downloadCsv(acceptEncoding = '', resultId = null, sessionId = null) {
     try {
+      const params = {};
+      if (resultId) params.result_id = resultId;
+      if (sessionId) params.session_id = sessionId;
+      // Keep the body compressed so gzip CSVs are relayed without inflating them here
       const response = await axios.get(`${this.pythonServiceUrl}/api/download-csv`, {
-        responseType: 'stream'
+        params,
+        responseType: 'stream',
+        decompress: false,
+        headers: { 'Accept-Encoding': acceptEncoding }
       });
       
       return response;
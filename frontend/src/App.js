@@ -15,6 +15,8 @@ function App() {
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [csvAvailable, setCsvAvailable] = useState(false);
+  // Result id of the last answer with rows; the CSV is fetched by id so any Python worker can serve it
+  const [resultId, setResultId] = useState(null);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -52,6 +54,9 @@ function App() {
 
       setMessages(prev => [...prev, botMessage]);
       setCsvAvailable(response.data.csv_available);
+      if (response.data.result?.id) {
+        setResultId(response.data.result.id);
+      }
 
     } catch (error) {
       console.error('API Error:', error);
@@ -70,6 +75,7 @@ function App() {
   const downloadCSV = async () => {
     try {
       const response = await axios.get(`${API_BASE_URL}/api/chat/download-csv`, {
+        params: resultId ? { result_id: resultId } : {},
         responseType: 'blob'
       });
 
@@ -1,17 +1,41 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import os
 import sys
+import json
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from chatbot_service import ChatbotService
+import csv_export
+import result_codec
+import deadlines
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "1") != "0"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_COMPRESSION_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_LEVEL", "5"))
+RESULT_FORMATS = ('columnar', 'binary')
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
 
 app = Flask(__name__)
 CORS(app)
 
+def request_timeout():
+    """Seconds the caller will wait for this request (DEADLINE_HEADER), or None if it did not say."""
+    value = request.headers.get(DEADLINE_HEADER)
+    if value is None:
+        return None
+    try:
+        return float(value) / 1000.0
+    except ValueError:
+        return None
+
+def deadline_response(error):
+    """503 for a request abandoned at its deadline, so callers can back off and retry."""
+    return jsonify({'error': str(error), 'deadline_exceeded': True, 'stage': error.stage}), 503, {'Retry-After': '1'}
+
 chatbot_service = ChatbotService()
 
 @app.route('/api/chat', methods=['POST'])
-def chat():
+async def chat():
     try:
         data = request.get_json()
         message = data.get('message', '')
@@ -19,28 +43,208 @@ def chat():
         if not message:
             return jsonify({'error': 'Message is required'}), 400
             
-        response = chatbot_service.process_message(message)
+        result_format = data.get('result_format')
+        if result_format is not None and result_format not in RESULT_FORMATS:
+            return jsonify({'error': f"result_format must be one of {', '.join(RESULT_FORMATS)}"}), 400
+        max_rows = int(data['max_rows']) if data.get('max_rows') is not None else None
+
+        timings = {}
+        result = {}
+        rows = {} if result_format else None
+        response = await chatbot_service.process_message_async(
+            message, timings, data.get('session_id'), result, rows, max_rows, request_timeout()
+        )
         
-        return jsonify({
+        payload = {
             'response': response,
-            'csv_available': chatbot_service.has_csv_file()
-        })
+            'csv_available': result['csv_available'] if result else chatbot_service.has_csv_file(session_id=data.get('session_id')),
+            'result': result or None,
+            'timings': timings
+        }
+        if result_format is None:
+            return jsonify(payload)
+        return structured_response(result_format, rows, payload)
+    except deadlines.DeadlineExceeded as e:
+        return deadline_response(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.get_json() or {}
+    message = data.get('message', '')
+
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+
+    timeout = request_timeout()
+
+    def generate():
+        try:
+            for event, payload in chatbot_service.stream_message(message, data.get('session_id'), timeout):
+                if event == 'done':
+                    payload = dict(payload, csv_available=chatbot_service.has_csv_file(session_id=data.get('session_id')))
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        except deadlines.DeadlineExceeded as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e), 'deadline_exceeded': True})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/batch', methods=['POST'])
+async def chat_batch():
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    session_id = data.get('session_id')
+
+    try:
+        max_concurrency = int(data['max_concurrency']) if data.get('max_concurrency') else None
+        if data.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', ''):
+            items = chatbot_service.stream_batch(questions, session_id, max_concurrency, request_timeout())
+            first = next(items)
+
+            def generate():
+                yield json.dumps(first, ensure_ascii=False) + "\n"
+                for item in items:
+                    yield json.dumps(item, ensure_ascii=False) + "\n"
+
+            return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+        return jsonify(await chatbot_service.process_batch(questions, session_id, max_concurrency, request_timeout()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/results/<result_id>/rows', methods=['GET'])
+def result_rows(result_id):
+    try:
+        page = chatbot_service.get_result_page(
+            result_id,
+            after=request.args.get('after'),
+            offset=request.args.get('offset', type=int),
+            limit=request.args.get('limit', 100, type=int)
+        )
+        if page is None:
+            return jsonify({'error': 'Result not found or expired'}), 404
+        page['rows'] = result_codec.json_rows(page['rows'])
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/results/<result_id>/data', methods=['GET'])
+def result_data(result_id):
+    try:
+        result_format = request.args.get('format', 'columnar')
+        if result_format not in RESULT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(RESULT_FORMATS)}"}), 400
+        rows = chatbot_service.get_result_data(result_id, request.args.get('limit', type=int))
+        if rows is None:
+            return jsonify({'error': 'Result not found or expired'}), 404
+        return structured_response(result_format, rows)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def structured_response(result_format, rows, payload=None):
+    """
+    Build a columnar JSON or binary response for a result's rows.
+
+    Args:
+        result_format (str): "columnar" or "binary"
+        rows (dict): Result rows from result_data ({} when the question produced no result)
+        payload (dict or None): Chat fields sent along (the binary header's metadata)
+
+    Returns:
+        Response: application/json with the rows under "data", or the binary columnar layout
+    """
+    payload = dict(payload or {})
+    columns = rows.get('columns', [])
+    meta = {key: rows[key] for key in ('result_id', 'total_rows', 'capped', 'truncated') if key in rows}
+    if result_format == 'binary':
+        payload.update(meta)
+        body = result_codec.encode_binary(columns, rows.get('rows', []), payload)
+        return Response(body, mimetype=result_codec.BINARY_MIMETYPE)
+    payload['data'] = result_codec.columnar(columns, rows['rows'], **meta) if rows else None
+    return Response(result_codec.dumps(payload), mimetype='application/json')
+
 @app.route('/api/download-csv', methods=['GET'])
 def download_csv():
     try:
-        csv_path = chatbot_service.get_last_csv_path()
+        csv_path = chatbot_service.get_last_csv_path(request.args.get('result_id'), request.args.get('session_id'))
         if csv_path and os.path.exists(csv_path):
-            return send_file(csv_path, as_attachment=True)
+            if not csv_path.endswith('.gz'):
+                return send_file(csv_path, mimetype='text/csv', as_attachment=True)
+            download_name = os.path.basename(csv_path)[:-len('.gz')]
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                response = send_file(csv_path, mimetype='text/csv', as_attachment=True, download_name=download_name)
+                response.headers['Content-Encoding'] = 'gzip'
+                response.headers['Vary'] = 'Accept-Encoding'
+                return response
+            return Response(
+                csv_export.iter_file_chunks(csv_path, decompress=True),
+                mimetype='text/csv',
+                headers={'Content-Disposition': f'attachment; filename={download_name}'}
+            )
         return jsonify({'error': 'No CSV file available'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/usage', methods=['GET'])
+def usage():
+    return jsonify(chatbot_service.get_usage_stats(request.args.get('session_id')))
+
+@app.route('/api/index-advice', methods=['GET'])
+def index_advice():
+    return jsonify(chatbot_service.get_index_advice(request.args.get('limit', 10, type=int)))
+
+@app.route('/api/index-advice/build', methods=['POST'])
+def build_index_advice():
+    try:
+        data = request.get_json(silent=True) or {}
+        report = chatbot_service.build_indexed_database(int(data.get('limit', 10)), bool(data.get('switch', True)))
+        if 'error' in report:
+            return jsonify(report), 409
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.after_request
+def compress_response(response):
+    # Large buffered responses are compressed; streams and files (CSV downloads) are passed through
+    if (not RESPONSE_COMPRESSION or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in result_codec.COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    encoding = result_codec.negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    response.set_data(result_codec.compress(body, encoding, RESPONSE_COMPRESSION_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(chatbot_service.render_metrics(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,556 @@
+"""
+Offline end-to-end benchmark for the Python service.
+
+Replaces the Gemini models behind the agents with a deterministic stand-in
+that replays recorded SQL, NL and Orchestrator responses with configurable
+latency, injected 429 errors and token counts, then drives the full pipeline
+through ChatbotService.process_message and the Flask /api/chat route at
+several concurrency levels. No API key or network access is needed, so
+changes to the pipeline can be measured without Gemini latency noise:
+
+    python benchmark.py
+    python benchmark.py --targets service,flask --concurrency 1,4,16 --rounds 2
+    python benchmark.py --latency sql=0.05,nl=0.05,orchestrator=0.05 --save-baseline bench_baseline.json
+    python benchmark.py --latency sql=0.05,nl=0.05,orchestrator=0.05 --compare bench_baseline.json
+
+The questions come from "chat_bot test prompt.txt" and the examples of
+gradio_app.py. Caches are cleared before each concurrency level, so the
+first round is cold and later rounds are served from cache. Exits with
+status 1 when --compare finds a regression beyond the tolerance.
+"""
+import os
+import re
+import sys
+import ast
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+import contextlib
+import concurrent.futures
+from collections import defaultdict
+from datetime import datetime, timezone
+
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+BENCH_MIN_DELTA_SECONDS = float(os.getenv("BENCH_MIN_DELTA_SECONDS", "0.005"))
+BENCH_LATENCY = os.getenv("BENCH_LATENCY", "sql=0.8,nl=0.6,orchestrator=0.4")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROMPT_FILE = os.path.join(HERE, "..", "chat_bot test prompt.txt")
+GRADIO_FILE = os.path.join(HERE, "gradio_app.py")
+PERCENTILES = (50, 95, 99)
+
+AGENT_KINDS = {"SQL Agent": "sql", "NL Agent": "nl", "Orchestrator": "orchestrator"}
+
+DEFAULT_ORCHESTRATOR_REPLY = "This is a database question; the SQL and Natural Language agents will answer it."
+DEFAULT_SQL = "SELECT ProductName, Price FROM Products ORDER BY Price DESC LIMIT 10"
+
+# Recorded SQL Agent answers for the benchmark questions, keyed by question
+DEFAULT_SQL_RECORDINGS = {
+    "İlk 5 en düşük fiyatlı ürünün, hangi kategoride yer aldığını ve o kategorideki toplam ürün sayısını hesapla.":
+        "SELECT p.ProductName, p.Price, c.CategoryName, "
+        "(SELECT COUNT(*) FROM Products p2 WHERE p2.CategoryID = p.CategoryID) AS ProductCount "
+        "FROM Products p JOIN Categories c ON c.CategoryID = p.CategoryID ORDER BY p.Price ASC LIMIT 5",
+    "Her müşterinin toplam sipariş tutarını hesapla; ardından bu tutara göre en üst 3 müşteriyi belirle ve müşteri isimlerini göster.":
+        "SELECT c.CustomerName, SUM(od.Quantity * p.Price) AS TotalAmount FROM Customers c "
+        "JOIN Orders o ON o.CustomerID = c.CustomerID JOIN OrderDetails od ON od.OrderID = o.OrderID "
+        "JOIN Products p ON p.ProductID = od.ProductID GROUP BY c.CustomerID ORDER BY TotalAmount DESC LIMIT 3",
+    "1997 yılındaki tüm siparişleri göz önüne alarak, en yüksek sipariş tutarına sahip müşterinin ismini ve toplam sipariş tutarını ver.":
+        "SELECT c.CustomerName, SUM(od.Quantity * p.Price) AS TotalAmount FROM Customers c "
+        "JOIN Orders o ON o.CustomerID = c.CustomerID JOIN OrderDetails od ON od.OrderID = o.OrderID "
+        "JOIN Products p ON p.ProductID = od.ProductID WHERE strftime('%Y', o.OrderDate) = '1997' "
+        "GROUP BY c.CustomerID ORDER BY TotalAmount DESC LIMIT 1",
+    "Which product is the most ordered in each category? Display the corresponding category name, product name, and order quantity.":
+        "SELECT CategoryName, ProductName, MAX(Quantity) AS OrderQuantity FROM ("
+        "SELECT c.CategoryName, p.ProductName, SUM(od.Quantity) AS Quantity FROM OrderDetails od "
+        "JOIN Products p ON p.ProductID = od.ProductID JOIN Categories c ON c.CategoryID = p.CategoryID "
+        "GROUP BY p.ProductID) GROUP BY CategoryName ORDER BY CategoryName",
+    "Show all products in the 'Beverages' category.":
+        "SELECT p.ProductName, p.Unit, p.Price FROM Products p JOIN Categories c ON c.CategoryID = p.CategoryID "
+        "WHERE c.CategoryName = 'Beverages'",
+    "Show the total amount spent by each customer.":
+        "SELECT c.CustomerName, SUM(od.Quantity * p.Price) AS TotalSpent FROM Customers c "
+        "JOIN Orders o ON o.CustomerID = c.CustomerID JOIN OrderDetails od ON od.OrderID = o.OrderID "
+        "JOIN Products p ON p.ProductID = od.ProductID GROUP BY c.CustomerID ORDER BY TotalSpent DESC",
+    "List all customer names.": "SELECT CustomerName FROM Customers",
+    "Which product is the most expensive?": "SELECT ProductName, Price FROM Products ORDER BY Price DESC LIMIT 1",
+    "Show the top-selling product by category.":
+        "SELECT CategoryName, ProductName, MAX(Quantity) AS TotalQuantity FROM ("
+        "SELECT c.CategoryName, p.ProductName, SUM(od.Quantity) AS Quantity FROM OrderDetails od "
+        "JOIN Products p ON p.ProductID = od.ProductID JOIN Categories c ON c.CategoryID = p.CategoryID "
+        "GROUP BY p.ProductID) GROUP BY CategoryName ORDER BY CategoryName",
+    "Who has placed the most orders?":
+        "SELECT c.CustomerName, COUNT(o.OrderID) AS OrderCount FROM Customers c "
+        "JOIN Orders o ON o.CustomerID = c.CustomerID GROUP BY c.CustomerID ORDER BY OrderCount DESC LIMIT 1",
+    "Which supplier provides the most products?":
+        "SELECT s.SupplierName, COUNT(p.ProductID) AS ProductCount FROM Suppliers s "
+        "JOIN Products p ON p.SupplierID = s.SupplierID GROUP BY s.SupplierID ORDER BY ProductCount DESC LIMIT 1",
+}
+
+class StandInRateLimitError(Exception):
+    """Injected in place of Gemini's 429 Resource Exhausted error."""
+
+class StandInUsage:
+    """usage_metadata of a stand-in response."""
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class StandInResponse:
+    """Mimics a generate_content response; iterating it yields the streamed chunks."""
+    def __init__(self, text, usage_metadata=None, chunks=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self._chunks = chunks
+
+    def __iter__(self):
+        for chunk in self._chunks if self._chunks is not None else [self.text]:
+            yield StandInResponse(chunk)
+
+def normalize(question):
+    from query_cache import normalize_question
+    return normalize_question(question)
+
+class Recordings:
+    """
+    Recorded agent replies keyed by normalized question.
+
+    A recording file is JSON with "sql", "nl" and "orchestrator" objects
+    mapping a question to either the reply text or {"text", "input_tokens",
+    "output_tokens"}; "sql" replies may be plain SQL. Questions without a
+    recording get a default reply, so any question list can be replayed.
+    """
+    def __init__(self, sql=None, nl=None, orchestrator=None, nl_words=60):
+        self.replies = {
+            "sql": {normalize(q): r for q, r in (sql or {}).items()},
+            "nl": {normalize(q): r for q, r in (nl or {}).items()},
+            "orchestrator": {normalize(q): r for q, r in (orchestrator or {}).items()},
+        }
+        self.nl_words = nl_words
+
+    @classmethod
+    def load(cls, path=None, nl_words=60):
+        """
+        Load recordings from a JSON file, on top of the built-in SQL recordings.
+
+        Args:
+            path (str or None): Recording file
+            nl_words (int): Length of the generated NL answers without a recording
+
+        Returns:
+            Recordings
+        """
+        data = {}
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        return cls(dict(DEFAULT_SQL_RECORDINGS, **data.get("sql", {})), data.get("nl"), data.get("orchestrator"), nl_words)
+
+    def reply(self, kind, prompt):
+        """
+        Return the recorded reply to an agent prompt.
+
+        Args:
+            kind (str): "sql", "nl" or "orchestrator"
+            prompt (str): Prompt the agent sent
+
+        Returns:
+            tuple: (text, input_tokens, output_tokens); token counts are None when not recorded
+        """
+        question = question_from_prompt(kind, prompt)
+        recorded = self.replies[kind].get(normalize(question))
+        if isinstance(recorded, dict):
+            return self._text(kind, question, recorded.get("text")), recorded.get("input_tokens"), recorded.get("output_tokens")
+        return self._text(kind, question, recorded), None, None
+
+    def _text(self, kind, question, recorded):
+        if kind == "sql":
+            sql_query = recorded or DEFAULT_SQL
+            if sql_query.lstrip().startswith("{"):
+                return sql_query
+            return json.dumps({"sql_query": sql_query, "explanation": "Recorded response"})
+        if recorded is not None:
+            return recorded
+        if kind == "orchestrator":
+            return DEFAULT_ORCHESTRATOR_REPLY
+        words = re.findall(r"\w+", question) or ["answer"]
+        return "Here is the answer to your question. " + " ".join(words[i % len(words)] for i in range(self.nl_words)) + "."
+
+def question_from_prompt(kind, prompt):
+    """Recover the user question from the prompt an agent sends."""
+    if kind == "sql":
+        return prompt.rsplit("Convert this question to SQL:", 1)[-1].strip()
+    if kind == "nl":
+        match = re.search(r'Original user question: "(.*)"', prompt)
+        return match.group(1) if match else prompt
+    return prompt
+
+class GeminiStandIn:
+    """
+    Model factory for chatbot_service.gemini_model_factory that never leaves the process.
+
+    Each call sleeps for the agent's latency (with relative jitter), may
+    raise an injected 429 and returns the recorded reply with token counts.
+    Randomness is derived from the seed, the prompt and the attempt number,
+    so a run is reproducible regardless of thread scheduling.
+    """
+    def __init__(self, recordings, latency=None, jitter=0.2, rate_limit_rate=0.0, seed=0, stream_chunk_chars=40):
+        """
+        Args:
+            recordings (Recordings): Replies to replay
+            latency (dict): Mean seconds per call keyed by "sql", "nl" and "orchestrator"
+            jitter (float): Relative latency spread, e.g. 0.2 for +-20%
+            rate_limit_rate (float): Share of calls that fail with a 429 error
+            seed (int): Seed for latency jitter and 429 injection
+            stream_chunk_chars (int): Characters per chunk when streaming
+        """
+        self.recordings = recordings
+        self.latency = dict(latency or {})
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.stream_chunk_chars = stream_chunk_chars
+        self._lock = threading.Lock()
+        self._attempts = defaultdict(int)
+        self.calls = defaultdict(int)
+        self.rate_limited = 0
+
+    def __call__(self, name, role, config):
+        return StandInModel(self, AGENT_KINDS.get(name, "orchestrator"))
+
+    def _draw(self, kind, prompt):
+        with self._lock:
+            key = (kind, prompt)
+            attempt = self._attempts[key]
+            self._attempts[key] += 1
+            self.calls[kind] += 1
+        return random.Random(zlib.crc32(f"{self.seed}|{kind}|{attempt}|{prompt}".encode("utf-8")))
+
+    def call(self, kind, prompt, stream=False):
+        """Answer one generate_content call."""
+        rng = self._draw(kind, prompt)
+        mean = self.latency.get(kind, 0.0)
+        time.sleep(max(0.0, mean * (1 + rng.uniform(-self.jitter, self.jitter))))
+        if rng.random() < self.rate_limit_rate:
+            with self._lock:
+                self.rate_limited += 1
+            raise StandInRateLimitError("429 Resource has been exhausted (injected by the benchmark stand-in)")
+        from result_summarizer import estimate_tokens
+        text, input_tokens, output_tokens = self.recordings.reply(kind, prompt)
+        usage = StandInUsage(
+            estimate_tokens(prompt) if input_tokens is None else input_tokens,
+            estimate_tokens(text) if output_tokens is None else output_tokens,
+        )
+        if not stream:
+            return StandInResponse(text, usage)
+        size = max(1, self.stream_chunk_chars)
+        return StandInResponse(text, usage, [text[i:i + size] for i in range(0, len(text), size)])
+
+    def stats(self):
+        """Return call counts per agent kind and the number of injected 429s."""
+        with self._lock:
+            return {"calls": dict(self.calls), "rate_limited": self.rate_limited}
+
+class StandInModel:
+    """The GenerativeModel surface the agents use (generate_content and count_tokens)."""
+    def __init__(self, stand_in, kind):
+        self.stand_in = stand_in
+        self.kind = kind
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        return self.stand_in.call(self.kind, prompt, stream)
+
+    def count_tokens(self, text):
+        from result_summarizer import estimate_tokens
+        return StandInUsage(estimate_tokens(str(text)), 0)
+
+def load_questions(prompt_file=PROMPT_FILE, gradio_file=GRADIO_FILE):
+    """
+    Collect the benchmark questions from the test prompt file and the Gradio examples.
+
+    Returns:
+        list: Unique questions in file order
+    """
+    questions = []
+    if os.path.exists(prompt_file):
+        with open(prompt_file, "r", encoding="utf-8") as f:
+            for line in f:
+                match = re.match(r"^\s*\d+\s*[-.)]\s*(\S.*)$", line)
+                if match:
+                    questions.append(match.group(1).strip())
+    if os.path.exists(gradio_file):
+        # Parsed rather than imported, so the benchmark does not need Gradio
+        with open(gradio_file, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.keyword) and node.arg == "examples" and isinstance(node.value, ast.List):
+                questions.extend(e.value for e in node.value.elts if isinstance(e, ast.Constant) and isinstance(e.value, str))
+    return list(dict.fromkeys(questions))
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-pct * len(ordered) // 100))
+    return ordered[int(rank) - 1]
+
+def summarize(values):
+    """Return count, mean and p50/p95/p99 of latency samples in seconds."""
+    summary = {"count": len(values), "mean": round(sum(values) / len(values), 6) if values else None}
+    for pct in PERCENTILES:
+        value = percentile(values, pct)
+        summary[f"p{pct}"] = None if value is None else round(value, 6)
+    return summary
+
+def memory_usage():
+    """
+    Return the current and peak resident set size of this process.
+
+    Returns:
+        dict: rss_mb and peak_rss_mb (None where the platform does not report them)
+    """
+    rss_mb = peak_mb = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    return {
+        "rss_mb": None if rss_mb is None else round(rss_mb, 1),
+        "peak_rss_mb": None if peak_mb is None else round(peak_mb, 1),
+    }
+
+def install_stand_in(chatbot_service, stand_in):
+    """Route every agent's model calls to the stand-in (models already created are replaced)."""
+    chatbot_service.gemini_model_factory = stand_in
+    for agent in (chatbot_service.sql_agent, chatbot_service.nl_agent, chatbot_service.orchestrator):
+        agent._model = None
+
+def service_target(chatbot_service):
+    """Return a call(question, session_id) -> (ok, response) driving ChatbotService.process_message."""
+    service = chatbot_service.ChatbotService()
+
+    def call(question, session_id):
+        response = service.process_message(question, session_id)
+        return not str(response).startswith("❌"), response
+    return call
+
+def flask_target():
+    """Return a call(question, session_id) -> (ok, response) driving POST /api/chat through Flask's test client."""
+    import app as flask_app
+
+    def call(question, session_id):
+        response = flask_app.app.test_client().post("/api/chat", json={"message": question, "session_id": session_id})
+        data = response.get_json(silent=True) or {}
+        text = data.get("response") or data.get("error") or ""
+        return response.status_code == 200 and not text.startswith("❌"), text
+    return call
+
+def run_level(chatbot_service, stand_in, target, call, questions, concurrency, rounds=1):
+    """
+    Send every question rounds times with a fixed number of requests in flight.
+
+    Returns:
+        dict: Requests, errors, throughput, request and per-stage latency, memory, Gemini calls and tokens
+    """
+    import metrics
+    import calculate_token as hw2
+    chatbot_service.sql_cache.clear()
+    chatbot_service.result_cache.clear()
+    samples = defaultdict(list)
+    samples_lock = threading.Lock()
+
+    def listener(stage, seconds):
+        with samples_lock:
+            samples[stage].append(seconds)
+
+    def timed(question, session_id):
+        started = time.perf_counter()
+        try:
+            ok, _ = call(question, session_id)
+        except Exception as e:
+            print(f"❌ Benchmark request failed: {e}", file=sys.__stderr__)
+            ok = False
+        return ok, time.perf_counter() - started
+
+    workload = [q for _ in range(rounds) for q in questions]
+    usage_before = hw2.usage_ledger.snapshot()["total"]
+    calls_before = stand_in.stats()
+    metrics.stage_listeners.append(listener)
+    try:
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(
+                timed, workload, [f"bench-{target}-{concurrency}-{i}" for i in range(len(workload))]
+            ))
+        wall = time.perf_counter() - started
+    finally:
+        metrics.stage_listeners.remove(listener)
+    usage_after = hw2.usage_ledger.snapshot()["total"]
+    calls_after = stand_in.stats()
+    latencies = [seconds for _, seconds in outcomes]
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": len(workload),
+        "errors": sum(1 for ok, _ in outcomes if not ok),
+        "seconds": round(wall, 4),
+        "throughput_rps": round(len(workload) / wall, 4) if wall else None,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(values) for stage, values in sorted(samples.items())},
+        "memory": memory_usage(),
+        "gemini": {
+            "calls": {
+                kind: count - calls_before["calls"].get(kind, 0) for kind, count in calls_after["calls"].items()
+            },
+            "rate_limited": calls_after["rate_limited"] - calls_before["rate_limited"],
+            "input_tokens": usage_after["input_tokens"] - usage_before["input_tokens"],
+            "output_tokens": usage_after["output_tokens"] - usage_before["output_tokens"],
+        },
+    }
+
+def compare_reports(report, baseline, tolerance=BENCH_TOLERANCE, min_delta=BENCH_MIN_DELTA_SECONDS):
+    """
+    Compare a report against a baseline of the same targets and concurrency levels.
+
+    A run regresses when its request or stage p95 latency grows by more than
+    tolerance (and by more than min_delta seconds), its throughput drops by
+    more than tolerance, or it has more errors than the baseline.
+
+    Returns:
+        list: Regression messages (empty when the report is within tolerance)
+    """
+    failures = []
+    baseline_runs = {(run["target"], run["concurrency"]): run for run in baseline.get("runs", [])}
+    for run in report["runs"]:
+        base = baseline_runs.get((run["target"], run["concurrency"]))
+        if base is None:
+            continue
+        label = f"{run['target']} x{run['concurrency']}"
+        latencies = [("request", run["latency"], base["latency"])]
+        latencies += [(stage, run["stages"][stage], base["stages"][stage]) for stage in run["stages"] if stage in base["stages"]]
+        for name, current, previous in latencies:
+            now, before = current.get("p95"), previous.get("p95")
+            if now is None or before is None:
+                continue
+            if now > before * (1 + tolerance) and now - before > min_delta:
+                failures.append(f"{label}: {name} p95 {now:.4f}s vs {before:.4f}s baseline")
+        if base.get("throughput_rps") and run["throughput_rps"] is not None \
+                and run["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            failures.append(f"{label}: throughput {run['throughput_rps']:.2f}/s vs {base['throughput_rps']:.2f}/s baseline")
+        if run["errors"] > base["errors"]:
+            failures.append(f"{label}: {run['errors']} errors vs {base['errors']} baseline")
+    return failures
+
+def parse_latency(text):
+    """Parse "sql=0.8,nl=0.6,orchestrator=0.4" into a dict of seconds."""
+    latency = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        kind, _, seconds = part.partition("=")
+        if kind.strip() not in AGENT_KINDS.values():
+            raise argparse.ArgumentTypeError(f"unknown agent in latency: {kind}")
+        latency[kind.strip()] = float(seconds)
+    return latency
+
+def print_run(run):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}"
+    latency = run["latency"]
+    print(
+        f"▶ {run['target']} x{run['concurrency']}: {run['requests']} requests, {run['errors']} errors, "
+        f"{run['throughput_rps']:.2f} req/s, p50 {ms(latency['p50'])} ms, p95 {ms(latency['p95'])} ms, "
+        f"p99 {ms(latency['p99'])} ms, RSS {run['memory']['rss_mb']} MB, "
+        f"Gemini calls {sum(run['gemini']['calls'].values())} ({run['gemini']['rate_limited']} x 429)"
+    )
+    print(f"  {'stage':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, summary in run["stages"].items():
+        print(f"  {stage:<24}{summary['count']:>8}{ms(summary['p50']):>10}{ms(summary['p95']):>10}{ms(summary['p99']):>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chatbot pipeline offline with a Gemini stand-in.")
+    parser.add_argument("--targets", default="service,flask", help="Comma-separated targets: service, flask")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=1, help="Times each question is asked per level")
+    parser.add_argument("--questions", help="File with one question per line (default: test prompts and Gradio examples)")
+    parser.add_argument("--recordings", help="JSON file with recorded agent replies")
+    parser.add_argument("--latency", type=parse_latency, default=BENCH_LATENCY, help="Mean seconds per agent call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative latency jitter")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of Gemini calls failing with 429")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for jitter and 429 injection")
+    parser.add_argument("--save-baseline", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Compare against a baseline JSON file and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE, help="Allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="Keep the service's own log output")
+    args = parser.parse_args(argv)
+    latency = args.latency
+
+    # The stand-in has no quota; a real RPM limit would only measure the limiter's waiting
+    os.environ.setdefault("GEMINI_RPM", "1000000")
+    os.environ.setdefault("GEMINI_TPM", "1000000000")
+    sys.path.insert(0, HERE)
+    import chatbot_service
+
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = load_questions()
+    stand_in = GeminiStandIn(Recordings.load(args.recordings), latency, args.jitter, args.rate_limit_rate, args.seed)
+    install_stand_in(chatbot_service, stand_in)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {
+            "questions": len(questions),
+            "rounds": args.rounds,
+            "latency": latency,
+            "jitter": args.jitter,
+            "rate_limit_rate": args.rate_limit_rate,
+            "seed": args.seed,
+        },
+        "runs": [],
+    }
+    print(f"⏱ Benchmarking {len(questions)} questions with a Gemini stand-in (latency {latency})")
+    for target in filter(None, (t.strip() for t in args.targets.split(","))):
+        try:
+            call = service_target(chatbot_service) if target == "service" else flask_target() if target == "flask" else None
+        except ImportError as e:
+            print(f"⚠ Skipping target {target}: {e}")
+            continue
+        if call is None:
+            print(f"⚠ Unknown target {target}")
+            continue
+        for concurrency in (int(c) for c in args.concurrency.split(",") if c.strip()):
+            with open(os.devnull, "w") as devnull, \
+                    contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                run = run_level(chatbot_service, stand_in, target, call, questions, concurrency, args.rounds)
+            report["runs"].append(run)
+            print_run(run)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline written to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            failures = compare_reports(report, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"❌ Regression: {failure}")
+        if not failures:
+            print("✅ Within tolerance of the baseline")
+        return 1 if failures else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,12 @@
 import time
-import google.generativeai as genai
+import random
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import metrics
+import deadlines
+from result_summarizer import estimate_tokens
 
 MAX_TOKENS = 500
 CONTEXT_WINDOW = 1000
@@ -11,7 +18,11 @@ def count_tokens(text, model):
     return response.total_tokens
 
 def get_token_usage(prompt, response_text, model):
-    """Calculate the token usage for the given prompt and response using the model."""
+    """
+    Calculate the token usage for the given prompt and response using the model.
+
+    This costs two extra count_tokens round trips; prefer usage_from_response().
+    """
     input_tokens = count_tokens(prompt, model)
     output_tokens = count_tokens(response_text, model)
     total_tokens = input_tokens + output_tokens
@@ -26,6 +37,8 @@ def api_request_with_retry(request_func, *args, **kwargs):
     while retries <= max_retries:
         try:
             return request_func(*args, **kwargs)
+        except (deadlines.DeadlineExceeded, deadlines.Cancelled):
+            raise
         except Exception as e:
             error_message = str(e).lower()
 
@@ -34,15 +47,21 @@ def api_request_with_retry(request_func, *args, **kwargs):
                     print(f"⚠ API Rate Limit Error: {e}")
                     api_error_shown = True
 
-                wait_time = 2 ** retries
+                metrics.registry.inc("gemini_retries_total")
+                metrics.tally("gemini_retries")
+                # Jitter so callers that hit the limit together do not retry together
+                wait_time = round(2 ** retries * random.uniform(0.5, 1.0), 2)
                 print(f"⏳ Rate limit reached! Waiting {wait_time} seconds... ({retries}/{max_retries})")
-                time.sleep(wait_time)
+                # Gives up instead when the request's deadline would pass during the wait
+                deadlines.sleep(wait_time, "gemini_retry")
                 retries += 1
             else:
                 print(f"❌ API Error: {e}")
+                metrics.registry.inc("gemini_errors_total", reason="api_error")
                 return None
 
     print("❌ Maximum retries reached, API request failed.")
+    metrics.registry.inc("gemini_errors_total", reason="retries_exhausted")
     return None
 
 def calculate_gemini_cost(input_tokens, output_tokens):
@@ -75,3 +94,121 @@ def calculate_gemini_cost(input_tokens, output_tokens):
         output_cost = (output_tokens / 1_000_000) * 0.60
 
     return input_cost + output_cost
+
+current_session = contextvars.ContextVar("current_session", default=None)
+
+@contextmanager
+def session_scope(session_id):
+    """Attribute the token usage recorded inside the block to a session."""
+    token = current_session.set(session_id)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+def usage_from_response(response, prompt, response_text):
+    """
+    Read token usage from a generate_content response without extra API calls.
+
+    Uses the response's usage_metadata when present and falls back to the
+    local character-based estimate otherwise.
+
+    Args:
+        response: generate_content response (or fully consumed stream)
+        prompt (str): Prompt that was sent
+        response_text (str): Text that was received
+
+    Returns:
+        tuple: (input_tokens, output_tokens, estimated)
+    """
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if input_tokens is not None and output_tokens is not None:
+        return int(input_tokens), int(output_tokens), False
+    return estimate_tokens(str(prompt)), estimate_tokens(response_text or ""), True
+
+def _empty_usage():
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_calls": 0, "cost": 0.0}
+
+def _add_usage(usage, input_tokens, output_tokens, cost, estimated):
+    usage["calls"] += 1
+    usage["input_tokens"] += input_tokens
+    usage["output_tokens"] += output_tokens
+    usage["cost"] += cost
+    if estimated:
+        usage["estimated_calls"] += 1
+
+class UsageLedger:
+    """
+    In-memory token and cost totals per agent, per session and per time window.
+
+    Sessions are kept in LRU order and time windows in a fixed-length ring,
+    so memory stays bounded however long the service runs.
+    """
+    def __init__(self, window_seconds=60, max_windows=60, max_sessions=1000):
+        """
+        Args:
+            window_seconds (int): Length of one time window
+            max_windows (int): Number of most recent windows kept
+            max_sessions (int): Number of most recently active sessions kept
+        """
+        self.window_seconds = window_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._total = _empty_usage()
+        self._agents = {}
+        self._sessions = OrderedDict()
+        self._windows = deque(maxlen=max_windows)
+
+    def record(self, agent, input_tokens, output_tokens, estimated=False, session_id=None):
+        """
+        Add one model call to the ledger.
+
+        Args:
+            agent (str): Name of the agent that made the call
+            input_tokens (int): Prompt tokens
+            output_tokens (int): Response tokens
+            estimated (bool): True when the counts are local estimates
+            session_id (str or None): Session to charge (defaults to the current session scope)
+        """
+        session_id = session_id if session_id is not None else current_session.get()
+        cost = calculate_gemini_cost(input_tokens, output_tokens)
+        window_start = int(time.time() // self.window_seconds * self.window_seconds)
+        with self._lock:
+            _add_usage(self._total, input_tokens, output_tokens, cost, estimated)
+            _add_usage(self._agents.setdefault(agent, _empty_usage()), input_tokens, output_tokens, cost, estimated)
+            if session_id is not None:
+                usage = self._sessions.pop(session_id, None) or _empty_usage()
+                _add_usage(usage, input_tokens, output_tokens, cost, estimated)
+                self._sessions[session_id] = usage
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            if not self._windows or self._windows[-1][0] != window_start:
+                self._windows.append((window_start, _empty_usage()))
+            _add_usage(self._windows[-1][1], input_tokens, output_tokens, cost, estimated)
+
+    def snapshot(self, session_id=None):
+        """
+        Return a copy of the current totals.
+
+        Args:
+            session_id (str or None): Only include this session in the per-session section
+
+        Returns:
+            dict: total, agents, sessions and windows
+        """
+        with self._lock:
+            if session_id is None:
+                sessions = {key: dict(value) for key, value in self._sessions.items()}
+            else:
+                sessions = {session_id: dict(self._sessions.get(session_id) or _empty_usage())}
+            return {
+                "total": dict(self._total),
+                "agents": {name: dict(usage) for name, usage in self._agents.items()},
+                "sessions": sessions,
+                "window_seconds": self.window_seconds,
+                "windows": [dict(usage, start=start) for start, usage in self._windows],
+            }
+
+usage_ledger = UsageLedger()
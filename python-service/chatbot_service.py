@@ -1,23 +1,78 @@
-import gradio as gr
+import asyncio
+import concurrent.futures
+import contextvars
 import sqlite3
-import google.generativeai as genai
+import time
 import os
 import json
 import csv
-import pandas as pd
 from datetime import datetime
 import calculate_token as hw2
+import query_cache
+import db_pool
+import csv_export
+import result_summarizer
+import intent_gate
+import metrics
+import rate_limiter
+import query_governor
+import index_advisor
+import schema_catalog
+import materialized_aggregates
+import result_store
+import session_state
+import followup
+import shards
+import deadlines
+import threading
+import queue
 import re
 from dotenv import load_dotenv
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
 
 CSV_FOLDER = "query_results"
-if not os.path.exists(CSV_FOLDER):
-    os.makedirs(CSV_FOLDER)
 LAST_CSV_PATH = None
 
 load_dotenv()
+# Worker processes serving the app (set by gunicorn.conf.py); with more than one, LAST_CSV_PATH is never used
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "1000"))
+CSV_COMPRESSION = os.getenv("CSV_COMPRESSION", "").lower() == "gzip"
+MAX_RESULT_ROWS_IN_MEMORY = int(os.getenv("MAX_RESULT_ROWS_IN_MEMORY", "10000"))
+NL_TOKEN_BUDGET = int(os.getenv("NL_TOKEN_BUDGET", "4000"))
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "10"))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", "1.0"))
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "100000"))
+QUERY_MAX_PLAN_ROWS = int(os.getenv("QUERY_MAX_PLAN_ROWS", "10000000"))
+QUERY_FULL_SCAN_WARN_ROWS = int(os.getenv("QUERY_FULL_SCAN_WARN_ROWS", "100000"))
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "10"))
+QUERY_MAX_VM_STEPS = int(os.getenv("QUERY_MAX_VM_STEPS", "0"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH") or os.path.join(CSV_FOLDER, "result_store.db")
+RESULT_HANDLE_TTL = float(os.getenv("RESULT_HANDLE_TTL", "900"))
+RESULT_PAGE_MAX_ROWS = int(os.getenv("RESULT_PAGE_MAX_ROWS", "1000"))
+# Results with more rows are stored while they are exported; smaller ones only on the first page request
+RESULT_SPILL_MIN_ROWS = int(os.getenv("RESULT_SPILL_MIN_ROWS", "0"))
+result_handles = result_store.ResultStore(
+    RESULT_STORE_PATH, RESULT_HANDLE_TTL, RESULT_PAGE_MAX_ROWS, spill_min_rows=RESULT_SPILL_MIN_ROWS
+)
+RESULT_INLINE_MAX_ROWS = int(os.getenv("RESULT_INLINE_MAX_ROWS", "10000"))
+RESULT_DATA_MAX_ROWS = int(os.getenv("RESULT_DATA_MAX_ROWS", str(MAX_RESULT_ROWS)))
+FOLLOWUPS_ENABLED = os.getenv("FOLLOWUPS_ENABLED", "1") != "0"
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+conversation_sessions = session_state.SessionStore(SESSION_MAX_SESSIONS, SESSION_IDLE_SECONDS, SESSION_MAX_BYTES)
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "0"))
+DEADLINE_SHED_FACTOR = float(os.getenv("DEADLINE_SHED_FACTOR", "1.0"))
+stage_estimates = deadlines.StageEstimates()
+metrics.stage_listeners.append(stage_estimates.observe)
 DB_PATH = os.getenv("DB_PATH")
+SHARD_MANIFEST = os.getenv("SHARD_MANIFEST")
+shard_manifest = shards.load_manifest(SHARD_MANIFEST) if SHARD_MANIFEST else None
+if shard_manifest is not None and not DB_PATH:
+    # Every shard has the full schema, so the first one serves introspection
+    DB_PATH = shard_manifest.shards[0].path
 
 database_schema = """
 Here is the schema for the Northwind database:
@@ -31,8 +86,168 @@ Here is the schema for the Northwind database:
 - Suppliers: SupplierID, SupplierName, ContactName, Address, City, PostalCode, Country, Phone
 """
 
+SCHEMA_INTROSPECTION = os.getenv("SCHEMA_INTROSPECTION", "1") != "0"
+SCHEMA_EXCLUDE_TABLES = [t.strip() for t in os.getenv("SCHEMA_EXCLUDE_TABLES", "users,query_history").split(",") if t.strip()]
+SCHEMA_CACHE_PATH = os.getenv("SCHEMA_CACHE_PATH")
+SCHEMA_MAX_TABLES = int(os.getenv("SCHEMA_MAX_TABLES", "6"))
+
+def load_schema_catalog(db_path):
+    """
+    Introspect the database schema, leaving out application tables.
+
+    Args:
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        SchemaCatalog or None: The catalog, or None if introspection is disabled or failed
+    """
+    if not SCHEMA_INTROSPECTION or not db_path or not os.path.exists(db_path):
+        return None
+    try:
+        catalog = schema_catalog.introspect(db_path, SCHEMA_EXCLUDE_TABLES, SCHEMA_CACHE_PATH)
+        print(f"📚 Schema introspected: {len(catalog.tables)} tables (hash {catalog.fingerprint})")
+        return catalog
+    except Exception as e:
+        print(f"⚠ Schema introspection failed, using the built-in schema: {e}")
+        return None
+
+schema = load_schema_catalog(DB_PATH)
+if schema is not None:
+    database_schema = schema.describe()
+
+def schema_for_question(question):
+    """
+    Return the part of the schema the SQL Agent needs for a question.
+
+    Args:
+        question (str): User question
+
+    Returns:
+        str: Pruned schema text (the full schema if nothing matched or introspection is off)
+    """
+    pruned = database_schema if schema is None else schema.prune(question, SCHEMA_MAX_TABLES)
+    if aggregates_ready():
+        pruned += summary_tables.describe()
+    return pruned
+
+def aggregates_ready():
+    """Return True when the summary tables are built and attached to query connections (refreshing them on first use)."""
+    if summary_tables is None:
+        return False
+    if not aggregates_loaded.is_set():
+        with aggregates_load_lock:
+            if not aggregates_loaded.is_set():
+                refresh_aggregates()
+                aggregates_loaded.set()
+    return aggregates_attached()
+
+def aggregates_attached():
+    """Return True when the summary tables are attached, without triggering the first refresh."""
+    return summary_tables is not None and summary_tables.schema_name in db_connection_pool.attachments
+
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "512"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "3600"))
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH")
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+shared_cache = (
+    query_cache.SharedCacheStore(SHARED_CACHE_PATH, SQL_CACHE_SIZE, SHARED_CACHE_MAX_BYTES) if SHARED_CACHE_PATH else None
+)
+sql_cache = query_cache.SQLCache(SQL_CACHE_SIZE, SQL_CACHE_TTL, SQL_CACHE_PATH, shared=shared_cache)
+result_cache = query_cache.ResultCache(RESULT_CACHE_MAX_BYTES, shared=shared_cache)
+db_version_watcher = (
+    query_cache.MultiDatabaseVersionWatcher([shard.path for shard in shard_manifest.shards])
+    if shard_manifest is not None else query_cache.DatabaseVersionWatcher(DB_PATH)
+)
+# Shares database switches between worker processes (set by gunicorn.conf.py)
+SERVED_DB_STATE_PATH = os.getenv("SERVED_DB_STATE_PATH")
+served_database = (
+    query_cache.ServedDatabase(SERVED_DB_STATE_PATH, DB_PATH)
+    if SERVED_DB_STATE_PATH and DB_PATH and shard_manifest is None else None
+)
+served_database_lock = threading.Lock()
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+sql_governor = query_governor.QueryGovernor(
+    max_plan_rows=QUERY_MAX_PLAN_ROWS,
+    full_scan_warn_rows=QUERY_FULL_SCAN_WARN_ROWS,
+    max_seconds=QUERY_TIMEOUT_SECONDS,
+    max_vm_steps=QUERY_MAX_VM_STEPS,
+)
+INDEX_ADVISOR_MAX_QUERIES = int(os.getenv("INDEX_ADVISOR_MAX_QUERIES", "1000"))
+OPTIMIZED_DB_PATH = os.getenv("OPTIMIZED_DB_PATH") or (f"{os.path.splitext(DB_PATH)[0]}.optimized.db" if DB_PATH else None)
+query_index_advisor = index_advisor.IndexAdvisor(INDEX_ADVISOR_MAX_QUERIES)
+index_build_lock = threading.Lock()
+db_connection_pool = db_pool.ConnectionPool(
+    DB_PATH,
+    size=DB_POOL_SIZE,
+    wait_timeout=DB_POOL_TIMEOUT,
+    pragmas={"mmap_size": DB_MMAP_SIZE, "cache_size": -DB_CACHE_SIZE_KB},
+)
+SHARD_POOL_SIZE = int(os.getenv("SHARD_POOL_SIZE", "2"))
+SHARD_MAX_WORKERS = int(os.getenv("SHARD_MAX_WORKERS", "0"))
+shard_router = shards.ShardRouter(
+    shard_manifest,
+    pool_size=SHARD_POOL_SIZE,
+    wait_timeout=DB_POOL_TIMEOUT,
+    pragmas={"mmap_size": DB_MMAP_SIZE, "cache_size": -DB_CACHE_SIZE_KB},
+    governor=sql_governor,
+    chunk_size=CSV_CHUNK_SIZE,
+    max_workers=SHARD_MAX_WORKERS or None,
+) if shard_manifest is not None else None
+# Summary tables are built from a single database file, so they are off when serving from shards
+AGGREGATES_ENABLED = os.getenv("AGGREGATES_ENABLED", "1") != "0" and shard_router is None
+AGGREGATES_PATH = os.getenv("AGGREGATES_PATH") or (f"{os.path.splitext(DB_PATH)[0]}.aggregates.db" if DB_PATH else None)
+AGGREGATE_REWRITE = os.getenv("AGGREGATE_REWRITE", "0") == "1"
+summary_tables = (
+    materialized_aggregates.MaterializedAggregates(AGGREGATES_PATH) if AGGREGATES_ENABLED and AGGREGATES_PATH else None
+)
+aggregates_loaded = threading.Event()
+aggregates_load_lock = threading.Lock()
+
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "64"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "30"))
+GEMINI_RATE_LIMIT_COOLDOWN = float(os.getenv("GEMINI_RATE_LIMIT_COOLDOWN", "2"))
+GEMINI_RATE_STATE_PATH = os.getenv("GEMINI_RATE_STATE_PATH")
+gemini_limiter = rate_limiter.RateLimiter(
+    rpm=GEMINI_RPM,
+    tpm=GEMINI_TPM,
+    max_concurrency=GEMINI_MAX_CONCURRENCY,
+    max_waiters=GEMINI_MAX_QUEUE,
+    wait_timeout=GEMINI_QUEUE_TIMEOUT,
+    state_path=GEMINI_RATE_STATE_PATH,
+)
+gemini_singleflight = rate_limiter.SingleFlight()
+
 GOOGLE_API_KEY = os.getenv('GEMINIAPI')
-genai.configure(api_key=GOOGLE_API_KEY)
+gemini_sdk = None
+gemini_sdk_lock = threading.Lock()
+
+def load_gemini_sdk():
+    """
+    Import and configure google.generativeai on first use.
+
+    The SDK is slow to import, so the service starts without it and only
+    loads it when an agent makes its first call.
+
+    Returns:
+        module: The configured google.generativeai module
+    """
+    global gemini_sdk
+    if gemini_sdk is None:
+        with gemini_sdk_lock:
+            if gemini_sdk is None:
+                import google.generativeai as genai
+                genai.configure(api_key=GOOGLE_API_KEY)
+                gemini_sdk = genai
+    return gemini_sdk
 
 generation_config = {
     "temperature": 0.1,
@@ -63,11 +278,14 @@ sql_generation_config = {
     }
 }
 
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-}
+def safety_settings():
+    """Return the safety thresholds shared by all agents (needs the Gemini SDK)."""
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+    return {
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
 
 GUARDLIST = [
     r"system prompt",
@@ -92,6 +310,12 @@ GUARDLIST = [
     r"system role",
 ]
 
+INTENT_GATE_ENABLED = os.getenv("INTENT_GATE_ENABLED", "1") != "0"
+INTENT_GATE_HIGH = float(os.getenv("INTENT_GATE_HIGH", "0.75"))
+INTENT_GATE_LOW = float(os.getenv("INTENT_GATE_LOW", "0.2"))
+OFF_TOPIC_RESPONSE = "I have no knowledge on this topic."
+question_gate = intent_gate.IntentGate(database_schema, GUARDLIST, INTENT_GATE_HIGH, INTENT_GATE_LOW)
+
 def sanitize_input(text):
     """
     Sanitizes user input to prevent SQL injection and prompt injection attacks.
@@ -121,28 +345,145 @@ def sanitize_input(text):
     text = re.sub(r"[;'\"\(\)]", " ", text)
     return text.strip()
 
+gemini_model_factory = None
+
+def create_gemini_model(name, role, config):
+    """
+    Create the Gemini model behind an agent.
+
+    Args:
+        name (str): Agent name
+        role (str): System instruction
+        config (dict): Generation config
+
+    Returns:
+        GenerativeModel: A gemini_model_factory(name, role, config) result when one is set (benchmark.py installs an offline stand-in)
+    """
+    if gemini_model_factory is not None:
+        return gemini_model_factory(name, role, config)
+    return load_gemini_sdk().GenerativeModel(
+        model_name='gemini-2.5-pro',
+        generation_config=config,
+        safety_settings=safety_settings(),
+        system_instruction=role
+    )
+
 class Agent:
     def __init__(self, name, role, custom_generation_config=None):
         self.name = name
         self.role = role
-        config = custom_generation_config or generation_config
-        self.model = genai.GenerativeModel(
-            model_name='gemini-2.5-pro',
-            generation_config=config,
-            safety_settings=safety_settings,
-            system_instruction=role
-        )
+        self.config = custom_generation_config or generation_config
+        self._model = None
+        self._model_pid = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The GenerativeModel, created when the agent is first called (once per worker process)."""
+        if self._model is None or self._model_pid != os.getpid():
+            with self._model_lock:
+                if self._model is None or self._model_pid != os.getpid():
+                    self._model_pid = os.getpid()
+                    self._model = create_gemini_model(self.name, self.role, self.config)
+        return self._model
+
+    def _call_model(self, prompt, **kwargs):
+        # Speculative calls whose result is no longer wanted stop before using quota
+        deadlines.check_cancelled(self.name)
+        deadline = deadlines.current()
+        max_wait = deadline.remaining() if deadline is not None else None
+        try:
+            with gemini_limiter.slot(result_summarizer.estimate_tokens(prompt), max_wait):
+                deadlines.check_cancelled(self.name)
+                if deadline is not None:
+                    # The SDK gives up on the HTTP call when the request's time is up
+                    kwargs["request_options"] = {"timeout": max(deadline.remaining(), 0.001)}
+                try:
+                    return self.model.generate_content(prompt, **kwargs)
+                except Exception as e:
+                    if "429" in str(e):
+                        gemini_limiter.pause(GEMINI_RATE_LIMIT_COOLDOWN)
+                    if deadline is not None and deadline.expired():
+                        raise deadlines.expired(self.name) from e
+                    raise
+        except rate_limiter.RateLimitExceeded as e:
+            if max_wait is not None and max_wait < gemini_limiter.wait_timeout:
+                raise deadlines.exceeded(
+                    f"Gemini quota not available before the request deadline ({e})", self.name, shed=True
+                ) from e
+            raise
 
     def generate_response(self, prompt):
+        """
+        Return the model's response text, sharing one upstream call among identical concurrent prompts.
+
+        Args:
+            prompt (str): Prompt sent to the model
+
+        Returns:
+            str or None: Response text, or None on error
+        """
+        try:
+            return gemini_singleflight.do(
+                (self.name, prompt), lambda: self._generate_response(prompt), deadlines.remaining()
+            )
+        except concurrent.futures.TimeoutError:
+            raise deadlines.expired(self.name)
+        except deadlines.DeadlineExceeded as e:
+            if e.deadline is deadlines.current():
+                raise
+            # The shared call ran out of another request's time; this request still has its own
+            return self._generate_response(prompt)
+        except deadlines.Cancelled:
+            if deadlines.cancelled():
+                raise
+            # Another request's speculative call was cancelled; this request still wants the answer
+            return self._generate_response(prompt)
+
+    def _generate_response(self, prompt):
         try:
-            response = hw2.api_request_with_retry(self.model.generate_content, prompt)
+            response = hw2.api_request_with_retry(self._call_model, prompt)
             if response is None:
                 return None
-            return response.text
+            text = response.text
+            self._record_usage(response, prompt, text)
+            return text
+        except (deadlines.DeadlineExceeded, deadlines.Cancelled):
+            raise
         except Exception as e:
             print(f"❌ {self.name} Error: {e}")
             return None
 
+    def generate_stream(self, prompt):
+        """
+        Yield the response text in chunks as the model produces them.
+
+        Args:
+            prompt (str): Prompt sent to the model
+
+        Yields:
+            str: Partial response text
+        """
+        try:
+            response = hw2.api_request_with_retry(self._call_model, prompt, stream=True)
+            if response is None:
+                return
+            chunks = []
+            for chunk in response:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            self._record_usage(response, prompt, "".join(chunks))
+        except deadlines.DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"❌ {self.name} Error: {e}")
+
+    def _record_usage(self, response, prompt, text):
+        input_tokens, output_tokens, estimated = hw2.usage_from_response(response, prompt, text)
+        hw2.usage_ledger.record(self.name, input_tokens, output_tokens, estimated)
+        gemini_limiter.consume(input_tokens + output_tokens - result_summarizer.estimate_tokens(prompt))
+
 sql_agent_role = """
 Role: SQL Query Generator
 Purpose: Convert natural language to valid SQLite queries and return them in JSON format.
@@ -156,7 +497,7 @@ Rules:
 7. Use ONLY the columns and table names exactly as provided
 8. If the question refers to an unknown column, respond with an error.
 
-Schema: {database_schema}
+The relevant part of the schema is given with each question.
 Expected JSON Response Format:
 {
   "sql_query": "SELECT SupplierName FROM Suppliers WHERE SupplierID = (SELECT SupplierID FROM Products ORDER BY Price DESC LIMIT 1);",
@@ -192,8 +533,7 @@ Process:
 7. Only respond to legitimate queries according to the schema
 8. If suspicious, respond with \"I can only answer questions about the database schema.\"
 
-Schema: {database_schema}
-"""
+Tables: """ + (", ".join(schema.table_names()) if schema is not None else database_schema) + "\n"
 
 def test_db_connection():
     """
@@ -206,8 +546,8 @@ def test_db_connection():
         print(f"Error: Database file not found! Please check the path: {DB_PATH}")
         return
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.close()
+        with db_connection_pool.connection() as conn:
+            conn.execute("SELECT 1").fetchone()
     except Exception as e:
         print(f"Error occurred while connecting to the database: {e}")
 
@@ -267,10 +607,93 @@ def execute_sql_query(sql_query):
         sql_query = enforce_sqlite_syntax(sql_query)
         if not validate_sql_query(sql_query):
             return None, "❌ Security Error: Only SELECT queries are allowed."
-        conn = sqlite3.connect(DB_PATH)
+        db_version = database_version()
+        if AGGREGATE_REWRITE and aggregates_ready():
+            rewritten = summary_tables.rewrite(sql_query)
+            if rewritten:
+                print(f"🧮 Rewritten to summary table: {rewritten}")
+                metrics.annotate("aggregate_rewrite", True)
+                sql_query = rewritten
+        cached = result_cache.get(sql_query, db_version)
+        metrics.record_cache("result", "miss" if cached is None else "hit")
+        if cached is not None:
+            results, column_names, csv_path = cached
+            print("⚡ Result Cache Hit")
+            if csv_path:
+                LAST_CSV_PATH = csv_path
+            if not results:
+                return None, "⚠ The answer could not be found!"
+            try:
+                shared_version = query_cache.portable_version(db_version)
+                result_store.note_handle(
+                    result_handles.find(sql_query, shared_version)
+                    or result_handles.register_rows(
+                        sql_query, shared_version, column_names, results,
+                        getattr(results, "total_rows", len(results)), getattr(results, "capped", False), csv_path,
+                    ),
+                    results,
+                )
+            except Exception as e:
+                print(f"⚠ Result handle could not be created: {e}")
+            return results, column_names
+        if aggregates_ready() and re.search(rf"\b{summary_tables.schema_name}\.", sql_query, re.IGNORECASE):
+            refresh_aggregates(db_version)
+        spill = result_handles.writer()
+        try:
+            if shard_router is not None:
+                return run_on_shards(sql_query, db_version, spill)
+            return run_and_export(sql_query, db_version, spill)
+        finally:
+            if not spill.registered:
+                spill.discard()
+    except deadlines.DeadlineExceeded:
+        raise
+    except Exception as e:
+        return None, f"❌ Database error: {e}"
+
+def run_and_export(sql_query, db_version, spill):
+    """
+    Execute a validated query on a pooled connection, export it and register its result handle.
+
+    Args:
+        sql_query (str): Validated SELECT query
+        db_version (tuple): Database version token
+        spill (result_store.SpillWriter): Receives every exported row
+
+    Returns:
+        tuple: (results, column_names) or (None, error_message)
+    """
+    with db_connection_pool.connection() as conn:
         cursor = conn.cursor()
         try:
-            cursor.execute(sql_query)
+            with metrics.stage("query_plan"):
+                plan = sql_governor.check_plan(conn, sql_query, db_version)
+            for warning in plan.warnings:
+                print(f"⚠ Query plan: {warning}")
+            if not plan.allowed:
+                metrics.annotate("governor", "rejected")
+                return None, f"❌ Query rejected: {plan.reason}. Please ask a more specific question."
+            execution_started = time.perf_counter()
+            with sql_governor.budget(conn):
+                with metrics.stage("sqlite_execute"):
+                    cursor.execute(sql_query)
+                with metrics.stage("csv_export"):
+                    results, column_names = csv_export.export_cursor(
+                        cursor,
+                        new_csv_path(),
+                        chunk_size=CSV_CHUNK_SIZE,
+                        compress=CSV_COMPRESSION,
+                        max_rows_in_memory=MAX_RESULT_ROWS_IN_MEMORY,
+                        max_rows=MAX_RESULT_ROWS or None,
+                        sink=spill.write,
+                    )
+            try:
+                query_index_advisor.record(conn, sql_query, plan.plan, time.perf_counter() - execution_started)
+            except Exception as e:
+                print(f"⚠ Index advisor could not record the query: {e}")
+        except query_governor.QueryInterrupted as e:
+            metrics.annotate("governor", "interrupted")
+            return None, f"❌ Query stopped: {e}. Please ask a more specific question."
         except sqlite3.OperationalError as e:
             msg = str(e).lower()
             if "syntax error" in msg:
@@ -280,62 +703,424 @@ def execute_sql_query(sql_query):
             if "no such column" in msg:
                 return None, "❌ Column Error: The column name might be incorrect!"
             return None, f"❌ Database error: {e}"
-        results = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description] if results else []
-        if results and column_names:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            csv_filename = f"query_{timestamp}.csv"
-            csv_path = os.path.join(CSV_FOLDER, csv_filename)
-            df = pd.DataFrame(results, columns=column_names)
-            df.to_csv(csv_path, index=False)
-            LAST_CSV_PATH = csv_path
-        conn.close()
+        finally:
+            cursor.close()
+    return finish_export(sql_query, db_version, spill, results, column_names)
+
+def run_on_shards(sql_query, db_version, spill):
+    """
+    Execute a validated query across the shards, export the merged rows and register its result handle.
+
+    Args:
+        sql_query (str): Validated SELECT query
+        db_version (tuple): Version token over every shard
+        spill (result_store.SpillWriter): Receives every exported row
+
+    Returns:
+        tuple: (results, column_names) or (None, error_message)
+    """
+    cursor = None
+    try:
+        with metrics.stage("sqlite_execute"):
+            cursor = shard_router.execute(sql_query, db_version)
+        with metrics.stage("csv_export"):
+            results, column_names = csv_export.export_cursor(
+                cursor,
+                new_csv_path(),
+                chunk_size=CSV_CHUNK_SIZE,
+                compress=CSV_COMPRESSION,
+                max_rows_in_memory=MAX_RESULT_ROWS_IN_MEMORY,
+                max_rows=MAX_RESULT_ROWS or None,
+                sink=spill.write,
+            )
+    except shards.QueryRejected as e:
+        metrics.annotate("governor", "rejected")
+        return None, f"❌ Query rejected: {e}. Please ask a more specific question."
+    except query_governor.QueryInterrupted as e:
+        metrics.annotate("governor", "interrupted")
+        return None, f"❌ Query stopped: {e}. Please ask a more specific question."
+    except sqlite3.OperationalError as e:
+        msg = str(e).lower()
+        if "syntax error" in msg:
+            return None, "❌ SQL Syntax Error: The query is invalid! Please try again."
+        if "no such table" in msg:
+            return None, "❌ Table Error: No such table exists!"
+        if "no such column" in msg:
+            return None, "❌ Column Error: The column name might be incorrect!"
+        return None, f"❌ Database error: {e}"
+    finally:
+        # Stops shard queries still running when the export hit MAX_RESULT_ROWS
+        if cursor is not None:
+            cursor.close()
+    return finish_export(sql_query, db_version, spill, results, column_names)
+
+def finish_export(sql_query, db_version, spill, results, column_names):
+    """
+    Cache an exported result, record its metrics and register its result handle.
+
+    Args:
+        sql_query (str): Executed SELECT query
+        db_version (tuple): Database version token
+        spill (result_store.SpillWriter): Writer that received the exported rows
+        results (csv_export.ResultRows): Rows kept in memory
+        column_names (list): Result column names
+
+    Returns:
+        tuple: (results, column_names) or (None, error_message)
+    """
+    global LAST_CSV_PATH
+    csv_path = results.csv_path
+    if csv_path:
+        LAST_CSV_PATH = csv_path
+    result_bytes = result_cache.put(sql_query, db_version, results, column_names, csv_path)
+    metrics.registry.observe("chatbot_result_rows", results.total_rows, buckets=metrics.ROW_BUCKETS)
+    metrics.registry.observe("chatbot_result_bytes", result_bytes, buckets=metrics.BYTE_BUCKETS)
+    metrics.annotate("rows", results.total_rows)
+    metrics.annotate("result_bytes", result_bytes)
+    if results.capped:
+        metrics.annotate("governor", "capped")
+    if not results:
+        return None, "⚠ The answer could not be found!"
+    try:
+        result_store.note_handle(
+            result_handles.register(
+                spill, sql_query, query_cache.portable_version(db_version), column_names,
+                results.total_rows, results.capped, csv_path,
+            ),
+            results,
+        )
+    except Exception as e:
+        print(f"⚠ Result handle could not be created: {e}")
+    return results, column_names
+
+def new_csv_path():
+    """Return a fresh path for a CSV export, creating the export folder on first use."""
+    os.makedirs(CSV_FOLDER, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(CSV_FOLDER, f"query_{timestamp}.csv")
+
+def plan_followup(sanitized_input):
+    """
+    Turn a refinement of the session's previous answer into SQL without asking an agent.
+
+    Args:
+        sanitized_input (str): Sanitized user question
+
+    Returns:
+        followup.FollowupPlan or None: None if there is no previous answer or the question is not a refinement
+    """
+    if not FOLLOWUPS_ENABLED:
+        return None
+    state = conversation_sessions.get(hw2.current_session.get())
+    if state is None:
+        return None
+    refinement = followup.parse_followup(sanitized_input, state.column_names, state.rows or [])
+    if refinement is None:
+        return None
+    local = state.rows is not None and state.version == database_version()
+    print(f"↪ Follow-up on the previous result: {refinement.describe()}")
+    return followup.FollowupPlan(
+        sql_query=refinement.to_sql(state.sql_query),
+        local_sql=refinement.to_sql(followup.LOCAL_TABLE) if local else None,
+        question=f"{state.question} ({refinement.describe()})",
+        state=state,
+    )
+
+def execute_followup(plan):
+    """
+    Run a follow-up on the cached rows of the previous answer, or as a subquery when they are not available.
+
+    Args:
+        plan (followup.FollowupPlan): Plan from plan_followup()
+
+    Returns:
+        tuple: (results, column_names) or (None, error_message)
+    """
+    if plan.local_sql is not None:
+        try:
+            results = run_followup_locally(plan)
+            conversation_sessions.record_followup("local")
+            return results
+        except deadlines.DeadlineExceeded:
+            raise
+        except Exception as e:
+            print(f"⚠ Follow-up could not run on the cached rows, re-querying: {e}")
+    conversation_sessions.record_followup("subquery")
+    return execute_sql_query(plan.sql_query)
+
+def run_followup_locally(plan):
+    """
+    Apply a follow-up to an in-memory SQLite copy of the previous rows and export it like a database result.
+
+    Returns:
+        tuple: (results, column_names) or (None, error_message)
+    """
+    global LAST_CSV_PATH
+    sql_query = enforce_sqlite_syntax(plan.sql_query)
+    if not validate_sql_query(sql_query):
+        return None, "❌ Security Error: Only SELECT queries are allowed."
+    state = plan.state
+    conn = sqlite3.connect(":memory:")
+    spill = result_handles.writer()
+    try:
+        followup.load_rows(conn, state.column_names, state.rows)
+        cursor = conn.execute(plan.local_sql)
+        with metrics.stage("csv_export"):
+            results, column_names = csv_export.export_cursor(
+                cursor,
+                new_csv_path(),
+                chunk_size=CSV_CHUNK_SIZE,
+                compress=CSV_COMPRESSION,
+                max_rows_in_memory=MAX_RESULT_ROWS_IN_MEMORY,
+                sink=spill.write,
+            )
+        if results.csv_path:
+            LAST_CSV_PATH = results.csv_path
+        result_cache.put(sql_query, state.version, results, column_names, results.csv_path)
+        metrics.annotate("followup", "local")
         if not results:
             return None, "⚠ The answer could not be found!"
+        result_store.note_handle(
+            result_handles.register(
+                spill, sql_query, query_cache.portable_version(state.version), column_names,
+                results.total_rows, results.capped, results.csv_path,
+            ),
+            results,
+        )
         return results, column_names
-    except Exception as e:
-        return None, f"❌ Database error: {e}"
+    finally:
+        conn.close()
+        if not spill.registered:
+            spill.discard()
 
-def convert_results_to_json(sql_results, column_names):
+def remember_answer(question, sql_query, results, column_names):
     """
-    Convert SQL query results into a JSON-formatted string.
+    Keep the latest answer of the current session so that follow-ups can refine it.
+
+    The answer's result id is also recorded in the shared result store, so
+    any worker process can find the session's CSV.
 
     Args:
-        sql_results (list): Query result tuples
-        column_names (list): List of column names
+        question (str): Question that was answered
+        sql_query (str): SQL that produced the result
+        results (list): Result rows (ResultRows)
+        column_names (list): Result column names
+    """
+    session_id = hw2.current_session.get()
+    if session_id is None:
+        return
+    handle = result_store.latest_handle()
+    if handle is not None:
+        result_handles.remember_session(session_id, handle)
+    if not FOLLOWUPS_ENABLED or not results:
+        return
+    complete = getattr(results, "total_rows", len(results)) == len(results)
+    conversation_sessions.remember(session_id, session_state.SessionState(
+        question,
+        query_cache.canonicalize_sql(sql_query),
+        column_names,
+        results if complete else None,
+        getattr(results, "csv_path", None),
+        handle,
+        database_version(),
+    ))
+
+def fetch_result_rows(sql_query, offset, limit):
+    """
+    Re-run a stored query for a range of its rows (used for rows that were not spilled).
+
+    Args:
+        sql_query (str): Query that produced the result
+        offset (int): Zero-based position of the first row
+        limit (int): Number of rows
+
+    Returns:
+        list: Row tuples
+    """
+    if shard_router is not None:
+        cursor = shard_router.execute(
+            f"SELECT * FROM ({sql_query.rstrip().rstrip(';')}) LIMIT {int(limit)} OFFSET {int(offset)}",
+            database_version(),
+        )
+        try:
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    with db_connection_pool.connection() as conn, sql_governor.budget(conn):
+        return conn.execute(
+            f"SELECT * FROM ({sql_query.rstrip().rstrip(';')}) LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+
+def result_data(result_id, limit, rows=None):
+    """
+    Read the first rows of a stored result for a structured (columnar) response.
+
+    Args:
+        result_id (str): Result handle
+        limit (int): Rows wanted (capped at RESULT_DATA_MAX_ROWS)
+        rows (list or None): Rows of the result still in this process's memory, used before the result store
+
+    Returns:
+        dict or None: result_id, columns, rows, total_rows, capped and truncated; None if the handle is unknown
+
+    Raises:
+        ValueError: If rows that were not spilled can no longer be reproduced
+    """
+    limit = max(0, min(int(limit), RESULT_DATA_MAX_ROWS))
+    meta = result_handles.describe(result_id)
+    if meta is None:
+        return None
+    wanted = min(limit, meta["total_rows"])
+    data = list(rows[:wanted]) if rows else []
+    if len(data) < wanted:
+        rest = result_handles.read(
+            result_id, len(data), wanted - len(data), rerun=fetch_result_rows,
+            version=query_cache.portable_version(database_version()),
+        )
+        if rest is None:
+            return None
+        data.extend(rest["rows"])
+    return {
+        "result_id": result_id,
+        "columns": meta["columns"],
+        "rows": data,
+        "total_rows": meta["total_rows"],
+        "capped": meta["capped"],
+        "truncated": len(data) < meta["total_rows"],
+    }
+
+def truncation_note(results):
+    """
+    Return the notice appended to answers whose result hit the MAX_RESULT_ROWS cap.
+
+    Args:
+        results (list): Query results returned by execute_sql_query
 
     Returns:
-        str: JSON-formatted query results
+        str: Notice text, or "" when the result is complete
     """
+    if not getattr(results, "capped", False):
+        return ""
+    return f"\n\n⚠ The result was truncated after {results.total_rows:,} rows; the answer and CSV cover only those rows."
+
+def switch_database(db_path, record=True):
+    """
+    Point the connection pool, version watcher, caches and schema catalog at another database file.
+
+    Args:
+        db_path (str): Path to the SQLite database to serve from
+        record (bool): Record the switch so the other worker processes follow it
+    """
+    global DB_PATH, schema, database_schema
+    DB_PATH = db_path
+    if record and served_database is not None:
+        served_database.record(db_path)
+    db_connection_pool.switch_database(db_path)
+    db_version_watcher.switch(db_path)
+    result_cache.clear()
+    catalog = load_schema_catalog(db_path)
+    if catalog is not None:
+        schema = catalog
+        database_schema = catalog.describe()
+    print(f"🔀 Serving queries from {db_path}")
+
+def database_version():
+    """
+    Return the version token of the served database.
+
+    A database switch recorded by another worker process is applied first,
+    so every worker queries the same file.
+
+    Returns:
+        tuple: Version token (see query_cache.DatabaseVersionWatcher.token)
+    """
+    if served_database is not None:
+        db_path = served_database.changed()
+        if db_path and os.path.exists(db_path):
+            with served_database_lock:
+                switch_database(db_path, record=False)
+    return db_version_watcher.token()
+
+def refresh_aggregates(version=None):
+    """
+    Bring the summary tables up to date and attach them to query connections.
+
+    Args:
+        version (tuple or None): Database version token (read from the watcher if omitted)
+
+    Returns:
+        str or None: Refresh outcome, or None if the tables are disabled or the refresh failed
+    """
+    if summary_tables is None or not DB_PATH or not os.path.exists(DB_PATH):
+        return None
     try:
-        json_data = []
-        for row in sql_results:
-            row_dict = {col: row[i] for i, col in enumerate(column_names)}
-            json_data.append(row_dict)
-        return json.dumps(json_data, indent=2, ensure_ascii=False)
+        with metrics.stage("aggregate_refresh"):
+            outcome = summary_tables.refresh(DB_PATH, version or db_version_watcher.token())
+        summary_tables.last_error = None
+        if outcome != "fresh":
+            print(f"🧮 Summary tables {outcome}: {summary_tables.path}")
+        db_connection_pool.attach(summary_tables.schema_name, summary_tables.path)
+        return outcome
     except Exception as e:
-        return json.dumps({"error": str(e)}, indent=4)
+        summary_tables.last_error = str(e)
+        print(f"⚠ Summary tables could not be refreshed: {e}")
+        return None
 
-def calculate_gemini_cost(input_tokens, output_tokens):
+def build_indexed_database(limit=10, switch=True, target_path=None):
     """
-    Estimate the cost for Gemini API usage based on token counts.
+    Build the index advisor's proposals into a read-optimized copy of the database.
 
     Args:
-        input_tokens (int): Number of input tokens
-        output_tokens (int): Number of output tokens
+        limit (int): Maximum number of indexes to create
+        switch (bool): Serve queries from the new copy once it is built
+        target_path (str or None): Output path (defaults to OPTIMIZED_DB_PATH)
 
     Returns:
-        float: Estimated cost in USD
+        dict: Build report with before/after timings, or an error
     """
-    if input_tokens <= 128_000:
-        input_cost = (input_tokens / 1_000_000) * 0.075
-    else:
-        input_cost = (input_tokens / 1_000_000) * 0.15
-    if output_tokens <= 128_000:
-        output_cost = (output_tokens / 1_000_000) * 0.30
-    else:
-        output_cost = (output_tokens / 1_000_000) * 0.60
-    return input_cost + output_cost
+    target_path = target_path or OPTIMIZED_DB_PATH
+    if shard_router is not None:
+        return {"error": "Index builds are not available while serving from shards."}
+    if not index_build_lock.acquire(blocking=False):
+        return {"error": "An index build is already running."}
+    try:
+        proposals = query_index_advisor.propose(limit)
+        if not proposals:
+            return {"error": "No index proposals yet; run some queries first."}
+        if os.path.abspath(target_path) == os.path.abspath(DB_PATH):
+            return {"error": "The optimized database must not replace the one being served."}
+        report = index_advisor.build_optimized_database(
+            DB_PATH, target_path, proposals, query_index_advisor.hot_queries(limit)
+        )
+        if switch:
+            switch_database(target_path)
+        report["switched"] = switch
+        return report
+    finally:
+        index_build_lock.release()
+
+def convert_results_to_json(sql_results, column_names, token_budget=None):
+    """
+    Convert SQL query results into a compact JSON string that fits the NL token budget.
+
+    Args:
+        sql_results (list): Query result tuples
+        column_names (list): List of column names
+        token_budget (int or None): Maximum estimated tokens (defaults to NL_TOKEN_BUDGET)
+
+    Returns:
+        str: JSON-formatted (possibly summarized) query results
+    """
+    try:
+        return result_summarizer.summarize_results(
+            sql_results,
+            column_names,
+            token_budget or NL_TOKEN_BUDGET,
+            total_rows=getattr(sql_results, "total_rows", None),
+            capped=getattr(sql_results, "capped", False),
+        )
+    except Exception as e:
+        return json.dumps({"error": str(e)}, indent=4)
 
 sql_agent = Agent("SQL Agent", sql_agent_role, sql_generation_config)
 nl_agent = Agent("NL Agent", nl_agent_role)
@@ -352,7 +1137,14 @@ def convert_text_to_sql(user_input):
         tuple: (sql_query, error_message)
     """
     try:
-        sql_task = f"Convert this question to SQL: {user_input}"
+        prompt_schema = database_schema + (summary_tables.describe() if aggregates_ready() else "")
+        cache_key = sql_cache.make_key(user_input, prompt_schema)
+        cached_query = sql_cache.get(cache_key)
+        metrics.record_cache("sql", "hit" if cached_query else "miss")
+        if cached_query:
+            print("\n⚡ SQL Cache Hit:\n", cached_query)
+            return cached_query, None
+        sql_task = f"Schema:{schema_for_question(user_input)}\nConvert this question to SQL: {user_input}"
         json_response = sql_agent.generate_response(sql_task)
         if json_response is None:
             return None, "❌ SQL Agent Error: Could not generate SQL query."
@@ -365,86 +1157,452 @@ def convert_text_to_sql(user_input):
             print("\n🎯 SQL Agent Generated Query:\n", sql_query)
             if explanation:
                 print(f"📝 Explanation: {explanation}\n")
+            if validate_sql_query(enforce_sqlite_syntax(sql_query)):
+                sql_cache.put(cache_key, sql_query)
             return sql_query, None
         except json.JSONDecodeError as e:
             print(f"⚠ JSON Parse Error: {e}")
             print(f"Raw Response: {json_response}")
             return None, "❌ SQL Agent Error: Invalid JSON response."
+    except (deadlines.DeadlineExceeded, deadlines.Cancelled):
+        raise
     except Exception as e:
         return None, f"❌ SQL Agent error: {e}"
 
-def convert_json_to_natural_language(json_data, original_query):
+def build_nl_task(json_data, original_query):
     """
-    Convert JSON data into a natural language response.
+    Build the NL Agent prompt for a query result.
 
     Args:
         json_data (str): JSON string of query results
         original_query (str): The original user question
 
     Returns:
-        str: Natural language response
+        str: Prompt for the NL Agent
     """
-    try:
-        nl_task = f"""
+    return f"""
 Natural Language Agent Task:
 - Original user question: "{original_query}"
 - Database query results (JSON): {json_data}
 
 Please convert these JSON results into a natural language response that answers the user's question.
+If the results are a summary, answer from the statistics and sample rows without inventing rows.
+If the results are marked as truncated, say that the answer only covers part of the data.
 """
-        natural_language_response = nl_agent.generate_response(nl_task)
+
+def convert_json_to_natural_language(json_data, original_query):
+    """
+    Convert JSON data into a natural language response.
+
+    Args:
+        json_data (str): JSON string of query results
+        original_query (str): The original user question
+
+    Returns:
+        str: Natural language response
+    """
+    try:
+        natural_language_response = nl_agent.generate_response(build_nl_task(json_data, original_query))
         if natural_language_response is None:
             return "❌ Natural Language Agent Error: Could not generate a response."
         return natural_language_response
+    except deadlines.DeadlineExceeded:
+        raise
     except Exception as e:
         return f"❌ Natural Language Agent error: {e}"
 
-def get_last_csv_file():
+def get_last_csv_file(session_id=None):
     """
     Return the path to the most recent CSV file or None if none exist.
 
+    The CSV of the session's last answer is preferred. It is looked up in
+    the shared result store first, so it is found whichever worker process
+    answered. LAST_CSV_PATH (the last CSV written by this process) is only
+    used without a session and with a single worker process, where it
+    cannot belong to another user's request served by a different worker.
+
+    Args:
+        session_id (str or None): Session to look up (defaults to the current session scope)
+
     Returns:
         str or None
     """
-    global LAST_CSV_PATH
-    if LAST_CSV_PATH and os.path.exists(LAST_CSV_PATH):
+    session_id = session_id if session_id is not None else hw2.current_session.get()
+    if session_id is not None:
+        result_id = result_handles.session_handle(session_id)
+        csv_path = result_handles.csv_path(result_id) if result_id else None
+        if csv_path is None:
+            state = conversation_sessions.get(session_id)
+            csv_path = state.csv_path if state is not None else None
+        return csv_path if csv_path and os.path.exists(csv_path) else None
+    if SERVICE_WORKERS <= 1 and LAST_CSV_PATH and os.path.exists(LAST_CSV_PATH):
         return LAST_CSV_PATH
     return None
 
-def chatbot(input_text):
+def check_input(input_text):
     """
-    Orchestrate the query process and return the final response.
+    Sanitize the user input and reject it early when it cannot be answered.
 
     Args:
         input_text (str): The user's input message
 
     Returns:
-        str: The chatbot's response
+        tuple: (sanitized_input, early_response); early_response is None when the pipeline should continue
     """
     if input_text.lower() == "exit":
         os._exit(0)
     sanitized_input = sanitize_input(input_text)
     if sanitized_input is None:
-        return "⚠ Your query contains potentially harmful content. Please rephrase."
+        return None, "⚠ Your query contains potentially harmful content. Please rephrase."
     if len(sanitized_input) > 500:
-        return "⚠ Your query is too long. Please keep it under 500 characters."
-    orchestrator_response = orchestrator.generate_response(sanitized_input)
-    if orchestrator_response and ("no knowledge" in orchestrator_response or "only answer" in orchestrator_response):
-        return orchestrator_response
-    sql_query, error = convert_text_to_sql(sanitized_input)
-    if error:
-        return f"❌ {error}"
+        return None, "⚠ Your query is too long. Please keep it under 500 characters."
+    return sanitized_input, None
+
+def is_orchestrator_rejection(orchestrator_response):
+    """Return True when the Orchestrator declined to answer the question."""
+    return bool(orchestrator_response) and (
+        "no knowledge" in orchestrator_response or "only answer" in orchestrator_response
+    )
+
+PIPELINE_STAGES = ("sql_generation", "sql_execution", "result_summary", "nl_generation")
+
+def ensure_time_for(stage):
+    """
+    Abandon the request when its deadline passed or the stages still to run usually take longer than the time left.
+
+    Args:
+        stage (str): Pipeline stage about to start (the Orchestrator runs alongside SQL generation)
+
+    Raises:
+        deadlines.DeadlineExceeded: If the request should be abandoned
+    """
+    start = PIPELINE_STAGES.index("sql_generation" if stage == "orchestrator" else stage)
+    deadlines.check(stage, stage_estimates.expected(*PIPELINE_STAGES[start:]) * DEADLINE_SHED_FACTOR)
+
+def request_scope(timeout=None):
+    """
+    Deadline scope of one request.
+
+    Args:
+        timeout (float or None): Seconds left of the caller's deadline; REQUEST_TIMEOUT_SECONDS (0 = none) if None
+    """
+    return deadlines.scope(timeout if timeout is not None else (REQUEST_TIMEOUT_SECONDS or None))
+
+def chatbot(input_text):
+    """
+    Orchestrate the query process and return the final response.
+
+    Args:
+        input_text (str): The user's input message
+
+    Returns:
+        str: The chatbot's response
+    """
+    # remember_answer() records the session's result id from the collected handles
+    with result_store.collect_handles():
+        return _chatbot(input_text)
+
+def _chatbot(input_text):
+    with metrics.stage("sanitize"):
+        sanitized_input, early_response = check_input(input_text)
+    if early_response:
+        return early_response
+    question = sanitized_input
+    plan = plan_followup(sanitized_input)
+    if plan is not None:
+        sql_query, question = plan.sql_query, plan.question
+    else:
+        with metrics.stage("intent_gate"):
+            gate_decision = question_gate.classify(sanitized_input) if INTENT_GATE_ENABLED else None
+        if gate_decision and gate_decision.label == intent_gate.OFF_TOPIC:
+            return OFF_TOPIC_RESPONSE
+        if gate_decision is None or gate_decision.label == intent_gate.UNCERTAIN:
+            ensure_time_for("orchestrator")
+            with metrics.stage("orchestrator"):
+                orchestrator_response = orchestrator.generate_response(sanitized_input)
+            if is_orchestrator_rejection(orchestrator_response):
+                return orchestrator_response
+        ensure_time_for("sql_generation")
+        with metrics.stage("sql_generation"):
+            sql_query, error = convert_text_to_sql(sanitized_input)
+        if error:
+            return f"❌ {error}"
     if sql_query:
-        results, column_names = execute_sql_query(sql_query)
+        ensure_time_for("sql_execution")
+        with metrics.stage("sql_execution"):
+            results, column_names = execute_followup(plan) if plan else execute_sql_query(sql_query)
         if isinstance(column_names, str):
             return f"❌ {column_names}"
         if results:
-            json_output = convert_results_to_json(results, column_names)
-            natural_language_response = convert_json_to_natural_language(json_output, sanitized_input)
-            return natural_language_response
+            remember_answer(question, sql_query, results, column_names)
+            with metrics.stage("result_summary"):
+                json_output = convert_results_to_json(results, column_names)
+            ensure_time_for("nl_generation")
+            with metrics.stage("nl_generation"):
+                natural_language_response = convert_json_to_natural_language(json_output, question)
+            return natural_language_response + truncation_note(results)
         return "⚠ The answer could not be found!"
     return "❌ SQL Agent could not generate a query."
 
+def timed_stage(stage, func, *args):
+    """Call func(*args) inside a metrics stage; used for work handed to worker threads."""
+    with metrics.stage(stage):
+        return func(*args)
+
+async def chatbot_async(input_text, timings=None, limits=None, use_session=True):
+    """
+    Asynchronous version of chatbot() that overlaps the Orchestrator and SQL generation.
+
+    When the Orchestrator has to be asked, SQL generation starts speculatively
+    at the same time; its result is discarded if the Orchestrator rejects the
+    question or fails. A Gemini call already in flight cannot be interrupted
+    and runs to completion, but no further call (or retry) of the abandoned
+    SQL generation takes a rate-limiter slot. Blocking agent and database
+    calls run in the default thread executor so the event loop stays free.
+
+    Args:
+        input_text (str): The user's input message
+        timings (dict or None): Filled with {stage: (start, end)} offsets in seconds
+        limits (dict or None): {stage: asyncio.Semaphore} bounding concurrent stages across requests
+        use_session (bool): Answer follow-ups from and remember the answer in the session's state
+
+    Returns:
+        str: The chatbot's response
+    """
+    timings = {} if timings is None else timings
+    limits = limits or {}
+    started = time.perf_counter()
+
+    async def run_stage(stage, func, *args):
+        limit = limits.get(stage)
+        if limit is not None:
+            await limit.acquire()
+        stage_start = time.perf_counter() - started
+        try:
+            ensure_time_for(stage)
+            return await asyncio.to_thread(timed_stage, stage, func, *args)
+        finally:
+            timings[stage] = (round(stage_start, 4), round(time.perf_counter() - started, 4))
+            if limit is not None:
+                limit.release()
+
+    with metrics.stage("sanitize"):
+        sanitized_input, early_response = check_input(input_text)
+    if early_response:
+        return early_response
+    question = sanitized_input
+    plan = plan_followup(sanitized_input) if use_session else None
+    if plan is not None:
+        sql_query, question = plan.sql_query, plan.question
+    else:
+        with metrics.stage("intent_gate"):
+            gate_decision = question_gate.classify(sanitized_input) if INTENT_GATE_ENABLED else None
+        if gate_decision and gate_decision.label == intent_gate.OFF_TOPIC:
+            return OFF_TOPIC_RESPONSE
+        with deadlines.cancellable() as sql_cancel:
+            sql_task = asyncio.create_task(run_stage("sql_generation", convert_text_to_sql, sanitized_input))
+        if gate_decision is None or gate_decision.label == intent_gate.UNCERTAIN:
+            try:
+                orchestrator_response = await run_stage("orchestrator", orchestrator.generate_response, sanitized_input)
+            except BaseException:
+                sql_cancel.set()
+                sql_task.cancel()
+                raise
+            if is_orchestrator_rejection(orchestrator_response):
+                # The worker thread cannot be interrupted: a Gemini call in flight finishes, later ones are skipped
+                sql_cancel.set()
+                sql_task.cancel()
+                print("🛑 Speculative SQL generation discarded")
+                return orchestrator_response
+        sql_query, error = await sql_task
+        if error:
+            return f"❌ {error}"
+    if sql_query:
+        if plan is not None:
+            results, column_names = await run_stage("sql_execution", execute_followup, plan)
+        else:
+            results, column_names = await run_stage("sql_execution", execute_sql_query, sql_query)
+        if isinstance(column_names, str):
+            return f"❌ {column_names}"
+        if results:
+            if use_session:
+                remember_answer(question, sql_query, results, column_names)
+            json_output = await run_stage("result_summary", convert_results_to_json, results, column_names)
+            natural_language_response = await run_stage("nl_generation", convert_json_to_natural_language, json_output, question)
+            return natural_language_response + truncation_note(results)
+        return "⚠ The answer could not be found!"
+    return "❌ SQL Agent could not generate a query."
+
+async def chatbot_batch(questions, session_id=None, max_concurrency=None):
+    """
+    Answer a batch of questions with bounded parallelism, yielding items as they complete.
+
+    Questions that normalize to the same text are answered once. At most
+    max_concurrency questions are in flight; each agent stage is further
+    bounded by GEMINI_MAX_CONCURRENCY and query execution by DB_POOL_SIZE, so
+    a large batch cannot flood the Gemini wait queue or the connection pool.
+
+    Args:
+        questions (list): Question strings
+        session_id (str or None): Session charged for the token usage
+        max_concurrency (int or None): Questions processed at once (defaults to BATCH_MAX_CONCURRENCY)
+
+    Yields:
+        dict: index, question, response, error, timings, seconds, result_id and duplicate_of
+    """
+    max_concurrency = max(1, max_concurrency or BATCH_MAX_CONCURRENCY)
+    agent_limit = min(max_concurrency, GEMINI_MAX_CONCURRENCY)
+    limits = {stage: asyncio.Semaphore(agent_limit) for stage in ("orchestrator", "sql_generation", "nl_generation")}
+    limits["sql_execution"] = asyncio.Semaphore(min(max_concurrency, DB_POOL_SIZE))
+    in_flight = asyncio.Semaphore(max_concurrency)
+    groups = {}
+    for index, question in enumerate(questions):
+        groups.setdefault(query_cache.normalize_question(str(question)), []).append(index)
+
+    async def answer(indexes):
+        first = indexes[0]
+        timings = {}
+        async with in_flight:
+            started = time.perf_counter()
+            try:
+                with hw2.session_scope(session_id), metrics.trace_request("chat_batch", SLOW_REQUEST_SECONDS, SLOW_REQUEST_SAMPLE_RATE), \
+                        result_store.collect_handles() as handles:
+                    # Batch questions are independent of each other and of the session's conversation
+                    response = await chatbot_async(str(questions[first]), timings, limits, use_session=False)
+                error = response if response.startswith("❌") else None
+            except Exception as e:
+                response, error = None, str(e)
+            seconds = round(time.perf_counter() - started, 4)
+        return [
+            {
+                "index": index,
+                "question": questions[index],
+                "response": response,
+                "error": error,
+                "timings": timings,
+                "seconds": seconds,
+                "result_id": handles[-1] if handles else None,
+                "duplicate_of": None if index == first else first,
+            }
+            for index in indexes
+        ]
+
+    tasks = [asyncio.create_task(answer(indexes)) for indexes in groups.values()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            for item in await finished:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+speculative_executor = None
+speculative_executor_pid = None
+speculative_executor_lock = threading.Lock()
+
+def speculative_pool():
+    """Return the thread pool that generates SQL while the Orchestrator runs (one per worker process)."""
+    global speculative_executor, speculative_executor_pid
+    with speculative_executor_lock:
+        if speculative_executor is None or speculative_executor_pid != os.getpid():
+            # Threads do not survive a fork, so a forked worker needs its own pool
+            speculative_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="speculative-sql")
+            speculative_executor_pid = os.getpid()
+        return speculative_executor
+
+def chatbot_events(input_text):
+    """
+    Run the query pipeline and yield progress events followed by the streamed answer.
+
+    Events are (name, data) pairs: "gate" once the question is accepted,
+    "sql" with the generated query, "rows" with the row count, "csv" when
+    the export is ready, "token" for each chunk of the NL answer and
+    finally "done" with the complete response.
+
+    Args:
+        input_text (str): The user's input message
+
+    Yields:
+        tuple: (event_name, data_dict)
+    """
+    with metrics.stage("sanitize"):
+        sanitized_input, early_response = check_input(input_text)
+    if early_response:
+        yield "done", {"response": early_response}
+        return
+    question = sanitized_input
+    plan = plan_followup(sanitized_input)
+    if plan is not None:
+        yield "gate", {"passed": True, "local": True, "followup": True}
+        sql_query = plan.sql_query
+        question = plan.question
+    else:
+        with metrics.stage("intent_gate"):
+            gate_decision = question_gate.classify(sanitized_input) if INTENT_GATE_ENABLED else None
+        if gate_decision and gate_decision.label == intent_gate.OFF_TOPIC:
+            yield "done", {"response": OFF_TOPIC_RESPONSE}
+            return
+        ensure_time_for("sql_generation")
+        with deadlines.cancellable() as sql_cancel:
+            sql_future = speculative_pool().submit(
+                contextvars.copy_context().run, timed_stage, "sql_generation", convert_text_to_sql, sanitized_input
+            )
+        try:
+            if gate_decision is None or gate_decision.label == intent_gate.UNCERTAIN:
+                with metrics.stage("orchestrator"):
+                    orchestrator_response = orchestrator.generate_response(sanitized_input)
+                if is_orchestrator_rejection(orchestrator_response):
+                    yield "done", {"response": orchestrator_response}
+                    return
+            yield "gate", {"passed": True, "local": bool(gate_decision and gate_decision.label == intent_gate.ON_TOPIC)}
+            sql_query, error = sql_future.result()
+        finally:
+            # Drops the speculative SQL Agent call if the orchestrator failed, rejected or the client left
+            sql_cancel.set()
+            sql_future.cancel()
+        if error:
+            yield "done", {"response": f"❌ {error}"}
+            return
+        if not sql_query:
+            yield "done", {"response": "❌ SQL Agent could not generate a query."}
+            return
+    yield "sql", {"sql_query": sql_query}
+    ensure_time_for("sql_execution")
+    with metrics.stage("sql_execution"):
+        results, column_names = execute_followup(plan) if plan else execute_sql_query(sql_query)
+    if isinstance(column_names, str):
+        yield "done", {"response": f"❌ {column_names}"}
+        return
+    if not results:
+        yield "rows", {"count": 0}
+        yield "done", {"response": "⚠ The answer could not be found!"}
+        return
+    remember_answer(question, sql_query, results, column_names)
+    yield "rows", {
+        "count": getattr(results, "total_rows", len(results)),
+        "columns": column_names,
+        "truncated": getattr(results, "capped", False),
+        "result_id": result_store.latest_handle(),
+    }
+    if get_last_csv_file():
+        yield "csv", {"available": True}
+    with metrics.stage("result_summary"):
+        json_output = convert_results_to_json(results, column_names)
+    ensure_time_for("nl_generation")
+    chunks = []
+    nl_started = time.perf_counter()
+    for chunk in nl_agent.generate_stream(build_nl_task(json_output, question)):
+        if not chunks:
+            metrics.record_stage("nl_first_token", time.perf_counter() - nl_started)
+        chunks.append(chunk)
+        yield "token", {"text": chunk}
+    metrics.record_stage("nl_generation", time.perf_counter() - nl_started)
+    note = truncation_note(results)
+    if chunks and note:
+        yield "token", {"text": note}
+    response = ("".join(chunks) + note) if chunks else "❌ Natural Language Agent Error: Could not generate a response."
+    yield "done", {"response": response}
+
 def process_response(message, history):
     """
     Generate a response and update chat history.
@@ -465,56 +1623,6 @@ def process_response(message, history):
         return "⚠️ Too many suspicious requests detected. Please focus on database questions."
     return chatbot(message)
 
-def on_close():
-    """
-    Clean up resources when the application closes.
-    """
-    print("\n🔄 Application is shutting down...")
-
-def create_chat_interface():
-    """
-    Build and return the Gradio chat interface.
-    """
-    with gr.Blocks(title="💬 SQLite Chatbot", theme="default") as app:
-        gr.Markdown("# 💬 SQLite Chatbot")
-        gr.Markdown("Query your database in natural language and receive CSV-exportable results!")
-        chatbot_component = gr.Chatbot(height=400, show_label=False)
-        with gr.Row():
-            with gr.Column(scale=4):
-                msg = gr.Textbox(placeholder="Type your message...", show_label=False)
-            with gr.Column(scale=1, min_width=100):
-                submit_btn = gr.Button("Send", variant="primary")
-        with gr.Row():
-            download_btn = gr.DownloadButton("Download CSV", variant="secondary", visible=False)
-        with gr.Row():
-            gr.Examples(
-                examples=[
-                    "List all customer names.",
-                    "Which product is the most expensive?",
-                    "Show the top-selling product by category.",
-                    "Who has placed the most orders?",
-                    "Which supplier provides the most products?",
-                    "Show all products in the 'Beverages' category."
-                ],
-                inputs=msg
-            )
-
-        def respond_and_update(message, history):
-            bot_response = process_response(message, history)
-            history.append((message, bot_response))
-            csv_path = get_last_csv_file()
-            download_update = gr.update(visible=bool(csv_path), value=csv_path or "")
-            return history, "", download_update
-
-        submit_btn.click(respond_and_update, inputs=[msg, chatbot_component], outputs=[chatbot_component, msg, download_btn])
-        msg.submit(respond_and_update, inputs=[msg, chatbot_component], outputs=[chatbot_component, msg, download_btn])
-
-        with gr.Row():
-            clear_btn = gr.Button("Clear Chat", variant="secondary")
-            clear_btn.click(lambda: ([], ""), outputs=[chatbot_component, download_btn])
-
-    return app
-
 class ChatbotService:
     """
     Service wrapper for the chatbot functionality to be used by Flask API
@@ -524,49 +1632,383 @@ class ChatbotService:
         test_db_connection()
         self.last_csv_path = None
     
-    def process_message(self, message):
+    def process_message(self, message, session_id=None, timeout=None):
         """
         Process a user message and return the chatbot response
         
         Args:
             message (str): User's input message
+            session_id (str or None): Session charged for the token usage
+            timeout (float or None): Seconds left of the caller's deadline
             
         Returns:
             str: Chatbot's response
+
+        Raises:
+            deadlines.DeadlineExceeded: If the deadline passed or too little time was left to answer
+        """
+        with request_scope(timeout), hw2.session_scope(session_id), \
+                metrics.trace_request("chat", SLOW_REQUEST_SECONDS, SLOW_REQUEST_SAMPLE_RATE):
+            return chatbot(message)
+
+    async def process_message_async(self, message, timings=None, session_id=None, result=None, data=None, max_rows=None,
+                                    timeout=None):
         """
-        return chatbot(message)
+        Process a user message with the overlapping async pipeline
+
+        Args:
+            message (str): User's input message
+            timings (dict or None): Filled with per-stage (start, end) offsets
+            session_id (str or None): Session charged for the token usage
+            result (dict or None): Filled with the result handle (id, columns, total_rows, capped)
+            data (dict or None): Filled with the result rows for structured responses (see result_data)
+            max_rows (int or None): Rows put into data (defaults to RESULT_INLINE_MAX_ROWS)
+            timeout (float or None): Seconds left of the caller's deadline
+
+        Returns:
+            str: Chatbot's response
+
+        Raises:
+            deadlines.DeadlineExceeded: If the deadline passed or too little time was left to answer
+        """
+        with request_scope(timeout), hw2.session_scope(session_id), \
+                metrics.trace_request("chat", SLOW_REQUEST_SECONDS, SLOW_REQUEST_SAMPLE_RATE), \
+                result_store.collect_handles() as handles:
+            response = await chatbot_async(message, timings)
+        if result is not None and handles:
+            result.update(result_handles.describe(handles[-1]) or {})
+        if data is not None and handles:
+            limit = RESULT_INLINE_MAX_ROWS if max_rows is None else max_rows
+            with metrics.stage("result_data"):
+                data.update(result_data(handles[-1], limit, handles.rows.get(handles[-1])) or {})
+        return response
     
-    def has_csv_file(self):
+    async def process_batch(self, questions, session_id=None, max_concurrency=None, timeout=None):
+        """
+        Process a list of questions with deduplication and bounded parallelism
+
+        Args:
+            questions (list): User questions
+            session_id (str or None): Session charged for the token usage
+            max_concurrency (int or None): Questions processed at once
+            timeout (float or None): Seconds left of the caller's deadline (questions not answered by then fail)
+
+        Returns:
+            dict: items in input order, unique question count and total seconds
+        """
+        self._check_batch(questions)
+        started = time.perf_counter()
+        with request_scope(timeout):
+            items = [item async for item in chatbot_batch(questions, session_id, max_concurrency)]
+        items.sort(key=lambda item: item["index"])
+        return {
+            "items": items,
+            "unique": sum(1 for item in items if item["duplicate_of"] is None),
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+
+    def stream_batch(self, questions, session_id=None, max_concurrency=None, timeout=None):
+        """
+        Process a list of questions and yield each item as soon as it completes
+
+        The batch runs on its own event loop in a worker thread, so this
+        generator can back a streaming (NDJSON) response.
+
+        Args:
+            questions (list): User questions
+            session_id (str or None): Session charged for the token usage
+            max_concurrency (int or None): Questions processed at once
+            timeout (float or None): Seconds left of the caller's deadline (questions not answered by then fail)
+
+        Yields:
+            dict: Batch item (see chatbot_batch)
+        """
+        self._check_batch(questions)
+        completed = queue.Queue()
+        finished = object()
+        stop = threading.Event()
+
+        async def produce():
+            async for item in chatbot_batch(questions, session_id, max_concurrency):
+                completed.put(item)
+                if stop.is_set():
+                    break
+
+        def run():
+            try:
+                with request_scope(timeout):
+                    asyncio.run(produce())
+            except Exception as e:
+                completed.put({"error": str(e)})
+            finally:
+                completed.put(finished)
+
+        threading.Thread(target=run, name="batch", daemon=True).start()
+        try:
+            while True:
+                item = completed.get()
+                if item is finished:
+                    break
+                yield item
+        finally:
+            stop.set()
+
+    def _check_batch(self, questions):
+        if not isinstance(questions, list) or not questions:
+            raise ValueError("questions must be a non-empty list")
+        if len(questions) > BATCH_MAX_ITEMS:
+            raise ValueError(f"A batch may contain at most {BATCH_MAX_ITEMS} questions")
+
+    def stream_message(self, message, session_id=None, timeout=None):
+        """
+        Process a user message and yield progress events and answer chunks
+
+        Args:
+            message (str): User's input message
+            session_id (str or None): Session charged for the token usage
+            timeout (float or None): Seconds left of the caller's deadline
+
+        Yields:
+            tuple: (event_name, data_dict)
+        """
+        with request_scope(timeout), hw2.session_scope(session_id), \
+                metrics.trace_request("chat_stream", SLOW_REQUEST_SECONDS, SLOW_REQUEST_SAMPLE_RATE), \
+                result_store.collect_handles():
+            yield from chatbot_events(message)
+
+    def get_result_page(self, result_id, after=None, offset=None, limit=100):
+        """
+        Get one page of a stored query result
+
+        Args:
+            result_id (str): Result handle returned with the chat response
+            after (str or None): Cursor from the previous page ("next")
+            offset (int or None): Row position to start at when no cursor is given
+            limit (int): Rows per page
+
+        Returns:
+            dict or None: Page with columns, rows and the next cursor; None if the handle expired
+        """
+        return result_handles.page(
+            result_id, after, offset, limit, rerun=fetch_result_rows,
+            version=query_cache.portable_version(database_version()),
+        )
+
+    def get_result_data(self, result_id, limit=None):
+        """
+        Get the rows of a stored result for a columnar or binary response
+
+        Args:
+            result_id (str): Result handle returned with the chat response
+            limit (int or None): Rows wanted (defaults to RESULT_DATA_MAX_ROWS)
+
+        Returns:
+            dict or None: columns, rows, total_rows, capped and truncated; None if the handle expired
+        """
+        return result_data(result_id, RESULT_DATA_MAX_ROWS if limit is None else limit)
+
+    def has_csv_file(self, result_id=None, session_id=None):
         """
         Check if there's a CSV file available for download
         
+        Args:
+            result_id (str or None): Result handle whose CSV is wanted
+            session_id (str or None): Session whose last CSV is wanted (the last CSV of this process if both are
+                omitted and the service runs in a single process)
+
         Returns:
             bool: True if CSV file is available
         """
-        return get_last_csv_file() is not None
+        return self.get_last_csv_path(result_id, session_id) is not None
     
-    def get_last_csv_path(self):
+    def get_last_csv_path(self, result_id=None, session_id=None):
         """
         Get the path to the last generated CSV file
         
+        With several worker processes there is no process-wide last CSV, so
+        clients must pass the result id returned with the chat response or
+        their session id.
+
+        Args:
+            result_id (str or None): Result handle whose CSV is wanted
+            session_id (str or None): Session whose last answer's CSV is wanted
+
         Returns:
             str or None: Path to CSV file or None if not available
         """
-        return get_last_csv_file()
+        if result_id:
+            csv_path = result_handles.csv_path(result_id)
+            return csv_path if csv_path and os.path.exists(csv_path) else None
+        return get_last_csv_file(session_id)
 
-# For Gradio interface (optional - can be run separately)
-def create_gradio_app():
-    """Create and return Gradio interface for standalone use"""
-    app = create_chat_interface()
-    return app
+    def get_cache_stats(self):
+        """
+        Get hit/miss/eviction counters of the SQL and result caches
 
-# Only run Gradio interface if this file is executed directly
-if __name__ == "__main__":
-    app = create_chat_interface()
-    app.launch(prevent_thread_lock=True)
+        Returns:
+            dict: Cache statistics keyed by cache name
+        """
+        stats = {"sql": sql_cache.stats(), "results": result_cache.stats()}
+        if shared_cache is not None:
+            stats["shared"] = shared_cache.stats()
+        return stats
 
-    try:
-        while True:
-            pass
-    except (KeyboardInterrupt, SystemExit):
-        on_close()
+    def get_session_stats(self):
+        """
+        Get conversation session counts and how follow-ups were answered
+
+        Returns:
+            dict: Session statistics
+        """
+        return conversation_sessions.stats()
+
+    def get_gate_stats(self):
+        """
+        Get how often the local intent gate answered without the Orchestrator
+
+        Returns:
+            dict: Gate decision counts and short-circuit rate
+        """
+        return question_gate.stats()
+
+    def get_usage_stats(self, session_id=None):
+        """
+        Get token and cost totals per agent, session and time window
+
+        Args:
+            session_id (str or None): Restrict the per-session section to one session
+
+        Returns:
+            dict: Usage ledger snapshot
+        """
+        return hw2.usage_ledger.snapshot(session_id)
+
+    def render_metrics(self):
+        """
+        Render pipeline metrics plus cache, pool, gate and token gauges
+
+        Returns:
+            str: Prometheus text exposition
+        """
+        caches = self.get_cache_stats()
+        pool = self.get_pool_stats()
+        gate = self.get_gate_stats()
+        usage = hw2.usage_ledger.snapshot()
+        limiter = self.get_rate_limit_stats()
+        aggregates = self.get_aggregate_stats()
+        sessions = self.get_session_stats()
+        sharding = self.get_shard_stats()
+        gauges = {
+            "chatbot_cache_entries": {(("cache", name),): caches[name]["size"] for name in ("sql", "results")},
+            "chatbot_cache_hit_ratio": {(("cache", name),): caches[name]["hit_rate"] for name in ("sql", "results")},
+            "chatbot_db_pool_open_connections": pool["open"],
+            "chatbot_db_pool_idle_connections": pool["idle"],
+            "chatbot_db_pool_wait_seconds_total": pool["wait_seconds_total"],
+            "chatbot_db_pool_timeouts": pool["timeouts"],
+            "chatbot_intent_gate_short_circuit_ratio": gate["short_circuit_rate"],
+            "chatbot_conversation_sessions": sessions["sessions"],
+            "chatbot_followups": {(("path", path),): count for path, count in sessions["followups"].items()},
+            "gemini_tokens": {
+                (("agent", agent), ("direction", direction)): totals[f"{direction}_tokens"]
+                for agent, totals in usage["agents"].items()
+                for direction in ("input", "output")
+            },
+            "gemini_cost_usd": {(("agent", agent),): totals["cost"] for agent, totals in usage["agents"].items()},
+            "chatbot_query_governor": {(("action", action),): count for action, count in self.get_governor_stats().items()},
+            "gemini_rate_limiter_waiting": limiter["waiting"],
+            "gemini_rate_limiter_requests": {
+                (("outcome", outcome),): limiter[outcome] for outcome in ("admitted", "throttled", "rejected", "coalesced")
+            },
+            "chatbot_summary_tables": {
+                (("event", event),): aggregates.get(event, 0) for event in ("refreshes", "rebuilds", "rewrites")
+            },
+            "chatbot_shard_queries": {(("mode", mode),): count for mode, count in sharding.get("queries", {}).items()},
+            "chatbot_shards_pruned": sharding.get("shards_pruned", 0),
+            "chatbot_stage_expected_seconds": {
+                (("stage", stage),): seconds for stage, seconds in self.get_deadline_stats().items()
+            },
+        }
+        return metrics.registry.render(gauges)
+
+    def get_rate_limit_stats(self):
+        """
+        Get admission counters of the Gemini rate limiter and coalesced calls
+
+        Returns:
+            dict: Limiter statistics plus the number of coalesced calls
+        """
+        return dict(gemini_limiter.stats(), coalesced=gemini_singleflight.coalesced)
+
+    def get_governor_stats(self):
+        """
+        Get how many queries the cost governor rejected or interrupted
+
+        Returns:
+            dict: Governor counters
+        """
+        return sql_governor.stats()
+
+    def get_index_advice(self, limit=10):
+        """
+        Get hot predicate/join columns and proposed covering indexes
+
+        Args:
+            limit (int): Maximum number of proposals
+
+        Returns:
+            dict: Index advisor report
+        """
+        return query_index_advisor.report(limit)
+
+    def get_aggregate_stats(self):
+        """
+        Get refresh and rewrite counters of the summary tables
+
+        Returns:
+            dict: Summary table statistics, or {"enabled": False}
+        """
+        if summary_tables is None:
+            return {"enabled": False}
+        return dict(summary_tables.stats(), enabled=True, attached=aggregates_attached())
+
+    def build_indexed_database(self, limit=10, switch=True):
+        """
+        Build proposed indexes into a derived database and optionally switch to it
+
+        Args:
+            limit (int): Maximum number of indexes to create
+            switch (bool): Serve queries from the new database afterwards
+
+        Returns:
+            dict: Build report with before/after timings
+        """
+        return build_indexed_database(limit, switch)
+
+    def get_shard_stats(self):
+        """
+        Get fan-out counters of sharded execution
+
+        Returns:
+            dict: Queries by mode and shards scanned/pruned, or {"enabled": False}
+        """
+        if shard_router is None:
+            return {"enabled": False}
+        return dict(shard_router.stats(), enabled=True)
+
+    def get_deadline_stats(self):
+        """
+        Get the stage durations that requests near their deadline are compared with
+
+        Returns:
+            dict: {stage: recent average seconds}
+        """
+        return stage_estimates.snapshot()
+
+    def get_pool_stats(self):
+        """
+        Get usage and wait metrics of the database connection pool
+
+        Returns:
+            dict: Pool statistics
+        """
+        return db_connection_pool.stats()
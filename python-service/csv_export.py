@@ -0,0 +1,107 @@
+import os
+import csv
+import gzip
+
+CHUNK_SIZE = 1000
+
+class ResultRows(list):
+    """
+    Result tuples kept in memory plus metadata about the full result set.
+
+    Behaves exactly like the list returned by cursor.fetchall(), but may hold
+    only the first rows of a larger result whose complete copy lives in the
+    exported CSV file.
+    """
+    def __init__(self, rows=(), total_rows=None, csv_path=None, capped=False):
+        super().__init__(rows)
+        self.total_rows = len(self) if total_rows is None else total_rows
+        self.csv_path = csv_path
+        self.capped = capped
+
+    @property
+    def truncated(self):
+        """True when fewer rows are held in memory than the query returned."""
+        return self.total_rows > len(self)
+
+def _open_csv(path, compress):
+    if compress:
+        return gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6)
+    return open(path, "w", newline="", encoding="utf-8")
+
+def export_cursor(cursor, csv_path, chunk_size=CHUNK_SIZE, compress=False, max_rows_in_memory=None, max_rows=None,
+                  sink=None):
+    """
+    Stream an executed cursor into a CSV file in fetchmany() chunks.
+
+    Only one chunk plus at most max_rows_in_memory rows are held in memory at
+    any time, so peak memory does not grow with the size of the result. The
+    file is written under a temporary name and moved into place when done.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on which a SELECT has been executed
+        csv_path (str): Destination path (".gz" is appended when compressing)
+        chunk_size (int): Rows fetched per fetchmany() call
+        compress (bool): Write a gzip-compressed CSV
+        max_rows_in_memory (int or None): Rows to keep for the caller (None keeps all)
+        max_rows (int or None): Stop reading after this many rows and mark the result as capped
+        sink (callable or None): Called with every exported chunk (e.g. to spill rows elsewhere)
+
+    Returns:
+        tuple: (ResultRows, column_names); csv_path is None when there were no rows
+    """
+    column_names = [desc[0] for desc in cursor.description or []]
+    first_chunk = cursor.fetchmany(chunk_size)
+    if not first_chunk:
+        return ResultRows(), []
+    if compress and not csv_path.endswith(".gz"):
+        csv_path += ".gz"
+    tmp_path = f"{csv_path}.part"
+    kept = []
+    total_rows = 0
+    capped = False
+    try:
+        with _open_csv(tmp_path, compress) as f:
+            writer = csv.writer(f)
+            writer.writerow(column_names)
+            chunk = first_chunk
+            while chunk:
+                if max_rows is not None and total_rows + len(chunk) > max_rows:
+                    chunk = chunk[:max_rows - total_rows]
+                    capped = True
+                writer.writerows(chunk)
+                if sink is not None:
+                    sink(chunk)
+                total_rows += len(chunk)
+                if max_rows_in_memory is None:
+                    kept.extend(chunk)
+                elif len(kept) < max_rows_in_memory:
+                    kept.extend(chunk[:max_rows_in_memory - len(kept)])
+                if capped:
+                    break
+                chunk = cursor.fetchmany(chunk_size)
+        os.replace(tmp_path, csv_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return ResultRows(kept, total_rows, csv_path, capped), column_names
+
+def iter_file_chunks(path, chunk_size=64 * 1024, decompress=False):
+    """
+    Yield a file's bytes in fixed-size chunks.
+
+    Args:
+        path (str): File to read
+        chunk_size (int): Bytes per chunk
+        decompress (bool): Transparently gunzip the file while reading
+
+    Yields:
+        bytes: File content
+    """
+    opener = gzip.open if decompress else open
+    with opener(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,276 @@
+"""
+Database-path benchmark at several data scales.
+
+Times a fixed corpus of representative queries (the recorded SQL Agent
+output of benchmark.py plus export-heavy scans) through execute_sql_query,
+i.e. plan check, execution, CSV export and result handles, and through
+convert_results_to_json, once per Northwind scale. Scaled databases are
+generated with northwind_scale.py when missing, and each scale runs in a
+fresh interpreter so caches, pools and schema state never leak between
+scales:
+
+    python db_benchmark.py --scales 100000,1000000,10000000 --data-dir scale_data
+    python db_benchmark.py --database scale_data/northwind_1000000.db --repeat 5
+
+The report shows the median time per query and stage at each scale, the
+growth exponent between scales (1.0 means linear in the data size) and
+the first scale at which a query failed, e.g. because the query governor
+rejected or interrupted it.
+"""
+import os
+import sys
+import json
+import sqlite3
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import threading
+from collections import defaultdict
+
+from benchmark import DEFAULT_SQL_RECORDINGS, memory_usage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPORT_MARKER = "DB_BENCHMARK "
+
+# Representative queries: recorded SQL Agent answers plus scans that stress export and serialization
+QUERY_CORPUS = {
+    "most_expensive_product": DEFAULT_SQL_RECORDINGS["Which product is the most expensive?"],
+    "beverages": DEFAULT_SQL_RECORDINGS["Show all products in the 'Beverages' category."],
+    "cheapest_with_category_counts": DEFAULT_SQL_RECORDINGS[
+        "İlk 5 en düşük fiyatlı ürünün, hangi kategoride yer aldığını ve o kategorideki toplam ürün sayısını hesapla."
+    ],
+    "top_customers_by_amount": DEFAULT_SQL_RECORDINGS[
+        "Her müşterinin toplam sipariş tutarını hesapla; ardından bu tutara göre en üst 3 müşteriyi belirle ve müşteri isimlerini göster."
+    ],
+    "top_customer_1997": DEFAULT_SQL_RECORDINGS[
+        "1997 yılındaki tüm siparişleri göz önüne alarak, en yüksek sipariş tutarına sahip müşterinin ismini ve toplam sipariş tutarını ver."
+    ],
+    "top_product_per_category": DEFAULT_SQL_RECORDINGS["Show the top-selling product by category."],
+    "customer_order_counts": DEFAULT_SQL_RECORDINGS["Who has placed the most orders?"],
+    "spend_per_customer": DEFAULT_SQL_RECORDINGS["Show the total amount spent by each customer."],
+    "monthly_revenue": (
+        "SELECT strftime('%Y-%m', o.OrderDate) AS Month, SUM(od.Quantity * p.Price) AS Revenue FROM Orders o "
+        "JOIN OrderDetails od ON od.OrderID = o.OrderID JOIN Products p ON p.ProductID = od.ProductID "
+        "GROUP BY Month ORDER BY Month"
+    ),
+    "order_lines_export": (
+        "SELECT o.OrderID, o.OrderDate, c.CustomerName, p.ProductName, od.Quantity FROM OrderDetails od "
+        "JOIN Orders o ON o.OrderID = od.OrderID JOIN Customers c ON c.CustomerID = o.CustomerID "
+        "JOIN Products p ON p.ProductID = od.ProductID"
+    ),
+}
+
+def run_database(db_path, repeat=3, queries=None):
+    """
+    Time the query corpus against one database in this process.
+
+    DB_PATH must not have been imported into chatbot_service yet; the service
+    module is imported here with DB_PATH pointing at db_path.
+
+    Args:
+        db_path (str): Database to benchmark
+        repeat (int): Runs per query (the result cache is cleared before each run)
+        queries (dict or None): {name: sql}, defaults to QUERY_CORPUS
+
+    Returns:
+        dict: database, order_details, memory and per-query timings
+    """
+    os.environ["DB_PATH"] = db_path
+    # Summary tables would answer the aggregate queries without touching the scaled tables
+    os.environ.setdefault("AGGREGATES_ENABLED", "0")
+    # Result handles of every run go to a throwaway store instead of the service's own
+    scratch = tempfile.mkdtemp(prefix="db_benchmark_")
+    os.environ["RESULT_STORE_PATH"] = os.path.join(scratch, "result_store.db")
+    sys.path.insert(0, HERE)
+    import chatbot_service
+    import metrics
+
+    samples = defaultdict(list)
+    samples_lock = threading.Lock()
+
+    def listener(stage, seconds):
+        with samples_lock:
+            samples[stage].append(seconds)
+
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        order_details = conn.execute("SELECT COUNT(*) FROM OrderDetails").fetchone()[0]
+    report = {"database": db_path, "order_details": order_details, "queries": {}}
+    metrics.stage_listeners.append(listener)
+    try:
+        for name, sql_query in (queries or QUERY_CORPUS).items():
+            runs = []
+            error = None
+            for _ in range(repeat):
+                chatbot_service.result_cache.clear()
+                with samples_lock:
+                    samples.clear()
+                started = time.perf_counter()
+                results, column_names = chatbot_service.execute_sql_query(sql_query)
+                executed = time.perf_counter()
+                if isinstance(column_names, str):
+                    error = column_names
+                    break
+                chatbot_service.convert_results_to_json(results, column_names)
+                serialized = time.perf_counter()
+                csv_path = getattr(results, "csv_path", None)
+                csv_bytes = os.path.getsize(csv_path) if csv_path and os.path.exists(csv_path) else 0
+                if csv_path and os.path.exists(csv_path):
+                    os.remove(csv_path)
+                with samples_lock:
+                    stages = {stage: sum(values) for stage, values in samples.items()}
+                stages["execute_sql_query"] = executed - started
+                stages["serialize_json"] = serialized - executed
+                runs.append({
+                    "seconds": serialized - started,
+                    "stages": stages,
+                    "rows": getattr(results, "total_rows", len(results)),
+                    "capped": bool(getattr(results, "capped", False)),
+                    "csv_bytes": csv_bytes,
+                })
+            report["queries"][name] = summarize_runs(runs, error)
+    finally:
+        metrics.stage_listeners.remove(listener)
+        shutil.rmtree(scratch, ignore_errors=True)
+    report["memory"] = memory_usage()
+    return report
+
+def summarize_runs(runs, error=None):
+    """Median and max time of a query's runs, median time per stage and the result size."""
+    if not runs:
+        return {"error": error}
+    stage_names = sorted({stage for run in runs for stage in run["stages"]})
+    return {
+        "error": error,
+        "median": round(statistics.median(run["seconds"] for run in runs), 6),
+        "max": round(max(run["seconds"] for run in runs), 6),
+        "stages": {
+            stage: round(statistics.median(run["stages"].get(stage, 0.0) for run in runs), 6) for stage in stage_names
+        },
+        "rows": runs[-1]["rows"],
+        "capped": runs[-1]["capped"],
+        "csv_bytes": runs[-1]["csv_bytes"],
+    }
+
+def run_scale(db_path, repeat):
+    """Benchmark one database in a fresh interpreter and return its report."""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--database", os.path.abspath(db_path), "--repeat", str(repeat), "--child"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(REPORT_MARKER)]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"Benchmark of {db_path} failed:\n" + "\n".join(proc.stderr.splitlines()[-20:]))
+    return json.loads(lines[-1][len(REPORT_MARKER):])
+
+def scaling_exponents(reports):
+    """
+    Growth of each query's median time between consecutive scales.
+
+    Returns:
+        dict: {query: [exponent or None, ...]} where t grows like size ** exponent
+    """
+    exponents = defaultdict(list)
+    for smaller, larger in zip(reports, reports[1:]):
+        size_ratio = larger["order_details"] / smaller["order_details"]
+        for name, entry in larger["queries"].items():
+            before = smaller["queries"].get(name, {}).get("median")
+            after = entry.get("median")
+            if before and after and size_ratio > 1:
+                exponents[name].append(round(math.log(after / before) / math.log(size_ratio), 2))
+            else:
+                exponents[name].append(None)
+    return dict(exponents)
+
+def print_reports(reports):
+    names = list(reports[0]["queries"]) if reports else []
+    header = "".join(f"{r['order_details']:>14,}" for r in reports)
+    print(f"{'median ms per query':<32}{header}")
+    for name in names:
+        cells = []
+        for report in reports:
+            entry = report["queries"].get(name, {})
+            cells.append(f"{'failed':>14}" if entry.get("error") else f"{entry['median'] * 1000:>14.1f}")
+        print(f"{name:<32}{''.join(cells)}")
+    for report in reports:
+        print(f"\n▶ {report['database']} ({report['order_details']:,} order lines, RSS {report['memory']['rss_mb']} MB)")
+        print(f"  {'query':<30}{'rows':>10}{'csv MB':>9}{'plan':>8}{'execute':>9}{'export':>9}{'json':>8}")
+        for name, entry in report["queries"].items():
+            if entry.get("error"):
+                print(f"  {name:<30} ❌ {entry['error']}")
+                continue
+            stages = entry["stages"]
+            rows = f"{entry['rows']}{'*' if entry['capped'] else ''}"
+            print(
+                f"  {name:<30}{rows:>10}{entry['csv_bytes'] / 1e6:>9.2f}"
+                f"{stages.get('query_plan', 0) * 1000:>8.1f}{stages.get('sqlite_execute', 0) * 1000:>9.1f}"
+                f"{stages.get('csv_export', 0) * 1000:>9.1f}{stages.get('serialize_json', 0) * 1000:>8.1f}"
+            )
+    if any(entry.get("capped") for report in reports for entry in report["queries"].values()):
+        print("  * stopped at MAX_RESULT_ROWS")
+    if len(reports) > 1:
+        print("\nGrowth exponent between scales (1.0 = linear in the data size)")
+        for name, values in scaling_exponents(reports).items():
+            print(f"  {name:<30}" + "".join(f"{'-' if v is None else v:>8}" for v in values))
+    for name in names:
+        failed = next((r for r in reports if r["queries"].get(name, {}).get("error")), None)
+        if failed is not None:
+            print(f"⚠ {name} first fails at {failed['order_details']:,} order lines: {failed['queries'][name]['error']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the database path of the service at several Northwind scales.")
+    parser.add_argument("--scales", default="100000,1000000", help="Comma-separated OrderDetails row counts")
+    parser.add_argument("--data-dir", default="scale_data", help="Where scaled databases are generated and reused")
+    parser.add_argument("--database", action="append", help="Benchmark existing database file(s) instead of --scales")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                report = run_database(args.database[0], args.repeat)
+            finally:
+                sys.stdout = stdout
+        print(REPORT_MARKER + json.dumps(report))
+        return 0
+
+    if args.database:
+        paths = args.database
+    else:
+        import northwind_scale
+        source = os.getenv("DB_PATH") or os.path.join(HERE, "..", "Northwind.db")
+        paths = []
+        for scale in sorted(int(s) for s in args.scales.split(",") if s.strip()):
+            path = os.path.join(args.data_dir, f"northwind_{scale}.db")
+            if not os.path.exists(path):
+                os.makedirs(args.data_dir, exist_ok=True)
+                print(f"🏗 Generating {path}")
+                northwind_scale.generate(source, path, scale)
+            paths.append(path)
+
+    reports = []
+    for path in paths:
+        print(f"⏱ Benchmarking {path}")
+        try:
+            reports.append(run_scale(path, args.repeat))
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return 1
+    reports.sort(key=lambda r: r["order_details"])
+    print_reports(reports)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"reports": reports, "growth": scaling_exponents(reports)}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Report written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
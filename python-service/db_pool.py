@@ -0,0 +1,265 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import deadlines
+
+DEFAULT_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+def readonly_uri(db_path):
+    """
+    Build a read-only SQLite URI for a database file.
+
+    Args:
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        str: file: URI with mode=ro
+    """
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro"
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the wait timeout."""
+
+class ConnectionPool:
+    """
+    Bounded pool of tuned, read-only SQLite connections.
+
+    A connection is handed to exactly one thread at a time, so warm page
+    caches and prepared statements are reused across requests without
+    sharing a connection concurrently.
+    """
+    def __init__(self, db_path, size=4, wait_timeout=10.0, health_check_interval=30.0,
+                 cached_statements=256, pragmas=None, attachments=None):
+        """
+        Args:
+            db_path (str): Path to the SQLite database
+            size (int): Maximum number of open connections
+            wait_timeout (float): Seconds to wait for a free connection
+            health_check_interval (float): Idle seconds after which a connection is pinged on checkout
+            cached_statements (int): Size of each connection's prepared statement cache
+            pragmas (dict or None): PRAGMA overrides applied to each new connection
+            attachments (dict or None): {schema_name: path} databases attached read-only to each connection
+        """
+        self.db_path = db_path
+        self.size = size
+        self.wait_timeout = wait_timeout
+        self.health_check_interval = health_check_interval
+        self.cached_statements = cached_statements
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.attachments = dict(attachments or {})
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._opened = 0
+        self._generation = 0
+        self._generations = {}
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+
+    def _open(self):
+        with self._lock:
+            db_path, generation, attachments = self.db_path, self._generation, dict(self.attachments)
+        conn = sqlite3.connect(
+            readonly_uri(db_path),
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        for name, path in attachments.items():
+            conn.execute(f"ATTACH DATABASE ? AS {name}", (readonly_uri(path),))
+        with self._lock:
+            self._generations[id(conn)] = generation
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            self.health_check_failures += 1
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self._generations.pop(id(conn), None)
+
+    def _is_stale(self, conn):
+        with self._lock:
+            return self._generations.get(id(conn)) != self._generation
+
+    def _check_fork(self):
+        # A worker forked from a preloaded parent starts with an empty pool instead of sharing its connections
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._generations = {}
+
+    def acquire(self):
+        """
+        Check out a connection, opening a new one while below the pool size.
+
+        Returns:
+            sqlite3.Connection: A read-only connection
+
+        Raises:
+            PoolTimeout: If no connection is free within wait_timeout
+            deadlines.DeadlineExceeded: If the request deadline passes while waiting
+        """
+        self._check_fork()
+        started = time.perf_counter()
+        waited = False
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        conn = self._open()
+                    except Exception:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                    break
+                waited = True
+                remaining = self.wait_timeout - (time.perf_counter() - started)
+                left = deadlines.remaining()
+                if left is not None and left < remaining:
+                    # No point holding a connection for a request that will be abandoned anyway
+                    if left <= 0:
+                        raise deadlines.expired("db_pool")
+                    remaining = left
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.wait_timeout}s")
+                try:
+                    conn, idle_since = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+            if self._is_stale(conn):
+                self._discard(conn)
+                continue
+            if time.monotonic() - idle_since > self.health_check_interval and not self._is_healthy(conn):
+                self._discard(conn)
+                continue
+            break
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds_total += elapsed
+                self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+        return conn
+
+    def release(self, conn):
+        """
+        Return a connection to the pool.
+
+        Args:
+            conn (sqlite3.Connection): Connection obtained from acquire()
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        if self._is_stale(conn):
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def switch_database(self, db_path):
+        """
+        Serve new checkouts from another database file.
+
+        Connections already checked out finish their query on the old file
+        and are closed when returned; idle ones are closed right away.
+
+        Args:
+            db_path (str): Path to the new SQLite database
+        """
+        with self._lock:
+            self.db_path = db_path
+            self._generation += 1
+        self.close()
+
+    def attach(self, name, path):
+        """
+        Attach another database read-only to every connection handed out from now on.
+
+        Args:
+            name (str): Schema name queries use to reach it (e.g. "agg")
+            path (str): Path to the SQLite database
+        """
+        with self._lock:
+            if self.attachments.get(name) == path:
+                return
+            self.attachments[name] = path
+            self._generation += 1
+        self.close()
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """
+        Return pool usage and wait metrics.
+
+        Returns:
+            dict: Pool counters
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "timeouts": self.timeouts,
+                "health_check_failures": self.health_check_failures,
+            }
@@ -0,0 +1,195 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+import metrics
+
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+current_cancel = contextvars.ContextVar("current_cancel", default=None)
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline has passed or too little time is left for its next stage."""
+    def __init__(self, message, stage=None, shed=False):
+        super().__init__(message)
+        self.stage = stage
+        self.shed = shed
+        # Lets a caller sharing another request's work tell whose deadline ran out
+        self.deadline = current_deadline.get()
+
+class Cancelled(Exception):
+    """Raised instead of starting work whose result the caller no longer wants (see cancellable())."""
+
+class Deadline:
+    """Point in time (monotonic clock) after which a request's work is abandoned."""
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left, 0.0 once the deadline passed."""
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+@contextmanager
+def scope(seconds):
+    """
+    Run the block under a deadline (including worker threads and tasks that copy the context).
+
+    Args:
+        seconds (float or None): Time budget (0 or less: already passed); None runs the block without a deadline
+
+    Yields:
+        Deadline or None
+    """
+    deadline = Deadline(seconds) if seconds is not None else None
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+def current():
+    """Return the deadline of the enclosing scope() block, or None."""
+    return current_deadline.get()
+
+def remaining():
+    """Seconds left of the current deadline, or None without one."""
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+def clamp(timeout):
+    """
+    Shorten a timeout to what is left of the current deadline.
+
+    Args:
+        timeout (float or None): Timeout of the operation (None = unbounded)
+
+    Returns:
+        float or None: The smaller of timeout and the time left
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+def exceeded(message, stage, shed=False):
+    """Count and return a DeadlineExceeded error (shed=True when given up before the deadline passed)."""
+    metrics.registry.inc("chatbot_deadline_exceeded_total", stage=stage or "unknown", reason="shed" if shed else "expired")
+    return DeadlineExceeded(message, stage, shed)
+
+def check(stage, expected=0.0):
+    """
+    Abandon the request if its deadline passed or the work left usually takes longer than the time left.
+
+    Args:
+        stage (str): Stage about to start (used in the error and the metric label)
+        expected (float): Seconds the remaining work is expected to take
+
+    Raises:
+        DeadlineExceeded: With shed=True when the deadline has not passed yet but is too close
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return
+    left = deadline.remaining()
+    if left <= 0:
+        raise exceeded(f"The request deadline passed before {stage}", stage)
+    if expected and left < expected:
+        raise exceeded(f"Only {left:.2f}s left, {stage} and later stages usually take {expected:.2f}s", stage, True)
+
+def expired(stage):
+    """Return the DeadlineExceeded error for work cut short by the current deadline (to raise from a timeout)."""
+    return exceeded(f"The request deadline passed during {stage}", stage)
+
+def sleep(seconds, stage="retry"):
+    """
+    time.sleep() that refuses to sleep past the current deadline.
+
+    Raises:
+        DeadlineExceeded: If the deadline would pass before the sleep ends
+    """
+    left = remaining()
+    if left is not None and seconds >= left:
+        raise exceeded(f"Waiting {seconds}s for {stage} would outlast the request deadline", stage, True)
+    time.sleep(seconds)
+
+@contextmanager
+def cancellable():
+    """
+    Give work started in the block (tasks, threads that copy the context) a cancel event.
+
+    Setting the event does not interrupt a call already in flight; the work
+    raises Cancelled at its next check_cancelled(), e.g. before a Gemini call
+    takes a rate-limiter slot.
+
+    Yields:
+        threading.Event: Set it to cancel the work
+    """
+    event = threading.Event()
+    token = current_cancel.set(event)
+    try:
+        yield event
+    finally:
+        current_cancel.reset(token)
+
+def cancelled():
+    """Return True when the enclosing cancellable() block's work was cancelled."""
+    event = current_cancel.get()
+    return event is not None and event.is_set()
+
+def check_cancelled(stage):
+    """
+    Raises:
+        Cancelled: If the work of the enclosing cancellable() block was cancelled
+    """
+    if cancelled():
+        raise Cancelled(f"{stage} was cancelled")
+
+class StageEstimates:
+    """
+    Moving average of recent stage durations in this process.
+
+    Fed by metrics.stage_listeners; check() compares the time left with the
+    expected duration of the stages still to run.
+    """
+    def __init__(self, alpha=0.2, min_samples=5):
+        """
+        Args:
+            alpha (float): Weight of the newest sample in the moving average
+            min_samples (int): Samples needed before a stage's estimate is used
+        """
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._averages = {}
+        self._samples = {}
+
+    def observe(self, stage, seconds):
+        """Record one stage duration (a metrics stage listener)."""
+        with self._lock:
+            count = self._samples.get(stage, 0)
+            average = self._averages.get(stage, seconds)
+            self._averages[stage] = seconds if count == 0 else average + self.alpha * (seconds - average)
+            self._samples[stage] = count + 1
+
+    def expected(self, *stages):
+        """Sum of the estimates of the given stages (stages with too few samples count as 0)."""
+        with self._lock:
+            return sum(
+                self._averages[stage] for stage in stages if self._samples.get(stage, 0) >= self.min_samples
+            )
+
+    def snapshot(self):
+        """
+        Return the current estimates.
+
+        Returns:
+            dict: {stage: average seconds} for stages with enough samples
+        """
+        with self._lock:
+            return {
+                stage: round(average, 4) for stage, average in self._averages.items()
+                if self._samples[stage] >= self.min_samples
+            }
@@ -0,0 +1,334 @@
+import re
+from collections import namedtuple
+from schema_catalog import identifier_words, _stem
+from shards import parse_select, _split, _item_alias, _order_term, _integer, _identifier, _column, _norm
+
+LOCAL_TABLE = "previous"
+
+FollowupPlan = namedtuple("FollowupPlan", "sql_query local_sql question state")
+
+_FILLER = re.compile(r"^(?:now|ok|okay|and|also|then|please|can you|could you|would you)\b\s*")
+_REFERENT = r"(?: (?:those|them|these|it|that|the results|the rows|the ones|the list|this list|the answer))?"
+_DESCENDING = re.compile(
+    r"\b(?:desc|descending|highest first|largest first|biggest first|most first|high to low|highest to lowest|"
+    r"largest to smallest|reverse)\b"
+)
+_DIRECTION = (
+    r"(?: (?:in )?(?P<dir>asc|ascending|desc|descending|highest first|largest first|biggest first|most first|"
+    r"lowest first|smallest first|least first|high to low|low to high|from highest to lowest|from lowest to highest|"
+    r"largest to smallest|smallest to largest|reverse)(?: order)?)?"
+)
+_OPERATORS = {
+    "greater than": ">", "more than": ">", "above": ">", "over": ">", "bigger than": ">", "higher than": ">", ">": ">",
+    "at least": ">=", ">=": ">=",
+    "less than": "<", "below": "<", "under": "<", "fewer than": "<", "lower than": "<", "smaller than": "<", "<": "<",
+    "at most": "<=", "<=": "<=",
+    "is not": "!=", "not": "!=", "!=": "!=",
+    "is": "=", "equals": "=", "equal to": "=", "=": "=",
+}
+_OPERATOR = "|".join(sorted((re.escape(op) for op in _OPERATORS), key=len, reverse=True))
+
+_SORT = re.compile(r"^(?:sort|order|rank|arrange)" + _REFERENT + r" by (?P<col>.+?)" + _DIRECTION + "$")
+_LIMIT = [
+    re.compile(
+        r"^(?:just )?(?:(?:show|give|keep|return|list)(?: me)? )?(?:only )?(?:the )?(?:top|first) (?P<n>\d+)"
+        r"(?: (?:ones|rows|results|items|of them|of those|of these))?$"
+    ),
+    re.compile(r"^(?:limit|cut)" + _REFERENT + r" (?:to )?(?P<n>\d+)(?: rows| results| items)?$"),
+    re.compile(r"^(?:show |give me |keep )?(?:only|just) (?P<n>\d+)(?: rows| results| items| of them)?$"),
+]
+_COMPARE = re.compile(
+    r"^(?:only |show only |keep only |show |keep )?(?:the ones|those|these|ones|them|rows)?\s*"
+    r"(?:where|with|whose|that have|having) (?:the |a |an |their )?(?P<col>.+?) (?:is |are )?"
+    r"(?P<op>" + _OPERATOR + r") (?P<value>.+)$"
+)
+_MEMBERSHIP = re.compile(
+    r"^(?:only|show only|keep only|just)(?: show)?(?: the ones| those| these| ones| them| rows)?"
+    r"(?: that are| which are| located| based)? (?:from|in|for|of) (?P<value>.+)$"
+)
+_EXCLUDE = re.compile(r"^(?:excluding|except|without|exclude|leave out|drop)(?: the ones| those)?(?: from| in)? (?P<value>.+)$")
+_PROJECT = re.compile(
+    r"^(?P<only>only |just )?(?:show|give me|keep|list|return|display)(?: me)?(?P<only_after> only| just)? (?:the )?"
+    r"(?P<cols>.+?)(?P<fields> columns?| fields?)?(?P<referent> (?:of|for|from) (?:those|them|these|the results))?$"
+)
+
+class Refinement:
+    """
+    Sort, filter, limit and projection steps applied to a previous result.
+
+    Columns refer to the previous result's column names, so the same
+    refinement can run on an in-memory copy of the rows or on the
+    previous SQL wrapped as a subquery. Either way the rows keep the
+    previous order, as the whole order or to break ties of a new sort.
+    """
+    def __init__(self, source_columns=()):
+        self.source_columns = list(source_columns)
+        self.columns = None
+        self.filters = []
+        self.order = []
+        self.limit = None
+
+    def describe(self):
+        """Return a short English description, e.g. "sorted by Price (descending), top 5"."""
+        parts = []
+        for column, op, value in self.filters:
+            parts.append(f"{column} {op} {value}")
+        for column, descending in self.order:
+            parts.append(f"sorted by {column} ({'descending' if descending else 'ascending'})")
+        if self.limit is not None:
+            parts.append(f"top {self.limit}")
+        if self.columns:
+            parts.append("showing " + ", ".join(self.columns))
+        return ", ".join(parts)
+
+    def to_sql(self, source):
+        """
+        Render the refinement as a SELECT over a table or a subquery.
+
+        Args:
+            source (str): Table name (LOCAL_TABLE) or the previous SQL query
+
+        Returns:
+            str: SQL query
+        """
+        source = source.strip().rstrip(";").strip()
+        relation = _quote(source) if source == LOCAL_TABLE else f"({source}) AS {LOCAL_TABLE}"
+        select = ", ".join(_quote(c) for c in self.columns) if self.columns else "*"
+        sql = f"SELECT {select} FROM {relation}"
+        if self.filters:
+            conditions = []
+            for column, op, value in self.filters:
+                collate = " COLLATE NOCASE" if isinstance(value, str) else ""
+                conditions.append(f"{_quote(column)}{collate} {op} {_literal(value)}")
+            sql += " WHERE " + " AND ".join(conditions)
+        order = [f"{_quote(c)}{' DESC' if d else ''}" for c, d in self.order]
+        if source == LOCAL_TABLE:
+            # The copied rows were inserted in the previous order
+            order.append("rowid")
+        else:
+            # Rows of a subquery come back in no particular order once the outer query filters or sorts them
+            sorted_columns = {c for c, _ in self.order}
+            order.extend(
+                f"{_quote(c)}{suffix}" for c, suffix in previous_order(source, self.source_columns)
+                if c not in sorted_columns
+            )
+        if order:
+            sql += " ORDER BY " + ", ".join(order)
+        if self.limit is not None:
+            sql += f" LIMIT {self.limit}"
+        return sql
+
+def previous_order(sql_query, column_names):
+    """
+    Restate the ORDER BY of a query over its result columns, for a query that wraps it as a subquery.
+
+    Args:
+        sql_query (str): Previous SQL query
+        column_names (list): Columns of its result
+
+    Returns:
+        list: [(column, suffix)] such as [("Total", " DESC")]; ends before the first term that is not a result column
+    """
+    select = parse_select(sql_query)
+    if select is None:
+        return []
+    items = [_item_alias(item) for item in _split(select.clause("select"), ",")]
+    star = any(t.text == "*" for item, _ in items for t in item[-1:])
+    names = {c.lower(): c for c in column_names}
+    order = []
+    for term in _split(select.clause("order"), ","):
+        if not term:
+            continue
+        expression, collation, descending, nulls_first = _order_term(term)
+        position = _integer(expression)
+        name = _identifier(expression[0]) if len(expression) == 1 else None
+        column = None
+        if position is not None:
+            column = column_names[position - 1] if 1 <= position <= len(column_names) else None
+        elif name and any(alias and alias.lower() == name.lower() for _, alias in items):
+            column = names.get(name.lower())
+        elif not star:
+            index = next((i for i, (item, _) in enumerate(items) if _norm(item) == _norm(expression)), None)
+            column = column_names[index] if index is not None and index < len(column_names) else None
+        elif _column(expression):
+            column = names.get(_column(expression)[1].lower())
+        if column is None:
+            break
+        suffix = f" COLLATE {collation}" if collation else ""
+        suffix += " DESC" if descending else ""
+        if nulls_first == descending:
+            suffix += " NULLS FIRST" if nulls_first else " NULLS LAST"
+        order.append((column, suffix))
+    return order
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+def _literal(value):
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _value(text):
+    text = text.strip()
+    number = re.match(r"^\$?(-?\d+(?:\.\d+)?)(?:\s*(?:dollars?|usd|units?|items?|orders?))?$", text)
+    if number is None:
+        return text
+    return float(number.group(1)) if "." in number.group(1) else int(number.group(1))
+
+def _words(text):
+    return [_stem(w) for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in ("the", "a", "an", "their", "its", "id")]
+
+def resolve_column(phrase, column_names):
+    """
+    Find the result column a phrase refers to ("prices" -> "Price", "product name" -> "ProductName").
+
+    Args:
+        phrase (str): Words from the follow-up question
+        column_names (list): Columns of the previous result
+
+    Returns:
+        str or None: Column name, or None if no column or several columns match equally well
+    """
+    phrase = phrase.strip()
+    for column in column_names:
+        if column.lower() == phrase.lower() or column.lower() == phrase.replace(" ", "").lower():
+            return column
+    words = set(_words(phrase))
+    if not words:
+        return None
+    best, best_score, tied = None, 0.0, False
+    for column in column_names:
+        stems = {_stem(w) for w in identifier_words(column) if w != "id"} or {column.lower()}
+        # Every word of the phrase must belong to the column name, so "products by price" matches nothing
+        if not words <= stems:
+            continue
+        score = len(words) / len(stems)
+        if score > best_score:
+            best, best_score, tied = column, score, False
+        elif score == best_score:
+            tied = True
+    return None if tied else best
+
+def _value_column(value, column_names, rows):
+    # The column whose values contain the phrase, e.g. "germany" -> ("Country", "Germany")
+    if not isinstance(value, str) or not rows:
+        return None, value
+    target = value.lower()
+    matches = {}
+    for i, column in enumerate(column_names):
+        for row in rows:
+            if isinstance(row[i], str) and row[i].lower() == target:
+                matches[column] = row[i]
+                break
+    if len(matches) != 1:
+        return None, value
+    return next(iter(matches.items()))
+
+def _parse_clause(clause, refinement, column_names, rows):
+    match = _SORT.match(clause)
+    if match:
+        column = resolve_column(match.group("col"), column_names)
+        if column is None:
+            return False
+        refinement.order.append((column, bool(match.group("dir") and _DESCENDING.search(match.group("dir")))))
+        return True
+    for pattern in _LIMIT:
+        match = pattern.match(clause)
+        if match:
+            refinement.limit = int(match.group("n"))
+            return True
+    match = _COMPARE.match(clause)
+    if match:
+        column = resolve_column(match.group("col"), column_names)
+        value = _value(match.group("value"))
+        if column is None:
+            return False
+        refinement.filters.append((column, _OPERATORS[match.group("op")], value))
+        return True
+    for pattern, op in ((_MEMBERSHIP, "="), (_EXCLUDE, "!=")):
+        match = pattern.match(clause)
+        if match:
+            column, value = _value_column(_value(match.group("value")), column_names, rows)
+            if column is None:
+                return False
+            refinement.filters.append((column, op, value))
+            return True
+    match = _PROJECT.match(clause)
+    # "list order details" is a new question, "just show the order details" narrows the previous one
+    if match and any(match.group(g) for g in ("only", "only_after", "fields", "referent")):
+        columns = [resolve_column(part, column_names) for part in re.split(r",| and ", match.group("cols")) if part.strip()]
+        if not columns or None in columns:
+            return False
+        refinement.columns = list(dict.fromkeys(columns))
+        return True
+    return False
+
+def _parse(text, refinement, column_names, rows):
+    text = text.strip()
+    if not text:
+        return True
+    if _parse_clause(text, refinement, column_names, rows):
+        return True
+    for separator in (r"\s*,\s*(?:and\s+|then\s+)?", r"\s+and then\s+", r"\s+then\s+", r"\s+and\s+"):
+        for match in re.finditer(separator, text):
+            trial = Refinement()
+            trial.__dict__.update({k: list(v) if isinstance(v, list) else v for k, v in refinement.__dict__.items()})
+            if _parse_clause(text[:match.start()], trial, column_names, rows) and \
+                    _parse(_strip_filler(text[match.end():]), trial, column_names, rows):
+                refinement.__dict__.update(trial.__dict__)
+                return True
+    return False
+
+def _strip_filler(text):
+    previous = None
+    while previous != text:
+        previous = text
+        text = _FILLER.sub("", text).strip()
+    return re.sub(r"\s+please$", "", text)
+
+def parse_followup(question, column_names, rows=()):
+    """
+    Recognize a question that only refines the previous result.
+
+    The whole question must be made of sort / filter / limit / projection
+    clauses over the previous result's columns ("now sort those by price",
+    "only the ones from Germany", "top 5", "just show the names and
+    prices"); anything else returns None and goes through the agents.
+
+    Args:
+        question (str): Sanitized follow-up question
+        column_names (list): Columns of the previous result
+        rows (list): Rows of the previous result held in memory (used to find the column of a value)
+
+    Returns:
+        Refinement or None
+    """
+    if not column_names:
+        return None
+    text = re.sub(r"[^\w\s.,<>=!-]", " ", question.lower())
+    text = _strip_filler(re.sub(r"\s+", " ", text).strip().rstrip(".").strip())
+    refinement = Refinement(column_names)
+    if not text or not _parse(text, refinement, list(column_names), rows):
+        return None
+    if not (refinement.columns or refinement.filters or refinement.order or refinement.limit is not None):
+        return None
+    return refinement
+
+def load_rows(conn, column_names, rows):
+    """
+    Copy a cached result into a table named LOCAL_TABLE on an (in-memory) SQLite connection.
+
+    Args:
+        conn (sqlite3.Connection): Target connection
+        column_names (list): Result column names (must be unique)
+        rows (list): Result tuples
+
+    Raises:
+        ValueError: If the column names are not unique
+    """
+    if len({c.lower() for c in column_names}) != len(column_names):
+        raise ValueError("The previous result has duplicate column names")
+    conn.execute(f"CREATE TABLE {_quote(LOCAL_TABLE)} ({', '.join(_quote(c) for c in column_names)})")
+    placeholders = ", ".join("?" for _ in column_names)
+    conn.executemany(f"INSERT INTO {_quote(LOCAL_TABLE)} VALUES ({placeholders})", rows)
@@ -0,0 +1,68 @@
+import gradio as gr
+from chatbot_service import process_response, get_last_csv_file
+
+def on_close():
+    """
+    Clean up resources when the application closes.
+    """
+    print("\n🔄 Application is shutting down...")
+
+def create_chat_interface():
+    """
+    Build and return the Gradio chat interface.
+    """
+    with gr.Blocks(title="💬 SQLite Chatbot", theme="default") as app:
+        gr.Markdown("# 💬 SQLite Chatbot")
+        gr.Markdown("Query your database in natural language and receive CSV-exportable results!")
+        chatbot_component = gr.Chatbot(height=400, show_label=False)
+        with gr.Row():
+            with gr.Column(scale=4):
+                msg = gr.Textbox(placeholder="Type your message...", show_label=False)
+            with gr.Column(scale=1, min_width=100):
+                submit_btn = gr.Button("Send", variant="primary")
+        with gr.Row():
+            download_btn = gr.DownloadButton("Download CSV", variant="secondary", visible=False)
+        with gr.Row():
+            gr.Examples(
+                examples=[
+                    "List all customer names.",
+                    "Which product is the most expensive?",
+                    "Show the top-selling product by category.",
+                    "Who has placed the most orders?",
+                    "Which supplier provides the most products?",
+                    "Show all products in the 'Beverages' category."
+                ],
+                inputs=msg
+            )
+
+        def respond_and_update(message, history):
+            bot_response = process_response(message, history)
+            history.append((message, bot_response))
+            csv_path = get_last_csv_file()
+            download_update = gr.update(visible=bool(csv_path), value=csv_path or "")
+            return history, "", download_update
+
+        submit_btn.click(respond_and_update, inputs=[msg, chatbot_component], outputs=[chatbot_component, msg, download_btn])
+        msg.submit(respond_and_update, inputs=[msg, chatbot_component], outputs=[chatbot_component, msg, download_btn])
+
+        with gr.Row():
+            clear_btn = gr.Button("Clear Chat", variant="secondary")
+            clear_btn.click(lambda: ([], ""), outputs=[chatbot_component, download_btn])
+
+    return app
+
+def create_gradio_app():
+    """Create and return Gradio interface for standalone use"""
+    app = create_chat_interface()
+    return app
+
+# Standalone Gradio UI; the Flask service (app.py) never imports this module
+if __name__ == "__main__":
+    app = create_chat_interface()
+    app.launch(prevent_thread_lock=True)
+
+    try:
+        while True:
+            pass
+    except (KeyboardInterrupt, SystemExit):
+        on_close()
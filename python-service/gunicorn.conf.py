@@ -0,0 +1,40 @@
+"""
+Production serving configuration for the Python service.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master (preload_app) and the workers are
+forked from it, so the schema catalog, intent gate and other read-only
+structures are shared copy-on-write. SQLite connections, Gemini clients and
+thread pools are opened lazily in each worker after the fork. The SQL cache,
+result cache, result handles and Gemini rate limit live in SQLite WAL files
+that every worker shares, so a new worker does not start with cold caches.
+"""
+import os
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "4"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+accesslog = "-"
+
+# Cross-worker state; set before app.py is imported so every worker uses the same files
+shared_state_dir = os.getenv("SHARED_STATE_DIR", "query_results")
+os.makedirs(shared_state_dir, exist_ok=True)
+os.environ.setdefault("SHARED_CACHE_PATH", os.path.join(shared_state_dir, "shared_cache.db"))
+os.environ.setdefault("GEMINI_RATE_STATE_PATH", os.path.join(shared_state_dir, "gemini_rate_state.db"))
+os.environ.setdefault("RESULT_STORE_PATH", os.path.join(shared_state_dir, "result_store.db"))
+os.environ.setdefault("SERVED_DB_STATE_PATH", os.path.join(shared_state_dir, "served_database.json"))
+# Tells the app that per-process state (e.g. the last CSV written) is not shared between requests
+os.environ["SERVICE_WORKERS"] = str(workers)
+
+def post_fork(server, worker):
+    server.log.info("🔀 Worker %s forked; connections and clients open on first use", worker.pid)
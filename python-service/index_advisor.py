@@ -0,0 +1,354 @@
+import os
+import re
+import time
+import sqlite3
+import statistics
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from query_cache import canonicalize_sql
+from query_governor import table_aliases
+from db_pool import readonly_uri
+
+IndexProposal = namedtuple("IndexProposal", ["table", "key_columns", "include_columns", "uses", "estimated_benefit"])
+
+MAX_INDEX_COLUMNS = 5
+
+_QUALIFIED = re.compile(r"\b(\w+)\.(\w+)\b")
+_IDENTIFIER = re.compile(r"\b([A-Za-z_]\w*)\b")
+_PREDICATE = re.compile(
+    r"(?:\b(\w+)\.)?\b(\w+)\s*(=|==|<>|!=|<=|>=|<|>|\bIN\b|\bLIKE\b|\bBETWEEN\b)", re.IGNORECASE
+)
+_JOIN_EQUALITY = re.compile(r"\b(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)\b")
+_CLAUSE = re.compile(
+    r"\b(WHERE|ON|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|JOIN|UNION|EXCEPT|INTERSECT)\b", re.IGNORECASE
+)
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$")
+
+# Order in which column roles enter an index key: equality and join keys
+# first, then ranges, then grouping/sorting columns.
+_ROLE_ORDER = ("eq", "join", "range", "group", "order")
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+def _clauses(sql_query):
+    """Split a query into (clause_keyword, text) pieces."""
+    pieces = []
+    matches = list(_CLAUSE.finditer(sql_query))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(sql_query)
+        pieces.append((re.sub(r"\s+", " ", match.group(1).upper()), sql_query[match.end():end]))
+    return pieces
+
+def _strip_literals(sql_query):
+    return re.sub(r"'(?:[^']|'')*'", "''", sql_query)
+
+class IndexAdvisor:
+    """
+    Learn which columns generated queries filter, join, group and sort on,
+    and propose covering indexes for them.
+
+    Every executed query is recorded together with the tables its plan
+    scanned without an index. Proposals are ranked by how many rows they
+    would have saved, and can be built into a read-optimized copy of the
+    database together with a before/after timing report.
+    """
+    def __init__(self, max_queries=1000):
+        """
+        Args:
+            max_queries (int): Distinct queries remembered (least recently seen are dropped)
+        """
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+        self._queries = OrderedDict()
+        self._schema = {}
+        self._schema_path = None
+
+    def _load_schema(self, conn):
+        database = conn.execute("PRAGMA database_list").fetchone()[2]
+        with self._lock:
+            if self._schema and self._schema_path == database:
+                return self._schema
+        schema = {}
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+            columns = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+            primary_key = [c for c in columns if c[5] > 0]
+            leading = set()
+            if len(primary_key) == 1 and primary_key[0][2].upper() == "INTEGER":
+                leading.add(primary_key[0][1])
+            for index in conn.execute(f"PRAGMA index_list({_quote(table)})").fetchall():
+                info = conn.execute(f"PRAGMA index_info({_quote(index[1])})").fetchall()
+                if info:
+                    leading.add(min(info)[2])
+            rows = conn.execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0]
+            schema[table] = {"columns": [c[1] for c in columns], "indexed": leading, "rows": rows}
+        with self._lock:
+            self._schema = schema
+            self._schema_path = database
+        return schema
+
+    def _resolve(self, schema, aliases, qualifier, column):
+        tables = {name.lower(): name for name in schema}
+        if qualifier:
+            table = aliases.get(qualifier.lower(), qualifier)
+            table = tables.get(table.lower())
+            if table and column in schema[table]["columns"]:
+                return table, column
+            return None
+        candidates = [
+            t for t in {tables.get(a.lower()) for a in aliases.values()}
+            if t and column in schema[t]["columns"]
+        ]
+        return (candidates[0], column) if len(candidates) == 1 else None
+
+    def _analyze(self, schema, sql_query):
+        text = _strip_literals(sql_query)
+        aliases = table_aliases(text)
+        roles = {}
+
+        def add(ref, role):
+            if ref:
+                roles.setdefault(ref, set()).add(role)
+
+        for left_q, left_c, right_q, right_c in _JOIN_EQUALITY.findall(text):
+            add(self._resolve(schema, aliases, left_q, left_c), "join")
+            add(self._resolve(schema, aliases, right_q, right_c), "join")
+        for clause, body in _clauses(text):
+            if clause in ("WHERE", "ON", "HAVING"):
+                for qualifier, column, operator in _PREDICATE.findall(body):
+                    role = "eq" if operator.upper() in ("=", "==", "IN") else "range"
+                    ref = self._resolve(schema, aliases, qualifier, column)
+                    if ref and "join" not in roles.get(ref, ()):
+                        add(ref, role)
+            elif clause in ("GROUP BY", "ORDER BY"):
+                role = "group" if clause == "GROUP BY" else "order"
+                for qualifier, column in _QUALIFIED.findall(body):
+                    add(self._resolve(schema, aliases, qualifier, column), role)
+                for column in _IDENTIFIER.findall(_QUALIFIED.sub(" ", body)):
+                    add(self._resolve(schema, aliases, None, column), role)
+        referenced = set(roles)
+        for qualifier, column in _QUALIFIED.findall(text):
+            ref = self._resolve(schema, aliases, qualifier, column)
+            if ref:
+                referenced.add(ref)
+        for column in _IDENTIFIER.findall(_QUALIFIED.sub(" ", text)):
+            ref = self._resolve(schema, aliases, None, column)
+            if ref:
+                referenced.add(ref)
+        return aliases, roles, referenced
+
+    def record(self, conn, sql_query, plan_rows, elapsed=None):
+        """
+        Record one executed query and the tables its plan scanned.
+
+        Args:
+            conn (sqlite3.Connection): Connection the query ran on
+            sql_query (str): Executed SQL
+            plan_rows (list): EXPLAIN QUERY PLAN rows (id, parent, notused, detail)
+            elapsed (float or None): Execution time in seconds
+        """
+        key = canonicalize_sql(sql_query)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is not None:
+                entry["count"] += 1
+                if elapsed is not None:
+                    entry["seconds"] += elapsed
+                self._queries.move_to_end(key)
+                return
+        schema = self._load_schema(conn)
+        aliases, roles, referenced = self._analyze(schema, sql_query)
+        scanned = set()
+        for _, _, _, detail in plan_rows:
+            match = _SCAN.match(detail)
+            if match and "INDEX" not in match.group(3):
+                table = aliases.get((match.group(2) or match.group(1)).lower(), match.group(1))
+                scanned.update(t for t in schema if t.lower() == table.lower())
+        entry = {
+            "sql": key,
+            "count": 1,
+            "seconds": elapsed or 0.0,
+            "roles": roles,
+            "referenced": referenced,
+            "scanned": scanned,
+        }
+        with self._lock:
+            self._queries[key] = entry
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+
+    def hot_columns(self):
+        """
+        Aggregate how often each column is used in each role.
+
+        Returns:
+            dict: {"Table.Column": {role: uses}}
+        """
+        totals = {}
+        with self._lock:
+            entries = list(self._queries.values())
+        for entry in entries:
+            for (table, column), roles in entry["roles"].items():
+                counter = totals.setdefault(f"{table}.{column}", Counter())
+                for role in roles:
+                    counter[role] += entry["count"]
+        return {name: dict(counter) for name, counter in sorted(totals.items(), key=lambda item: -sum(item[1].values()))}
+
+    def propose(self, limit=10):
+        """
+        Propose covering indexes for the recorded workload.
+
+        For each scanned table, the most used key columns that no existing
+        index leads with become the index key; the other columns those
+        queries read are appended so the index covers them.
+
+        Args:
+            limit (int): Maximum number of proposals
+
+        Returns:
+            list: IndexProposal tuples, highest estimated benefit first
+        """
+        with self._lock:
+            entries = list(self._queries.values())
+            schema = self._schema
+        groups = {}
+        for entry in entries:
+            for table in entry["scanned"]:
+                key_roles = {
+                    column: roles for (t, column), roles in entry["roles"].items()
+                    if t == table and roles & {"eq", "join", "range"}
+                }
+                if not key_roles or all(column in schema[table]["indexed"] for column in key_roles):
+                    continue
+                ordered = sorted(
+                    key_roles, key=lambda column: (min(_ROLE_ORDER.index(r) for r in key_roles[column]), column)
+                )
+                key_columns = tuple(ordered[:MAX_INDEX_COLUMNS])
+                group = groups.setdefault((table, key_columns), {"uses": 0, "include": Counter()})
+                group["uses"] += entry["count"]
+                for t, column in entry["referenced"]:
+                    if t == table and column not in key_columns:
+                        group["include"][column] += entry["count"]
+        proposals = []
+        for (table, key_columns), group in groups.items():
+            room = MAX_INDEX_COLUMNS - len(key_columns)
+            include = tuple(column for column, _ in group["include"].most_common(room))
+            rows = schema[table]["rows"]
+            # Each use avoids a full scan, replacing it with a logarithmic index probe.
+            benefit = group["uses"] * max(rows - max(rows, 2).bit_length(), 0)
+            proposals.append(IndexProposal(table, key_columns, include, group["uses"], benefit))
+        proposals.sort(key=lambda p: (-p.estimated_benefit, p.table, p.key_columns))
+        return proposals[:limit]
+
+    def hot_queries(self, limit=10):
+        """Return the most frequently executed recorded queries."""
+        with self._lock:
+            entries = sorted(self._queries.values(), key=lambda entry: -entry["count"])
+        return [entry["sql"] for entry in entries[:limit]]
+
+    def report(self, limit=10):
+        """
+        Summarize the observed workload and current proposals.
+
+        Returns:
+            dict: recorded query count, hot columns and proposals with their DDL
+        """
+        with self._lock:
+            recorded = len(self._queries)
+        return {
+            "recorded_queries": recorded,
+            "hot_columns": self.hot_columns(),
+            "proposals": [dict(p._asdict(), ddl=index_ddl(p)) for p in self.propose(limit)],
+        }
+
+def index_name(proposal):
+    """Deterministic name for a proposed index."""
+    return "advisor_" + "_".join([proposal.table] + list(proposal.key_columns)).lower()
+
+def index_ddl(proposal):
+    """
+    Return the CREATE INDEX statement for a proposal.
+
+    Args:
+        proposal (IndexProposal): Proposal from IndexAdvisor.propose()
+
+    Returns:
+        str: SQL statement
+    """
+    columns = ", ".join(_quote(c) for c in proposal.key_columns + proposal.include_columns)
+    return f"CREATE INDEX IF NOT EXISTS {_quote(index_name(proposal))} ON {_quote(proposal.table)} ({columns})"
+
+def _time_query(db_path, sql_query, repeat=3):
+    conn = sqlite3.connect(readonly_uri(db_path), uri=True)
+    try:
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql_query).fetchall()
+            runs.append(time.perf_counter() - started)
+        return statistics.median(runs)
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+def build_optimized_database(source_path, target_path, proposals, benchmark_queries=(), repeat=3):
+    """
+    Copy a database, add the proposed indexes and measure the effect.
+
+    The copy is written under a temporary name, indexed, analyzed and then
+    moved over target_path in one rename, so readers never see a half-built
+    file.
+
+    Args:
+        source_path (str): Database the service currently reads
+        target_path (str): Path of the read-optimized copy
+        proposals (list): IndexProposal tuples to build
+        benchmark_queries (list): Queries timed on both databases
+        repeat (int): Runs per query; the median is reported
+
+    Returns:
+        dict: Created indexes and before/after timings
+    """
+    tmp_path = f"{target_path}.building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    source = sqlite3.connect(readonly_uri(source_path), uri=True)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+        created = []
+        for proposal in proposals:
+            ddl = index_ddl(proposal)
+            target.execute(ddl)
+            created.append(ddl)
+        target.execute("ANALYZE")
+        target.commit()
+    except BaseException:
+        target.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    timings = []
+    for sql_query in benchmark_queries:
+        before = _time_query(source_path, sql_query, repeat)
+        after = _time_query(tmp_path, sql_query, repeat)
+        timings.append({
+            "sql": sql_query,
+            "before_seconds": before,
+            "after_seconds": after,
+            "speedup": (before / after) if before and after else None,
+        })
+    os.replace(tmp_path, target_path)
+    total_before = sum(t["before_seconds"] or 0 for t in timings)
+    total_after = sum(t["after_seconds"] or 0 for t in timings)
+    return {
+        "database": target_path,
+        "indexes": created,
+        "timings": timings,
+        "total_before_seconds": total_before,
+        "total_after_seconds": total_after,
+    }
@@ -0,0 +1,199 @@
+import re
+import math
+import threading
+from collections import namedtuple
+
+ON_TOPIC = "on_topic"
+OFF_TOPIC = "off_topic"
+UNCERTAIN = "uncertain"
+
+GateDecision = namedtuple("GateDecision", ["label", "confidence"])
+
+# Words that signal a data question (English and Turkish stems).
+QUERY_LEXICON = [
+    "list", "show", "display", "give", "find", "count", "how many", "number of", "total",
+    "sum", "average", "avg", "mean", "top", "most", "least", "highest", "lowest", "max",
+    "min", "which", "who", "each", "per", "every", "all", "sort", "order by", "group",
+    "revenue", "sales", "sold", "spent", "amount", "expensive", "cheapest", "between",
+    "listele", "göster", "goster", "kaç", "kac", "toplam", "ortalama", "en çok", "en az",
+    "en yüksek", "en düşük", "hangi", "kim", "her", "tüm", "tum", "sırala", "hesapla",
+]
+
+# Turkish stems for the Northwind tables; they count like table names.
+DOMAIN_TABLE_LEXICON = [
+    "ürün", "urun", "müşteri", "musteri", "sipariş", "siparis", "tedarikçi", "tedarikci",
+    "çalışan", "calisan", "kategori", "nakliye",
+]
+
+# Turkish stems for Northwind columns and measures; they count like column words.
+DOMAIN_LEXICON = [
+    "fiyat", "ülke", "ulke", "şehir", "sehir", "satış", "satis", "miktar", "tutar",
+]
+
+# Words that signal small talk or general-knowledge questions.
+OFF_TOPIC_LEXICON = [
+    "weather", "joke", "poem", "story", "recipe", "capital of", "president", "movie",
+    "film", "song", "lyrics", "translate", "write code", "python", "javascript", "hello",
+    "hi", "hey", "how are you", "thank", "meaning of life", "football", "news",
+    "hava durumu", "şaka", "saka", "şiir", "siir", "tarif", "şarkı", "sarki", "merhaba",
+    "selam", "nasılsın", "nasilsin", "teşekkür", "tesekkur", "haber", "maç",
+]
+
+def _split_identifier(identifier):
+    parts = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", identifier)
+    return [p.lower() for p in parts if len(p) > 1]
+
+def _add_word(vocabulary, word):
+    if word != "id":
+        vocabulary.add(word)
+        if word.endswith("ies"):
+            vocabulary.add(word[:-3] + "y")
+        elif word.endswith("s"):
+            vocabulary.add(word[:-1])
+
+def schema_vocabulary(schema_text, tables_only=False):
+    """
+    Extract table and column words from the "- Table: col, col" schema text.
+
+    CamelCase identifiers are split ("CustomerName" -> "customer", "name") and
+    ID suffixes are dropped.
+
+    Args:
+        schema_text (str): Schema description given to the agents
+        tables_only (bool): Only return the words of table names
+
+    Returns:
+        set: Lowercase vocabulary words
+    """
+    vocabulary = set()
+    for line in (schema_text or "").splitlines():
+        match = re.match(r"\s*-\s*(\w+)\s*:\s*(.+)", line)
+        if not match:
+            continue
+        table, columns = match.groups()
+        identifiers = [table] if tables_only else [table] + [c.strip() for c in columns.split(",")]
+        for identifier in identifiers:
+            for word in _split_identifier(identifier):
+                _add_word(vocabulary, word)
+    return vocabulary
+
+def _normalize(text):
+    return (text or "").replace("İ", "i").lower()
+
+def _matches(text, tokens, lexicon):
+    """
+    Return the distinct question words (or phrases) found in a lexicon.
+
+    A word counts once however many entries it matches ("products" matches
+    both "product" and "products").
+    """
+    matched = set()
+    for entry in lexicon:
+        if " " in entry:
+            if entry in text:
+                matched.add(entry)
+        elif len(entry) <= 3:
+            if entry in tokens:
+                matched.add(entry)
+        else:
+            matched.update(token for token in tokens if token.startswith(entry))
+    return matched
+
+class IntentGate:
+    """
+    Local on-topic/off-topic classifier used in front of the Orchestrator.
+
+    A tiny linear model over three features (schema vocabulary hits, query
+    lexicon hits and off-topic lexicon hits) decides clear cases in-process;
+    only low-confidence questions are sent to the Orchestrator LLM. A
+    question is only accepted without the Orchestrator when it names a table
+    or at least two distinct schema words: a single column word such as
+    "country" or "phone" also appears in plenty of general questions.
+    """
+    def __init__(self, schema_text, guard_patterns=(), high_threshold=0.75, low_threshold=0.2):
+        """
+        Args:
+            schema_text (str): Schema description given to the agents
+            guard_patterns (list): Prompt-injection regexes; matches are never short-circuited
+            high_threshold (float): Confidence at or above which a question is on-topic
+            low_threshold (float): Confidence at or below which a question is off-topic
+        """
+        self.table_words = sorted(schema_vocabulary(schema_text, tables_only=True) | set(DOMAIN_TABLE_LEXICON))
+        self.schema_words = sorted(schema_vocabulary(schema_text) | set(DOMAIN_TABLE_LEXICON) | set(DOMAIN_LEXICON))
+        self.guard_patterns = list(guard_patterns)
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+        self._lock = threading.Lock()
+        self.counts = {ON_TOPIC: 0, OFF_TOPIC: 0, UNCERTAIN: 0}
+
+    def score(self, text):
+        """
+        Return the probability that the question is about the database.
+
+        Args:
+            text (str): Sanitized user question
+
+        Returns:
+            float: Confidence between 0 and 1
+        """
+        return self._score(self._features(text))
+
+    def _features(self, text):
+        lowered = _normalize(text)
+        tokens = re.findall(r"\w+", lowered)
+        schema = _matches(lowered, tokens, self.schema_words)
+        # A schema word is not also a query word ("country" must not count as "count")
+        query = _matches(lowered, [t for t in tokens if t not in schema], QUERY_LEXICON)
+        return {
+            "schema": schema,
+            "tables": _matches(lowered, tokens, self.table_words),
+            "query": query,
+            "off_topic": _matches(lowered, tokens, OFF_TOPIC_LEXICON),
+        }
+
+    def _score(self, features):
+        z = (1.6 * len(features["schema"]) + 0.6 * min(len(features["query"]), 3)
+             - 2.0 * len(features["off_topic"]) - 0.8)
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def classify(self, text):
+        """
+        Classify a question as on-topic, off-topic or uncertain.
+
+        Args:
+            text (str): Sanitized user question
+
+        Returns:
+            GateDecision: (label, confidence)
+        """
+        if any(re.search(p, text or "", re.IGNORECASE) for p in self.guard_patterns):
+            decision = GateDecision(UNCERTAIN, 0.5)
+        else:
+            features = self._features(text)
+            confidence = self._score(features)
+            named_table = bool(features["tables"]) or len(features["schema"]) >= 2
+            if confidence >= self.high_threshold and named_table:
+                decision = GateDecision(ON_TOPIC, confidence)
+            elif confidence <= self.low_threshold:
+                decision = GateDecision(OFF_TOPIC, confidence)
+            else:
+                decision = GateDecision(UNCERTAIN, confidence)
+        with self._lock:
+            self.counts[decision.label] += 1
+        return decision
+
+    def stats(self):
+        """
+        Return how often the gate short-circuited the Orchestrator.
+
+        Returns:
+            dict: Decision counts and short_circuit_rate
+        """
+        with self._lock:
+            total = sum(self.counts.values())
+            short_circuited = self.counts[ON_TOPIC] + self.counts[OFF_TOPIC]
+            return dict(
+                self.counts,
+                total=total,
+                short_circuit_rate=(short_circuited / total) if total else 0.0,
+            )
@@ -0,0 +1,403 @@
+import re
+import json
+import math
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+from db_pool import readonly_uri
+from query_governor import table_aliases
+
+SummaryView = namedtuple("SummaryView", ["name", "key", "columns", "order_match"])
+
+# Every summary table is a GROUP BY over this join of order lines.
+FACT_FROM = """
+FROM src.OrderDetails od
+JOIN src.Orders o ON o.OrderID = od.OrderID
+JOIN src.Products p ON p.ProductID = od.ProductID
+LEFT JOIN src.Categories c ON c.CategoryID = p.CategoryID
+LEFT JOIN src.Suppliers s ON s.SupplierID = p.SupplierID
+LEFT JOIN src.Customers cu ON cu.CustomerID = o.CustomerID
+LEFT JOIN src.Employees e ON e.EmployeeID = o.EmployeeID
+"""
+FACT_TABLES = ("OrderDetails", "Orders", "Products", "Categories", "Suppliers", "Customers", "Employees")
+MONTH_EXPR = "strftime('%Y-%m', o.OrderDate)"
+
+# columns: {name: (expression, tables the column may be read from in a user query)}
+# order_match: condition telling whether an earlier line of the same order fell into the same group
+VIEWS = (
+    SummaryView("sales_by_product", "ProductID", {
+        "ProductID": ("p.ProductID", {"Products", "OrderDetails"}),
+        "ProductName": ("p.ProductName", {"Products"}),
+        "CategoryID": ("p.CategoryID", {"Products"}),
+        "CategoryName": ("c.CategoryName", {"Categories"}),
+        "SupplierID": ("p.SupplierID", {"Products"}),
+        "SupplierName": ("s.SupplierName", {"Suppliers"}),
+    }, "x.ProductID = od.ProductID"),
+    SummaryView("sales_by_category", "CategoryID", {
+        "CategoryID": ("p.CategoryID", {"Products", "Categories"}),
+        "CategoryName": ("c.CategoryName", {"Categories"}),
+    }, "xp.CategoryID = p.CategoryID"),
+    SummaryView("sales_by_supplier", "SupplierID", {
+        "SupplierID": ("p.SupplierID", {"Products", "Suppliers"}),
+        "SupplierName": ("s.SupplierName", {"Suppliers"}),
+    }, "xp.SupplierID = p.SupplierID"),
+    SummaryView("sales_by_customer", "CustomerID", {
+        "CustomerID": ("o.CustomerID", {"Orders", "Customers"}),
+        "CustomerName": ("cu.CustomerName", {"Customers"}),
+        "Country": ("cu.Country", {"Customers"}),
+    }, "1"),
+    SummaryView("sales_by_employee", "EmployeeID", {
+        "EmployeeID": ("o.EmployeeID", {"Orders", "Employees"}),
+        "FirstName": ("e.FirstName", {"Employees"}),
+        "LastName": ("e.LastName", {"Employees"}),
+    }, "1"),
+    SummaryView("sales_by_month", "Month", {
+        "Month": (MONTH_EXPR, {"Orders"}),
+    }, "1"),
+)
+MEASURES = ("TotalQuantity", "TotalRevenue", "OrderLines", "OrderCount")
+DEFINITION_HASH = hashlib.sha256(
+    json.dumps([FACT_FROM, VIEWS, MEASURES], default=sorted, sort_keys=True).encode("utf-8")
+).hexdigest()[:16]
+
+# Cheap checksums of the rows each table had at the last refresh; a change
+# to any of them (rather than appended rows) forces a full rebuild.
+_CHECKSUMS = {
+    "OrderDetails": "TOTAL(OrderID), TOTAL(ProductID), TOTAL(Quantity)",
+    "Orders": "TOTAL(CustomerID), TOTAL(EmployeeID), TOTAL(julianday(OrderDate))",
+    "Products": "TOTAL(Price), TOTAL(CategoryID), TOTAL(SupplierID), TOTAL(LENGTH(ProductName))",
+    "Categories": "TOTAL(LENGTH(CategoryName))",
+    "Suppliers": "TOTAL(LENGTH(SupplierName))",
+    "Customers": "TOTAL(LENGTH(CustomerName)), TOTAL(LENGTH(Country))",
+    "Employees": "TOTAL(LENGTH(FirstName)), TOTAL(LENGTH(LastName))",
+}
+
+_COLUMN = re.compile(r"^(?:(\w+)\.)?(\w+)$")
+_MONTH = re.compile(r"^strftime\('%Y-%m',(?:(\w+)\.)?OrderDate\)$", re.IGNORECASE)
+_AGGREGATES = (
+    (re.compile(r"^SUM\((?:\w+\.)?Quantity\)$", re.IGNORECASE), "TotalQuantity"),
+    (re.compile(r"^SUM\((?:\w+\.)?Quantity\*(?:\w+\.)?Price\)$", re.IGNORECASE), "TotalRevenue"),
+    (re.compile(r"^SUM\((?:\w+\.)?Price\*(?:\w+\.)?Quantity\)$", re.IGNORECASE), "TotalRevenue"),
+    (re.compile(r"^COUNT\(DISTINCT(?:\w+\.)?OrderID\)$", re.IGNORECASE), "OrderCount"),
+    (re.compile(r"^COUNT\((?:\*|(?:\w+\.)?OrderDetailID)\)$", re.IGNORECASE), "OrderLines"),
+)
+_GROUPED_QUERY = re.compile(
+    r"^SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<from>.+?)\s+GROUP\s+BY\s+(?P<group>.+?)"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?(?:\s+LIMIT\s+(?P<limit>\d+))?$",
+    re.IGNORECASE | re.DOTALL,
+)
+_JOIN = re.compile(r"\b(?:INNER\s+|LEFT\s+(?:OUTER\s+)?)?JOIN\b", re.IGNORECASE)
+_JOIN_KEYS = {"OrderID", "ProductID", "CategoryID", "SupplierID", "CustomerID", "EmployeeID"}
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current).strip())
+    return parts
+
+def _same_checksum(stored, current):
+    return stored is not None and len(stored) == len(current) and all(
+        math.isclose(a, b, rel_tol=1e-12, abs_tol=1e-9) for a, b in zip(stored, current)
+    )
+
+def _compact(expression):
+    return re.sub(r"\s+", "", expression)
+
+class MaterializedAggregates:
+    """
+    Sales summary tables kept in a sidecar SQLite file.
+
+    Each table aggregates quantity, revenue, order lines and distinct orders
+    by product, category, supplier, customer, employee or month. When the
+    source database changes, order lines appended since the last refresh
+    are folded in with upserts; a change to rows that existed at the last
+    refresh (edited orders, prices, names) rebuilds the tables. Connections attach the file as "agg", so
+    generated SQL can read e.g. agg.sales_by_customer instead of joining
+    OrderDetails, Orders and Products.
+    """
+    def __init__(self, path, schema_name="agg"):
+        """
+        Args:
+            path (str): Sidecar SQLite file holding the summary tables
+            schema_name (str): Name the file is attached under on query connections
+        """
+        self.path = path
+        self.schema_name = schema_name
+        self._lock = threading.Lock()
+        self._version = None
+        self._source_columns = {}
+        self.refreshes = 0
+        self.rebuilds = 0
+        self.rewrites = 0
+        self.last_error = None
+
+    def _connect(self, source_path):
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("ATTACH DATABASE ? AS src", (readonly_uri(source_path),))
+        return conn
+
+    def _create_tables(self, conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS refresh_state (key TEXT PRIMARY KEY, value TEXT)")
+        for view in VIEWS:
+            columns = ", ".join(
+                f"{name} {'NOT NULL PRIMARY KEY' if name == view.key else ''}".strip() for name in view.columns
+            )
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {view.name} ({columns}, "
+                "TotalQuantity INTEGER, TotalRevenue REAL, OrderLines INTEGER, OrderCount INTEGER)"
+            )
+            for name in view.columns:
+                if name != view.key:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {view.name}_{name} ON {view.name} ({name})")
+            for measure in MEASURES:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {view.name}_{measure} ON {view.name} ({measure})")
+
+    def _checksum(self, conn, table, low, high):
+        return list(conn.execute(
+            f"SELECT COUNT(*), {_CHECKSUMS[table]} FROM src.{table} WHERE rowid > ? AND rowid <= ?", (low, high)
+        ).fetchone())
+
+    def _fold_lines(self, conn, mark, high):
+        conn.execute("DROP TABLE IF EXISTS temp.prior_lines")
+        conn.execute(
+            "CREATE TEMP TABLE prior_lines AS SELECT x.OrderID, x.ProductID FROM src.OrderDetails x "
+            "WHERE x.OrderDetailID <= ? AND x.OrderID IN "
+            "(SELECT OrderID FROM src.OrderDetails WHERE OrderDetailID > ? AND OrderDetailID <= ?)",
+            (mark, mark, high),
+        )
+        conn.execute("CREATE INDEX temp.prior_lines_order ON prior_lines (OrderID)")
+        for view in VIEWS:
+            names = list(view.columns)
+            expressions = [view.columns[name][0] for name in names]
+            first_in_group = (
+                "NOT EXISTS (SELECT 1 FROM temp.prior_lines x JOIN src.Products xp ON xp.ProductID = x.ProductID "
+                f"WHERE x.OrderID = od.OrderID AND {view.order_match})"
+            )
+            updates = ", ".join(
+                [f"{name} = excluded.{name}" for name in names if name != view.key]
+                + [f"{measure} = {measure} + excluded.{measure}" for measure in MEASURES]
+            )
+            conn.execute(
+                f"INSERT INTO {view.name} ({', '.join(names + list(MEASURES))}) "
+                f"SELECT {', '.join(expressions)}, SUM(od.Quantity), SUM(od.Quantity * p.Price), COUNT(*), "
+                f"COUNT(DISTINCT CASE WHEN {first_in_group} THEN od.OrderID END) {FACT_FROM}"
+                f"WHERE od.OrderDetailID > ? AND od.OrderDetailID <= ? AND {view.columns[view.key][0]} IS NOT NULL "
+                f"GROUP BY {view.columns[view.key][0]} "
+                f"ON CONFLICT({view.key}) DO UPDATE SET {updates}",
+                (mark, high),
+            )
+        conn.execute("DROP TABLE temp.prior_lines")
+
+    def refresh(self, source_path, version=None):
+        """
+        Bring the summary tables up to date with the source database.
+
+        Cheap when version equals the one seen at the last refresh.
+
+        Args:
+            source_path (str): Path to the source SQLite database
+            version (hashable): Database version token (e.g. DatabaseVersionWatcher.token())
+
+        Returns:
+            str: "fresh", "incremental" or "rebuilt"
+        """
+        if version is not None and version == self._version:
+            return "fresh"
+        with self._lock:
+            if version is not None and version == self._version:
+                return "fresh"
+            conn = self._connect(source_path)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._create_tables(conn)
+                    state = dict(conn.execute("SELECT key, value FROM refresh_state").fetchall())
+                    marks = json.loads(state.get("marks", "{}"))
+                    stored = json.loads(state.get("checksums", "{}"))
+                    highs = {
+                        table: conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM src.{table}").fetchone()[0]
+                        for table in _CHECKSUMS
+                    }
+                    changed = any(
+                        highs[table] < marks.get(table, 0)
+                        or not _same_checksum(stored.get(table), self._checksum(conn, table, 0, marks.get(table, 0)))
+                        for table in _CHECKSUMS
+                    )
+                    outcome = "incremental"
+                    if changed or state.get("definition") != DEFINITION_HASH or state.get("source") != source_path:
+                        for view in VIEWS:
+                            conn.execute(f"DELETE FROM {view.name}")
+                        marks, stored = {}, {}
+                        outcome = "rebuilt"
+                    mark, high = marks.get("OrderDetails", 0), highs["OrderDetails"]
+                    if high > mark:
+                        self._fold_lines(conn, mark, high)
+                    elif outcome == "incremental" and highs == marks:
+                        outcome = "fresh"
+                    checksums = {}
+                    for table in _CHECKSUMS:
+                        previous = stored.get(table) or self._checksum(conn, table, 0, 0)
+                        added = self._checksum(conn, table, marks.get(table, 0), highs[table])
+                        checksums[table] = [a + b for a, b in zip(previous, added)]
+                    state = {
+                        "definition": DEFINITION_HASH,
+                        "source": source_path,
+                        "marks": json.dumps(highs),
+                        "checksums": json.dumps(checksums),
+                    }
+                    conn.executemany("INSERT OR REPLACE INTO refresh_state VALUES (?, ?)", state.items())
+                    self._source_columns = {
+                        table: {c[1] for c in conn.execute(f"PRAGMA src.table_info({table})")} for table in FACT_TABLES
+                    }
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.close()
+            self._version = version
+            self.refreshes += 1
+            if outcome == "rebuilt":
+                self.rebuilds += 1
+            return outcome
+
+    def describe(self):
+        """
+        Render the summary tables for the SQL Agent prompt.
+
+        Returns:
+            str: Schema lines for the attached summary tables
+        """
+        lines = [
+            f"Precomputed summary tables (prefer them for totals, rankings and counts over the whole history; "
+            f"OrderCount counts distinct orders, OrderLines counts OrderDetails rows, TotalRevenue is Quantity * Price):"
+        ]
+        for view in VIEWS:
+            lines.append(f"- {self.schema_name}.{view.name}: {', '.join(list(view.columns) + list(MEASURES))}")
+        return "\n".join(lines) + "\n"
+
+    def _map_expression(self, view, aliases, expression):
+        compact = _compact(expression)
+        for pattern, measure in _AGGREGATES:
+            if pattern.match(compact):
+                return measure
+        if _MONTH.match(compact) and "Month" in view.columns:
+            return "Month"
+        match = _COLUMN.match(compact)
+        if not match or match.group(2) not in view.columns:
+            return None
+        qualifier, column = match.groups()
+        sources = view.columns[column][1]
+        if qualifier:
+            table = aliases.get(qualifier.lower())
+            return column if table in sources else None
+        owners = {table for table in set(aliases.values()) if column in self._source_columns.get(table, ())}
+        return column if owners and owners <= sources else None
+
+    def rewrite(self, sql_query):
+        """
+        Rewrite a grouped aggregation over order lines into a summary table lookup.
+
+        Only queries of the form SELECT ... FROM <order tables joined on their
+        keys> GROUP BY <summary key> [ORDER BY ...] [LIMIT n] without WHERE,
+        HAVING or subqueries are rewritten; their SUM(Quantity),
+        SUM(Quantity * Price), COUNT(*) and COUNT(DISTINCT OrderID) map to
+        precomputed measures. Relies on the foreign keys of the order tables
+        being intact.
+
+        Args:
+            sql_query (str): Validated SELECT query
+
+        Returns:
+            str or None: Equivalent query on the summary table, or None if it does not apply
+        """
+        if not self._source_columns:
+            return None
+        text = sql_query.strip().rstrip(";").strip()
+        match = _GROUPED_QUERY.match(text)
+        if not match or text.upper().count("SELECT") != 1 or re.search(r"\b(WHERE|HAVING|UNION|WITH)\b", text, re.I):
+            return None
+        from_part = match.group("from")
+        if "," in from_part or "(" in from_part:
+            return None
+        aliases = table_aliases(f"FROM {from_part}")
+        tables = set(aliases.values())
+        references = re.findall(r"\b(?:FROM|JOIN)\s+\w+", f"FROM {from_part}", re.IGNORECASE)
+        if "OrderDetails" not in tables or not tables <= set(FACT_TABLES) or len(references) != len(tables):
+            return None
+        for piece in _JOIN.split(from_part)[1:]:
+            condition = re.split(r"\bON\b", piece, flags=re.IGNORECASE)
+            if len(condition) != 2:
+                return None
+            keys = re.fullmatch(r"\s*\w+\.(\w+)\s*=\s*\w+\.(\w+)\s*", condition[1])
+            if not keys or keys.group(1) != keys.group(2) or keys.group(1) not in _JOIN_KEYS:
+                return None
+        group = _split_top_level(match.group("group"))
+        for view in VIEWS:
+            grouped = [self._map_expression(view, aliases, item) for item in group]
+            if view.key not in grouped or None in grouped or set(grouped) & set(MEASURES):
+                continue
+            select, names = [], set()
+            for item in _split_top_level(match.group("select")):
+                parts = re.fullmatch(r"(.*?)(?:\s+(?:AS\s+)?(\w+))?", item, re.IGNORECASE | re.DOTALL)
+                expression, alias = parts.group(1), parts.group(2)
+                mapped = self._map_expression(view, aliases, expression)
+                if mapped is None:
+                    select = None
+                    break
+                output = alias or (mapped if _COLUMN.match(_compact(expression)) else expression.strip())
+                names.add(output.lower())
+                select.append(mapped if output == mapped else f'{mapped} AS "{output}"')
+            if not select:
+                continue
+            order = []
+            for item in _split_top_level(match.group("order") or ""):
+                if not item:
+                    continue
+                term = re.fullmatch(r"(.*?)(\s+(?:ASC|DESC))?", item, re.IGNORECASE | re.DOTALL)
+                expression, direction = term.group(1).strip(), term.group(2) or ""
+                if expression.lower() in names or expression.isdigit():
+                    order.append(f"{expression}{direction}")
+                    continue
+                mapped = self._map_expression(view, aliases, expression)
+                if mapped is None:
+                    order = None
+                    break
+                order.append(f"{mapped}{direction}")
+            if order is None:
+                continue
+            rewritten = f"SELECT {', '.join(select)} FROM {self.schema_name}.{view.name}"
+            if order:
+                rewritten += f" ORDER BY {', '.join(order)}"
+            if match.group("limit"):
+                rewritten += f" LIMIT {match.group('limit')}"
+            with self._lock:
+                self.rewrites += 1
+            return rewritten + ";"
+        return None
+
+    def stats(self):
+        """
+        Return refresh counters.
+
+        Returns:
+            dict: path, refreshes, rebuilds, rewrites and the last error
+        """
+        return {
+            "path": self.path,
+            "refreshes": self.refreshes,
+            "rebuilds": self.rebuilds,
+            "rewrites": self.rewrites,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,220 @@
+import json
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+BYTE_BUCKETS = (1024, 16 * 1024, 128 * 1024, 1024 * 1024, 16 * 1024 * 1024, 128 * 1024 * 1024)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe registry of counters and histograms.
+
+    Renders the Prometheus text exposition format, so the service needs no
+    client library to be scraped.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        """Register the TYPE and HELP lines of a metric."""
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        """Increase a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Record one observation in a histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self, gauges=None):
+        """
+        Render every metric in the Prometheus text format.
+
+        Args:
+            gauges (dict or None): Extra {name: value} or {name: {labels_tuple: value}} gauges
+
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        seen = set()
+
+        def header(name, default_kind):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, help_text = self._help.get(name, (default_kind, name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, dict(value, counts=list(value["counts"]))) for key, value in self._histograms.items()
+            )
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                bucket_labels = labels + (("le", _format_value(float(bound))),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        for name, value in (gauges or {}).items():
+            header(name, "gauge")
+            samples = value.items() if isinstance(value, dict) else [((), value)]
+            for labels, sample in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(sample)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+registry.describe("chatbot_stage_seconds", "histogram", "Latency of each chatbot pipeline stage")
+registry.describe("chatbot_request_seconds", "histogram", "End-to-end latency of a chatbot request")
+registry.describe("chatbot_result_rows", "histogram", "Rows returned by executed queries")
+registry.describe("chatbot_result_bytes", "histogram", "Approximate in-memory size of query results")
+registry.describe("chatbot_cache_requests_total", "counter", "Cache lookups by cache and outcome")
+registry.describe("gemini_retries_total", "counter", "Gemini requests retried after a rate limit error")
+registry.describe("gemini_errors_total", "counter", "Gemini requests that failed")
+registry.describe(
+    "chatbot_deadline_exceeded_total", "counter",
+    "Requests abandoned because their deadline passed (expired) or too little time was left (shed)",
+)
+registry.describe("chatbot_cache_entries", "gauge", "Entries held by each cache")
+registry.describe("chatbot_cache_hit_ratio", "gauge", "Hit ratio of each cache since start")
+registry.describe("chatbot_db_pool_open_connections", "gauge", "Open SQLite connections in the pool")
+registry.describe("chatbot_db_pool_idle_connections", "gauge", "Idle SQLite connections in the pool")
+registry.describe("chatbot_db_pool_wait_seconds_total", "gauge", "Seconds spent waiting for a pooled connection")
+registry.describe("chatbot_db_pool_timeouts", "gauge", "Connection checkouts that timed out")
+registry.describe("chatbot_intent_gate_short_circuit_ratio", "gauge", "Share of questions decided without the Orchestrator")
+registry.describe("gemini_tokens", "gauge", "Gemini tokens used per agent and direction")
+registry.describe("gemini_cost_usd", "gauge", "Estimated Gemini cost per agent in USD")
+registry.describe("chatbot_query_governor", "gauge", "Queries rejected or interrupted by the cost governor")
+registry.describe("gemini_rate_limiter_waiting", "gauge", "Gemini calls waiting for quota")
+registry.describe("gemini_rate_limiter_requests", "gauge", "Gemini calls by rate limiter outcome")
+registry.describe("chatbot_summary_tables", "gauge", "Summary table refreshes, full rebuilds and query rewrites")
+registry.describe("chatbot_stage_expected_seconds", "gauge", "Recent average stage duration used to shed requests near their deadline")
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+stage_listeners = []
+
+class RequestTrace:
+    """Per-request record of stage durations and attributes."""
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = round(self.stages.get(stage, 0.0) + seconds, 6)
+
+    def set(self, key, value):
+        with self._lock:
+            self.attributes[key] = value
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+def record_stage(name, seconds):
+    """Record a stage duration measured by the caller."""
+    registry.observe("chatbot_stage_seconds", seconds, stage=name)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+    for listener in stage_listeners:
+        listener(name, seconds)
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage into chatbot_stage_seconds and the current trace.
+
+    Args:
+        name (str): Stage name used as the "stage" label
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def annotate(key, value):
+    """Attach an attribute (row count, cache outcome, ...) to the current trace."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.set(key, value)
+
+def tally(key, amount=1):
+    """Add to a numeric attribute of the current trace."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(key, amount)
+
+def record_cache(cache, outcome):
+    """Count a cache lookup and note its outcome on the current trace."""
+    registry.inc("chatbot_cache_requests_total", cache=cache, outcome=outcome)
+    annotate(f"{cache}_cache", outcome)
+
+@contextmanager
+def trace_request(name="chat", slow_threshold=5.0, sample_rate=1.0):
+    """
+    Trace one request end to end and log its stage breakdown when it is slow.
+
+    Args:
+        name (str): Request kind used as the "endpoint" label
+        slow_threshold (float): Seconds above which the request is logged
+        sample_rate (float): Fraction of slow requests that are logged
+
+    Yields:
+        RequestTrace: The active trace
+    """
+    trace = RequestTrace(name)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+        elapsed = time.perf_counter() - trace.started
+        registry.observe("chatbot_request_seconds", elapsed, endpoint=name)
+        if elapsed >= slow_threshold and random.random() < sample_rate:
+            record = {"endpoint": name, "seconds": round(elapsed, 4), "stages": trace.stages, **trace.attributes}
+            print(f"🐢 Slow request: {json.dumps(record, ensure_ascii=False, default=str)}")
@@ -0,0 +1,231 @@
+"""
+Synthetic scale-up of the Northwind database.
+
+Copies Northwind.db and appends synthetic rows until OrderDetails holds
+the requested number of rows. New rows are drawn from the distributions of
+the original data: lines per order, quantities, product popularity,
+customer activity, employee and shipper shares, countries and prices.
+Customers grow with the square root of the order volume and the catalog
+(products, suppliers, employees) with its fourth root, so large scales get
+realistic fan-out instead of a few customers with millions of orders. Every
+foreign key points at an existing row, and order dates increase with
+OrderID over the requested number of years:
+
+    python northwind_scale.py --order-details 1000000 --output scale_data/northwind_1000000.db
+"""
+import os
+import sys
+import math
+import random
+import sqlite3
+import argparse
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, timedelta
+from itertools import accumulate
+
+APPLICATION_TABLES = ("users", "query_history")
+CUSTOMER_GROWTH = 0.5
+CATALOG_GROWTH = 0.25
+CHUNK_ROWS = 200_000
+
+def scaled_count(source_count, factor, exponent):
+    """Number of rows a dimension table gets when the order volume grows by factor."""
+    return max(source_count, int(round(source_count * factor ** exponent)))
+
+def _rows(conn, table):
+    cursor = conn.execute(f"SELECT * FROM {table} ORDER BY 1")
+    return [d[0] for d in cursor.description], cursor.fetchall()
+
+def _cum_weights(counter, ids):
+    return list(accumulate(counter.get(i, 0) + 1 for i in ids))
+
+def _copy_schema(source, target):
+    tables = []
+    for name, sql in source.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql IS NOT NULL"
+    ):
+        target.execute(sql)
+        tables.append(name)
+    for (sql,) in source.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"):
+        target.execute(sql)
+    return tables
+
+def _insert(target, table, columns, rows):
+    placeholders = ", ".join("?" for _ in columns)
+    target.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+def _extend(target, table, columns, rows, count, make_row):
+    """Append rows built from the original rows (used as templates) until the table has count rows."""
+    next_id = max(r[0] for r in rows) + 1
+    added = [make_row(next_id + i, rows[i % len(rows)]) for i in range(count - len(rows))]
+    _insert(target, table, columns, added)
+    return list(range(1, next_id)) + [row[0] for row in added]
+
+def generate(source_path, target_path, order_details, years=5.0, seed=0, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    Write a scaled copy of a Northwind database.
+
+    Args:
+        source_path (str): Original Northwind database
+        target_path (str): Database to create (must not exist)
+        order_details (int): Rows wanted in OrderDetails (at least the original count)
+        years (float): Span of the synthetic order dates after the last original order
+        seed (int): Random seed; the same arguments always produce the same database
+        chunk_rows (int): OrderDetails rows generated and inserted per batch
+        progress (callable or None): Called with (rows_written, rows_wanted) after each batch
+
+    Returns:
+        dict: Row count per table and seconds taken
+
+    Raises:
+        ValueError: If order_details is smaller than the original table or the target exists
+    """
+    if os.path.exists(target_path):
+        raise ValueError(f"{target_path} already exists")
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    target = sqlite3.connect(target_path)
+    try:
+        base_details = source.execute("SELECT COUNT(*) FROM OrderDetails").fetchone()[0]
+        if order_details < base_details:
+            raise ValueError(f"order_details must be at least {base_details} (the original row count)")
+        target.execute("PRAGMA journal_mode = OFF")
+        target.execute("PRAGMA synchronous = OFF")
+        target.execute("PRAGMA cache_size = -262144")
+        tables = _copy_schema(source, target)
+        original = {}
+        for table in tables:
+            if table in APPLICATION_TABLES:
+                continue
+            original[table] = _rows(source, table)
+            _insert(target, table, *original[table])
+
+        orders_cols, orders = original["Orders"]
+        details_cols, details = original["OrderDetails"]
+        factor = order_details / base_details
+
+        employee_ids = _extend(
+            target, "Employees", *original["Employees"],
+            scaled_count(len(original["Employees"][1]), factor, CATALOG_GROWTH),
+            lambda new_id, t: (new_id,) + t[1:],
+        )
+        supplier_ids = _extend(
+            target, "Suppliers", *original["Suppliers"],
+            scaled_count(len(original["Suppliers"][1]), factor, CATALOG_GROWTH),
+            lambda new_id, t: (new_id, f"{t[1]} {new_id}") + t[2:],
+        )
+        customer_ids = _extend(
+            target, "Customers", *original["Customers"],
+            scaled_count(len(original["Customers"][1]), factor, CUSTOMER_GROWTH),
+            lambda new_id, t: (new_id, f"{t[1]} {new_id}") + t[2:],
+        )
+        products_cols, products = original["Products"]
+        price_at = products_cols.index("Price")
+        supplier_at = products_cols.index("SupplierID")
+
+        def product_row(new_id, t):
+            row = list(t)
+            row[0], row[1] = new_id, f"{t[1]} {new_id}"
+            row[supplier_at] = rng.choice(supplier_ids)
+            row[price_at] = round(float(t[price_at] or 0) * rng.lognormvariate(0, 0.3), 2)
+            return tuple(row)
+        product_ids = _extend(
+            target, "Products", products_cols, products,
+            scaled_count(len(products), factor, CATALOG_GROWTH), product_row,
+        )
+        template_of = {pid: products[(pid - 1) % len(products)][0] for pid in product_ids}
+        customer_templates = original["Customers"][1]
+
+        # Empirical distributions of the original data
+        o_customer, o_employee, o_date, o_shipper = (orders_cols.index(c) for c in ("CustomerID", "EmployeeID", "OrderDate", "ShipperID"))
+        d_order, d_product, d_quantity = (details_cols.index(c) for c in ("OrderID", "ProductID", "Quantity"))
+        lines_per_order = list(Counter(row[d_order] for row in details).values())
+        quantities = [row[d_quantity] for row in details]
+        product_popularity = Counter(row[d_product] for row in details)
+        customer_activity = Counter(row[o_customer] for row in orders)
+        product_weights = _cum_weights({pid: product_popularity.get(template_of[pid], 0) for pid in product_ids}, product_ids)
+        customer_weights = _cum_weights(
+            {cid: customer_activity.get(customer_templates[(cid - 1) % len(customer_templates)][0], 0) for cid in customer_ids},
+            customer_ids,
+        )
+        employee_weights = _cum_weights(Counter(row[o_employee] for row in orders), employee_ids)
+        shipper_ids = [row[0] for row in original["Shippers"][1]]
+        shipper_weights = _cum_weights(Counter(row[o_shipper] for row in orders), shipper_ids)
+
+        last_date = date.fromisoformat(max(str(row[o_date])[:10] for row in orders))
+        wanted = order_details - base_details
+        expected_orders = max(1, math.ceil(wanted / (sum(lines_per_order) / len(lines_per_order))))
+        span_days = max(1, int(years * 365.25))
+        next_order = max(row[0] for row in orders) + 1
+        next_detail = max(row[0] for row in details) + 1
+        written = 0
+        synthetic_orders = 0
+        while written < wanted:
+            batch_orders = []
+            batch_details = []
+            batch = min(chunk_rows, wanted - written)
+            while len(batch_details) < batch:
+                lines = min(rng.choice(lines_per_order), batch - len(batch_details))
+                day = min(span_days, 1 + synthetic_orders * span_days // expected_orders)
+                batch_orders.append((
+                    next_order,
+                    customer_ids[bisect_left(customer_weights, rng.random() * customer_weights[-1])],
+                    employee_ids[bisect_left(employee_weights, rng.random() * employee_weights[-1])],
+                    (last_date + timedelta(days=day)).isoformat(),
+                    shipper_ids[bisect_left(shipper_weights, rng.random() * shipper_weights[-1])],
+                ))
+                for product_id in rng.choices(product_ids, cum_weights=product_weights, k=lines):
+                    batch_details.append((next_detail, next_order, product_id, rng.choice(quantities)))
+                    next_detail += 1
+                next_order += 1
+                synthetic_orders += 1
+            _insert(target, "Orders", ("OrderID", "CustomerID", "EmployeeID", "OrderDate", "ShipperID"), batch_orders)
+            _insert(target, "OrderDetails", ("OrderDetailID", "OrderID", "ProductID", "Quantity"), batch_details)
+            target.commit()
+            written += len(batch_details)
+            if progress is not None:
+                progress(base_details + written, order_details)
+        target.commit()
+        target.execute("PRAGMA journal_mode = DELETE")
+        counts = {
+            table: target.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in tables if table not in APPLICATION_TABLES
+        }
+    except BaseException:
+        target.close()
+        source.close()
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        raise
+    target.close()
+    source.close()
+    return {"path": target_path, "tables": counts, "seconds": round(time.perf_counter() - started, 2)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a scaled-up Northwind database.")
+    parser.add_argument("--source", default=os.getenv("DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Northwind.db"))
+    parser.add_argument("--order-details", type=int, required=True, help="Rows wanted in OrderDetails")
+    parser.add_argument("--output", required=True, help="Database file to create")
+    parser.add_argument("--years", type=float, default=5.0, help="Span of the synthetic order dates")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f"\r⏳ OrderDetails {done:,}/{total:,} ({done * 100 // total}%)", end="", flush=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    try:
+        report = generate(args.source, args.output, args.order_details, args.years, args.seed, progress=progress)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"\n✅ {report['path']} written in {report['seconds']}s")
+    for table, count in report["tables"].items():
+        print(f"  {table:<16}{count:>14,}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
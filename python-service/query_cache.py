@@ -0,0 +1,693 @@
+import os
+import sys
+import json
+import sqlite3
+import time
+import marshal
+import hashlib
+import threading
+import unicodedata
+import re
+from collections import OrderedDict
+from db_pool import readonly_uri
+from csv_export import ResultRows
+
+def normalize_question(text):
+    """
+    Normalize a question so that trivially different phrasings share a cache key.
+
+    Lowercases, drops punctuation and collapses whitespace. Turkish
+    dotted/dotless i are folded to a plain "i".
+
+    Args:
+        text (str): Sanitized user question
+
+    Returns:
+        str: Normalized question
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    text = text.replace("İ", "i").replace("ı", "i").lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def schema_fingerprint(schema_text):
+    """
+    Return a short, stable hash of the schema text.
+
+    Args:
+        schema_text (str): Schema description given to the agents
+
+    Returns:
+        str: Hex digest
+    """
+    return hashlib.sha256((schema_text or "").encode("utf-8")).hexdigest()[:16]
+
+class SQLCache:
+    """
+    Bounded LRU + TTL cache mapping normalized questions to generated SQL.
+
+    Keys combine the normalized question with a schema fingerprint so that a
+    schema change never serves SQL written against the old schema.
+    """
+    def __init__(self, max_entries=512, ttl_seconds=3600, persist_path=None, shared=None):
+        """
+        Args:
+            max_entries (int): Maximum number of cached questions
+            ttl_seconds (float): Entry lifetime in seconds (0 disables expiry)
+            persist_path (str or None): JSON file used to survive restarts
+            shared (SharedCacheStore or None): Second level shared with the other worker processes
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    def make_key(self, question, schema_text):
+        """Build the cache key for a question under a given schema."""
+        return f"{schema_fingerprint(schema_text)}:{normalize_question(question)}"
+
+    def get(self, key):
+        """
+        Look up cached SQL.
+
+        Args:
+            key (str): Key from make_key()
+
+        Returns:
+            str or None: Cached SQL query, or None on miss/expiry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                sql_query, stored_at = entry
+                if self.ttl_seconds and time.time() - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return sql_query
+        shared_entry = self.shared.get_sql(key, self.ttl_seconds) if self.shared is not None else None
+        with self._lock:
+            if shared_entry is None:
+                self.misses += 1
+                return None
+            sql_query, stored_at = shared_entry
+            self._store(key, sql_query, stored_at)
+            self.hits += 1
+            self.shared_hits += 1
+            return sql_query
+
+    def put(self, key, sql_query):
+        """
+        Store generated SQL, evicting the least recently used entries.
+
+        Args:
+            key (str): Key from make_key()
+            sql_query (str): SQL produced by the SQL Agent
+        """
+        stored_at = time.time()
+        with self._lock:
+            self._store(key, sql_query, stored_at)
+        if self.shared is not None:
+            self.shared.put_sql(key, sql_query, stored_at)
+        self._save()
+
+    def _store(self, key, sql_query, stored_at):
+        self._entries[key] = (sql_query, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached entry (including the shared copies)."""
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear("sql_cache")
+        self._save()
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: size, hits, misses, evictions and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            now = time.time()
+            for key, sql_query, stored_at in stored:
+                if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                    continue
+                self._entries[key] = (sql_query, stored_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        except Exception as e:
+            print(f"⚠ SQL cache could not be loaded: {e}")
+
+    def _save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            snapshot = [[key, sql_query, stored_at] for key, (sql_query, stored_at) in self._entries.items()]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with self._save_lock:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"⚠ SQL cache could not be saved: {e}")
+
+def canonicalize_sql(sql_query):
+    """
+    Canonicalize SQL text so that formatting-only differences share a cache key.
+
+    Comments are removed, whitespace outside string literals is collapsed and
+    trailing semicolons are dropped. Literal contents are left untouched.
+
+    Args:
+        sql_query (str): SQL query
+
+    Returns:
+        str: Canonical SQL text
+    """
+    sql_query = re.sub(r'/\*.*?\*/', ' ', sql_query or "", flags=re.DOTALL)
+    parts = re.split(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")", sql_query)
+    canonical = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            canonical.append(part)
+        else:
+            part = re.sub(r'--[^\n]*', ' ', part)
+            canonical.append(re.sub(r'\s+', ' ', part))
+    return "".join(canonical).strip().rstrip(";").strip()
+
+def estimate_result_bytes(results, column_names):
+    """
+    Roughly estimate the in-memory footprint of a result set.
+
+    Args:
+        results (list): Result tuples
+        column_names (list): Column names
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    size = sys.getsizeof(results) + sum(sys.getsizeof(c) for c in column_names or [])
+    for row in results or []:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return size
+
+def portable_version(version):
+    """
+    Drop the connection-specific part of a DatabaseVersionWatcher token.
+
+    data_version is only comparable on the connection that read it, so values
+    shared with other processes are keyed by the file path and stat fields.
+
+    Args:
+        version (tuple): DatabaseVersionWatcher token
+
+    Returns:
+        tuple: (db_path, mtime_ns, size, wal_mtime_ns, wal_size)
+    """
+    return (version[0],) + tuple(version[2:])
+
+class DatabaseVersionWatcher:
+    """
+    Cheaply detect whether the SQLite database has changed.
+
+    PRAGMA data_version only changes for commits made by *other*
+    connections, so the watcher keeps one long-lived connection open and
+    combines its data_version with the mtime and size of the file and of
+    its WAL (which is where commits land in WAL mode).
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def switch(self, db_path):
+        """Start watching another database file."""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self.db_path = db_path
+
+    def token(self):
+        """
+        Return a value that changes whenever the database content may have changed.
+
+        Returns:
+            tuple: (db_path, data_version, mtime_ns, size, wal_mtime_ns, wal_size)
+        """
+        try:
+            stat = os.stat(self.db_path)
+        except (OSError, TypeError):
+            return (self.db_path, None, None, None, None, None)
+        try:
+            wal = os.stat(f"{self.db_path}-wal")
+            wal_stat = (wal.st_mtime_ns, wal.st_size)
+        except OSError:
+            wal_stat = (None, None)
+        with self._lock:
+            if self._pid != os.getpid():
+                # A connection inherited from the parent process must not be used after fork
+                self._conn = None
+                self._pid = os.getpid()
+            try:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(readonly_uri(self.db_path), uri=True, check_same_thread=False)
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                self._conn = None
+                data_version = None
+        return (self.db_path, data_version, stat.st_mtime_ns, stat.st_size) + wal_stat
+
+class MultiDatabaseVersionWatcher:
+    """
+    Version token over several database files, e.g. the shards of a partitioned database.
+
+    The token has the shape of a DatabaseVersionWatcher token with a tuple
+    of per-file values in each position, so portable_version() applies.
+    """
+    def __init__(self, db_paths):
+        self.watchers = [DatabaseVersionWatcher(path) for path in db_paths]
+
+    @property
+    def db_path(self):
+        return tuple(watcher.db_path for watcher in self.watchers)
+
+    def switch(self, db_path):
+        """Watching a single file is not supported; shards are fixed by their manifest."""
+        raise ValueError("The shard files are fixed by the shard manifest")
+
+    def token(self):
+        """
+        Return a value that changes whenever any of the databases may have changed.
+
+        Returns:
+            tuple: (db_paths, data_versions, mtimes_ns, sizes, wal_mtimes_ns, wal_sizes)
+        """
+        return tuple(zip(*(watcher.token() for watcher in self.watchers)))
+
+class ServedDatabase:
+    """
+    File in the shared state directory naming the database every worker serves.
+
+    A database switch (e.g. to an index-optimized copy) happens in the worker
+    that handled the request; it records the new path here and the other
+    workers pick it up the next time they check the database version (a
+    rebuild of the same path is picked up too, reopening connections). The
+    record only applies to workers configured with the same source DB_PATH,
+    so changing DB_PATH and restarting ignores a stale record.
+    """
+    def __init__(self, path, source_path):
+        """
+        Args:
+            path (str): JSON file holding the record
+            source_path (str): DB_PATH this process was configured with
+        """
+        self.path = path
+        self.source_path = os.path.abspath(source_path)
+        self._seen = None
+        self._lock = threading.Lock()
+
+    def record(self, db_path):
+        """Make db_path the database every worker serves."""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"source": self.source_path, "db_path": os.path.abspath(db_path)}, f)
+            os.replace(tmp_path, self.path)
+            stat = os.stat(self.path)
+            with self._lock:
+                # This process already serves it; changed() only reports records made elsewhere
+                self._seen = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            print(f"⚠ Served database could not be recorded: {e}")
+
+    def changed(self):
+        """
+        Return the recorded database if the record changed since the last call.
+
+        Returns:
+            str or None: Path of the database to serve, or None if nothing new was recorded
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key == self._seen:
+                return None
+            self._seen = key
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("source") != self.source_path:
+            return None
+        return record.get("db_path")
+
+class ResultCache:
+    """
+    LRU cache of query results bounded by total (estimated) bytes.
+
+    Each entry remembers the database version token it was computed under
+    and is discarded as soon as the token changes.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, shared=None):
+        """
+        Args:
+            max_bytes (int): Upper bound on the summed size of cached results
+            shared (SharedCacheStore or None): Second level shared with the other worker processes
+        """
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, sql_query, version):
+        """
+        Look up a cached result.
+
+        Args:
+            sql_query (str): SQL query (canonicalized internally)
+            version (tuple): Current DatabaseVersionWatcher token
+
+        Returns:
+            tuple or None: (results, column_names, csv_path) or None on miss
+        """
+        key = canonicalize_sql(sql_query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                results, column_names, csv_path, entry_version, size = entry
+                if entry_version == version and not (csv_path and not os.path.exists(csv_path)):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return results, column_names, csv_path
+                del self._entries[key]
+                self.total_bytes -= size
+                self.invalidations += 1
+        shared_entry = self.shared.get_result(key, portable_version(version)) if self.shared is not None else None
+        if shared_entry is not None and shared_entry[2] and not os.path.exists(shared_entry[2]):
+            shared_entry = None
+        with self._lock:
+            if shared_entry is None:
+                self.misses += 1
+                return None
+            results, column_names, csv_path = shared_entry
+            self._store(key, results, column_names, csv_path, version, estimate_result_bytes(results, column_names))
+            self.hits += 1
+            self.shared_hits += 1
+            return results, column_names, csv_path
+
+    def put(self, sql_query, version, results, column_names, csv_path):
+        """
+        Store a query result together with its exported CSV path.
+
+        Results larger than the whole budget are not cached.
+
+        Args:
+            sql_query (str): SQL query (canonicalized internally)
+            version (tuple): DatabaseVersionWatcher token the result was read under
+            results (list): Result tuples
+            column_names (list): Column names
+            csv_path (str or None): Path of the CSV written for this result
+
+        Returns:
+            int: Estimated size of the result in bytes
+        """
+        size = estimate_result_bytes(results, column_names)
+        if size > self.max_bytes:
+            return size
+        key = canonicalize_sql(sql_query)
+        with self._lock:
+            self._store(key, results, column_names, csv_path, version, size)
+        if self.shared is not None:
+            self.shared.put_result(key, portable_version(version), results, column_names, csv_path)
+        return size
+
+    def _store(self, key, results, column_names, csv_path, version, size):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[4]
+        self._entries[key] = (results, column_names, csv_path, version, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted[4]
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached result held by this process."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: size, bytes, hits, misses, evictions, invalidations and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+class SharedCacheStore:
+    """
+    SQLite (WAL) file that lets worker processes share the SQL and result caches.
+
+    Every process keeps its in-memory LRU as the first level; misses fall
+    through to this store and new entries are written through to it, so a
+    worker that just started serves what the others already computed.
+    Result rows are stored with marshal, which round-trips tuples, bytes and
+    floats exactly. Storage errors are reported and treated as misses.
+    """
+    def __init__(self, path, max_sql_entries=512, max_result_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            path (str): SQLite file shared by the workers
+            max_sql_entries (int): Maximum number of shared SQL entries
+            max_result_bytes (int): Upper bound on the summed size of shared results
+        """
+        self.path = path
+        self.max_sql_entries = max_sql_entries
+        self.max_result_bytes = max_result_bytes
+        self._local = threading.local()
+        self._created = False
+        self._create_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self._create()
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _create(self):
+        if self._created:
+            return
+        with self._create_lock:
+            if self._created:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self._open()
+            try:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS sql_cache (key TEXT PRIMARY KEY, sql TEXT, stored_at REAL, used_at REAL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_used ON sql_cache (used_at)")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS result_cache (key TEXT PRIMARY KEY, version TEXT, payload BLOB, "
+                        "size INTEGER, used_at REAL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS result_cache_used ON result_cache (used_at)")
+            finally:
+                conn.close()
+            self._created = True
+
+    def get_sql(self, key, ttl_seconds=0):
+        """
+        Look up shared SQL.
+
+        Returns:
+            tuple or None: (sql_query, stored_at), or None on miss/expiry
+        """
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT sql, stored_at FROM sql_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if ttl_seconds and time.time() - row[1] > ttl_seconds:
+                with conn:
+                    conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                return None
+            with conn:
+                conn.execute("UPDATE sql_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+            return row[0], row[1]
+        except sqlite3.Error as e:
+            print(f"⚠ Shared cache read failed: {e}")
+            return None
+
+    def put_sql(self, key, sql_query, stored_at):
+        """Store SQL for the other workers, evicting the least recently used entries."""
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?, ?)", (key, sql_query, stored_at, time.time())
+                )
+                conn.execute(
+                    "DELETE FROM sql_cache WHERE key IN "
+                    "(SELECT key FROM sql_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sql_entries,),
+                )
+        except sqlite3.Error as e:
+            print(f"⚠ Shared cache write failed: {e}")
+
+    def get_result(self, key, version):
+        """
+        Look up a shared result computed under the same database version.
+
+        Args:
+            key (str): Canonical SQL
+            version (tuple): Portable database version (see portable_version())
+
+        Returns:
+            tuple or None: (ResultRows, column_names, csv_path) or None on miss
+        """
+        version_key = json.dumps(version)
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT version, payload FROM result_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] != version_key:
+                with conn:
+                    conn.execute("DELETE FROM result_cache WHERE key = ? AND version = ?", (key, row[0]))
+                return None
+            with conn:
+                conn.execute("UPDATE result_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+            rows, column_names, csv_path, total_rows, capped = marshal.loads(row[1])
+            return ResultRows(rows, total_rows, csv_path, capped), column_names, csv_path
+        except (sqlite3.Error, ValueError, EOFError, TypeError) as e:
+            print(f"⚠ Shared cache read failed: {e}")
+            return None
+
+    def put_result(self, key, version, results, column_names, csv_path):
+        """Store a result for the other workers, evicting the least recently used ones over the byte budget."""
+        try:
+            payload = marshal.dumps((
+                [tuple(row) for row in results], list(column_names), csv_path,
+                getattr(results, "total_rows", len(results)), bool(getattr(results, "capped", False)),
+            ))
+        except ValueError:
+            return
+        if len(payload) > self.max_result_bytes:
+            return
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, json.dumps(version), payload, len(payload), time.time()),
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM result_cache").fetchone()[0]
+                if total > self.max_result_bytes:
+                    evict = []
+                    for old_key, size in conn.execute("SELECT key, size FROM result_cache ORDER BY used_at"):
+                        if total <= self.max_result_bytes:
+                            break
+                        evict.append((old_key,))
+                        total -= size
+                    conn.executemany("DELETE FROM result_cache WHERE key = ?", evict)
+        except sqlite3.Error as e:
+            print(f"⚠ Shared cache write failed: {e}")
+
+    def clear(self, table):
+        """Drop every shared entry of one cache ("sql_cache" or "result_cache")."""
+        if table not in ("sql_cache", "result_cache"):
+            raise ValueError(f"Unknown shared cache table: {table}")
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(f"DELETE FROM {table}")
+        except sqlite3.Error as e:
+            print(f"⚠ Shared cache could not be cleared: {e}")
+
+    def stats(self):
+        """
+        Return the number and size of shared entries.
+
+        Returns:
+            dict: path, sql_entries, result_entries and result_bytes
+        """
+        try:
+            conn = self._connection()
+            sql_entries = conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+            result_entries, result_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM result_cache"
+            ).fetchone()
+        except sqlite3.Error as e:
+            return {"path": self.path, "error": str(e)}
+        return {"path": self.path, "sql_entries": sql_entries, "result_entries": result_entries, "result_bytes": result_bytes}
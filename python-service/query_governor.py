@@ -0,0 +1,201 @@
+import re
+import time
+import sqlite3
+import threading
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+import deadlines
+
+PlanReport = namedtuple("PlanReport", ["allowed", "reason", "warnings", "estimated_rows", "plan"])
+
+_NOT_ALIASES = (
+    "ON", "USING", "WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL",
+    "GROUP", "ORDER", "HAVING", "LIMIT", "UNION", "EXCEPT", "INTERSECT", "FROM", "WINDOW",
+)
+_TABLE_REFERENCE = re.compile(
+    rf"(?:\bFROM|\bJOIN|,)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:{'|'.join(_NOT_ALIASES)})\b)(\w+))?",
+    re.IGNORECASE,
+)
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$")
+
+class QueryInterrupted(Exception):
+    """Raised when a query exceeds its time or VM-step budget."""
+
+def table_aliases(sql_query):
+    """
+    Map the aliases used in FROM/JOIN clauses to table names.
+
+    Args:
+        sql_query (str): SQL query
+
+    Returns:
+        dict: {alias_or_table_lowercase: table}
+    """
+    aliases = {}
+    for table, alias in _TABLE_REFERENCE.findall(sql_query or ""):
+        if table.upper() == "SELECT":
+            continue
+        aliases.setdefault(table.lower(), table)
+        if alias:
+            aliases[alias.lower()] = table
+    return aliases
+
+class ExecutionBudget:
+    """Progress handler state for one query; records why it was interrupted."""
+    def __init__(self, max_seconds, max_vm_steps, interval, request_deadline=None):
+        self.deadline = time.monotonic() + max_seconds if max_seconds else None
+        self.max_vm_steps = max_vm_steps
+        self.interval = interval
+        self.request_deadline = request_deadline
+        self.steps = 0
+        self.reason = None
+        self.deadline_passed = False
+
+    def __call__(self):
+        self.steps += self.interval
+        if self.max_vm_steps and self.steps > self.max_vm_steps:
+            self.reason = f"the query exceeded the limit of {self.max_vm_steps:,} VM steps"
+            return 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.reason = "the query exceeded its time budget"
+            return 1
+        if self.request_deadline is not None and self.request_deadline.expired():
+            self.reason = "the request deadline passed"
+            self.deadline_passed = True
+            return 1
+        return 0
+
+class QueryGovernor:
+    """
+    Inspect and bound generated queries before and while they run.
+
+    EXPLAIN QUERY PLAN is used to estimate how many rows the nested loops
+    of a query will visit from the sizes of fully scanned tables; queries
+    above max_plan_rows (typically unconstrained cross joins) are rejected
+    before execution. Running queries are interrupted by a progress handler
+    once they exceed their wall-clock or VM-step budget.
+    """
+    def __init__(self, max_plan_rows=10_000_000, full_scan_warn_rows=100_000, max_seconds=10.0,
+                 max_vm_steps=0, progress_interval=10_000):
+        """
+        Args:
+            max_plan_rows (int): Estimated visited rows above which a query is rejected (0 disables)
+            full_scan_warn_rows (int): Table size above which a full scan is reported as a warning
+            max_seconds (float): Wall-clock budget per query (0 disables)
+            max_vm_steps (int): SQLite VM instruction budget per query (0 disables)
+            progress_interval (int): VM instructions between progress handler calls
+        """
+        self.max_plan_rows = max_plan_rows
+        self.full_scan_warn_rows = full_scan_warn_rows
+        self.max_seconds = max_seconds
+        self.max_vm_steps = max_vm_steps
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+        # Table sizes per version token; shards and the union of shards each have their own
+        self._table_rows = OrderedDict()
+        self.max_cached_versions = 64
+        self.rejected = 0
+        self.interrupted = 0
+
+    def _row_count(self, conn, table, version):
+        with self._lock:
+            counts = self._table_rows.get(version)
+            if counts is None:
+                counts = self._table_rows[version] = {}
+                while len(self._table_rows) > self.max_cached_versions:
+                    self._table_rows.popitem(last=False)
+            if table in counts:
+                return counts[table]
+        try:
+            rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        except sqlite3.Error:
+            rows = None
+        with self._lock:
+            counts[table] = rows
+        return rows
+
+    def check_plan(self, conn, sql_query, version=None):
+        """
+        Estimate the cost of a query from its plan and decide whether to run it.
+
+        Args:
+            conn (sqlite3.Connection): Connection the query will run on
+            sql_query (str): SQL query
+            version (hashable): Database version token; table sizes are cached per version
+
+        Returns:
+            PlanReport: (allowed, reason, warnings, estimated_rows, plan)
+        """
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql_query.rstrip().rstrip(';')}").fetchall()
+        aliases = table_aliases(sql_query)
+        warnings = []
+        loops = {}
+        for node_id, parent_id, _, detail in plan:
+            match = _SCAN.match(detail)
+            if not match:
+                continue
+            name, alias, rest = match.groups()
+            if "INDEX" in rest:
+                continue
+            table = aliases.get((alias or name).lower(), name)
+            rows = self._row_count(conn, table, version)
+            if rows is None:
+                continue
+            if self.full_scan_warn_rows and rows > self.full_scan_warn_rows:
+                warnings.append(f"full scan of {table} ({rows:,} rows)")
+            loops.setdefault(parent_id, []).append(rows)
+        estimated_rows = 0
+        for scanned in loops.values():
+            product = 1
+            for rows in scanned:
+                product *= max(rows, 1)
+            estimated_rows = max(estimated_rows, product)
+        if self.max_plan_rows and estimated_rows > self.max_plan_rows:
+            with self._lock:
+                self.rejected += 1
+            kind = "a cartesian product" if any(len(scanned) > 1 for scanned in loops.values()) else "a full scan"
+            reason = f"the query plan contains {kind} visiting about {estimated_rows:,} rows"
+            return PlanReport(False, reason, warnings, estimated_rows, plan)
+        return PlanReport(True, None, warnings, estimated_rows, plan)
+
+    @contextmanager
+    def budget(self, conn, request_deadline=None):
+        """
+        Enforce the time and VM-step budget on a connection for the duration of the block.
+
+        Args:
+            conn (sqlite3.Connection): Connection the query runs on
+            request_deadline (deadlines.Deadline or None): Deadline of the request (defaults to the current one)
+
+        Raises:
+            QueryInterrupted: If SQLite interrupted the query because the budget ran out
+            deadlines.DeadlineExceeded: If SQLite interrupted the query because the request deadline passed
+        """
+        request_deadline = request_deadline or deadlines.current()
+        if not self.max_seconds and not self.max_vm_steps and request_deadline is None:
+            yield None
+            return
+        execution_budget = ExecutionBudget(self.max_seconds, self.max_vm_steps, self.progress_interval, request_deadline)
+        conn.set_progress_handler(execution_budget, self.progress_interval)
+        try:
+            yield execution_budget
+        except sqlite3.OperationalError as e:
+            if execution_budget.deadline_passed and "interrupt" in str(e).lower():
+                raise deadlines.expired("sql_execution") from e
+            if execution_budget.reason and "interrupt" in str(e).lower():
+                with self._lock:
+                    self.interrupted += 1
+                raise QueryInterrupted(execution_budget.reason) from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def stats(self):
+        """
+        Return governor counters.
+
+        Returns:
+            dict: rejected and interrupted query counts
+        """
+        with self._lock:
+            return {"rejected": self.rejected, "interrupted": self.interrupted}
@@ -0,0 +1,251 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted within the wait timeout or the wait queue is full."""
+
+def _refill(state, now, rpm, tpm):
+    elapsed = max(0.0, now - state["updated"])
+    state["requests"] = min(float(rpm), state["requests"] + elapsed * rpm / 60.0)
+    state["tokens"] = min(float(tpm), state["tokens"] + elapsed * tpm / 60.0)
+    state["updated"] = now
+
+class _MemoryState:
+    """Bucket state shared by the threads of one process."""
+    def __init__(self, rpm, tpm):
+        self._lock = threading.Lock()
+        self._state = {"requests": float(rpm), "tokens": float(tpm), "updated": time.time(), "blocked_until": 0.0}
+
+    def update(self, func):
+        with self._lock:
+            return func(self._state)
+
+class _SQLiteState:
+    """
+    Bucket state stored in a small SQLite file so several worker processes share one quota.
+
+    Every read-modify-write runs in a BEGIN IMMEDIATE transaction, which
+    serializes updates across processes.
+    """
+    def __init__(self, path, rpm, tpm):
+        # Nothing is opened here: the module-level limiter is built at import,
+        # before prefork workers exist, so the file is created on first use
+        self.path = path
+        self.rpm = rpm
+        self.tpm = tpm
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # Worker processes forked after startup open their own connection
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                    "requests REAL, tokens REAL, updated REAL, blocked_until REAL)"
+                )
+                conn.execute(
+                    "INSERT OR IGNORE INTO bucket VALUES (1, ?, ?, ?, 0)",
+                    (float(self.rpm), float(self.tpm), time.time()),
+                )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def update(self, func):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT requests, tokens, updated, blocked_until FROM bucket WHERE id = 1").fetchone()
+            state = dict(zip(("requests", "tokens", "updated", "blocked_until"), row))
+            result = func(state)
+            conn.execute(
+                "UPDATE bucket SET requests = ?, tokens = ?, updated = ?, blocked_until = ? WHERE id = 1",
+                (state["requests"], state["tokens"], state["updated"], state["blocked_until"]),
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and tokens per minute.
+
+    Callers wait in a bounded queue until both buckets have room, then take
+    one of max_concurrency slots. A 429 from upstream pauses every caller
+    (and, with a state_path, every worker) instead of each one retrying on
+    its own.
+    """
+    def __init__(self, rpm=60, tpm=1_000_000, max_concurrency=4, max_waiters=64, wait_timeout=30.0, state_path=None):
+        """
+        Args:
+            rpm (int): Requests allowed per minute
+            tpm (int): Tokens allowed per minute
+            max_concurrency (int): Requests in flight at once in this process
+            max_waiters (int): Callers allowed to queue before new ones are rejected
+            wait_timeout (float): Seconds a caller may wait for admission
+            state_path (str or None): SQLite file for sharing the buckets across processes
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self._state = _SQLiteState(state_path, rpm, tpm) if state_path else _MemoryState(rpm, tpm)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.wait_seconds_total = 0.0
+
+    def _try_take(self, tokens):
+        tokens = min(tokens, self.tpm)
+
+        def take(state):
+            now = time.time()
+            _refill(state, now, self.rpm, self.tpm)
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now
+            if state["requests"] >= 1 and state["tokens"] >= tokens:
+                state["requests"] -= 1
+                state["tokens"] -= tokens
+                return 0.0
+            request_wait = max(0.0, 1 - state["requests"]) * 60.0 / self.rpm
+            token_wait = max(0.0, tokens - state["tokens"]) * 60.0 / self.tpm
+            return max(request_wait, token_wait, 0.01)
+
+        return self._state.update(take)
+
+    @contextmanager
+    def slot(self, tokens=0, max_wait=None):
+        """
+        Wait for quota and a concurrency slot, and hold the slot for the block.
+
+        Args:
+            tokens (int): Estimated tokens the request will consume
+            max_wait (float or None): Seconds this caller may wait if less than wait_timeout (e.g. the time left before its deadline)
+
+        Raises:
+            RateLimitExceeded: If the queue is full or admission takes longer than wait_timeout (or max_wait)
+        """
+        started = time.monotonic()
+        wait_timeout = self.wait_timeout if max_wait is None else min(self.wait_timeout, max_wait)
+        deadline = started + wait_timeout
+        with self._lock:
+            if self._waiting >= self.max_waiters:
+                self.rejected += 1
+                raise RateLimitExceeded("Too many requests are waiting for the Gemini quota")
+            self._waiting += 1
+        try:
+            while True:
+                wait = self._try_take(tokens)
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    with self._lock:
+                        self.rejected += 1
+                    raise RateLimitExceeded(f"Gemini quota not available within {wait_timeout:.2f}s")
+                with self._lock:
+                    self.throttled += 1
+                time.sleep(wait)
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                with self._lock:
+                    self.rejected += 1
+                raise RateLimitExceeded(f"No Gemini request slot free within {wait_timeout:.2f}s")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self.wait_seconds_total += time.monotonic() - started
+        with self._lock:
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def consume(self, tokens):
+        """Charge tokens that were only known after the response (e.g. output tokens)."""
+        def charge(state):
+            _refill(state, time.time(), self.rpm, self.tpm)
+            state["tokens"] -= tokens
+        self._state.update(charge)
+
+    def pause(self, seconds):
+        """Stop admitting requests for the given time, e.g. after an upstream 429."""
+        def block(state):
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+        self._state.update(block)
+
+    def stats(self):
+        """
+        Return admission counters.
+
+        Returns:
+            dict: waiting, admitted, throttled, rejected and wait_seconds_total
+        """
+        with self._lock:
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+                "wait_seconds_total": self.wait_seconds_total,
+            }
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func, timeout=None):
+        """
+        Run func() once per key among concurrent callers.
+
+        Args:
+            key (hashable): Identity of the call
+            func (callable): Zero-argument function producing the result
+            timeout (float or None): Seconds a waiting caller waits for the running call
+
+        Returns:
+            Result of func()
+
+        Raises:
+            concurrent.futures.TimeoutError: If a waiting caller's timeout passed first
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(timeout)
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
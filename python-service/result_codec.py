@@ -0,0 +1,288 @@
+"""
+Compact encodings of query results for API clients.
+
+Columnar JSON lists the column names and types once and the values column
+by column:
+
+    {"columns": ["ProductName", "Price"], "types": ["text", "real"],
+     "rows": 2, "data": [["Chais", "Chang"], [18.0, 19.0]]}
+
+Types are SQLite storage classes (integer, real, text, blob, null) or
+"mixed" when a column holds several of them; blobs are base64 text.
+
+The binary encoding follows the Arrow columnar layout without depending on
+pyarrow: MAGIC, a little-endian uint32 header length, a JSON header padded
+to 8 bytes, then the column buffers, each starting on an 8-byte boundary.
+The header lists every column with its name, type and the (offset, length)
+of its buffers relative to the first buffer:
+
+    validity  bitmap, bit i (LSB first) set when row i is not NULL; absent without NULLs
+    values    integer: int64, real: float64 (NULL slots hold 0)
+              text, blob, mixed: the concatenated UTF-8 / raw / JSON values
+    offsets   text, blob, mixed: int32 start of each value plus the end, rows + 1 entries
+"""
+import json
+import gzip
+import base64
+import struct
+import sys
+from array import array
+from itertools import accumulate
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MAGIC = b"NLSQCOL1"
+BINARY_MIMETYPE = "application/vnd.database-assistant.columnar"
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain", "text/csv", BINARY_MIMETYPE)
+
+_KINDS = {int: "integer", bool: "integer", float: "real", str: "text", bytes: "blob", type(None): None}
+_ALIGNMENT = 8
+
+def column_type(values):
+    """
+    Storage class shared by a column's non-NULL values.
+
+    Args:
+        values (list): Column values
+
+    Returns:
+        str: integer, real, text, blob, null or mixed (integer and real together count as real)
+    """
+    kinds = {_KINDS.get(kind, "mixed") for kind in set(map(type, values))}
+    kinds.discard(None)
+    if not kinds:
+        return "null"
+    if len(kinds) == 1:
+        return kinds.pop()
+    return "real" if kinds == {"integer", "real"} else "mixed"
+
+def split_columns(column_names, rows):
+    """Turn row tuples into one list of values per column."""
+    if not rows:
+        return [[] for _ in column_names]
+    return [list(values) for values in zip(*rows)]
+
+def _json_value(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return value if isinstance(value, (int, float, str)) or value is None else str(value)
+
+def json_rows(rows):
+    """Return rows as lists of JSON-safe values (blobs as base64 text), e.g. for a page of a result."""
+    return [[_json_value(value) for value in row] for row in rows]
+
+def columnar(column_names, rows, **metadata):
+    """
+    Build the columnar JSON form of a result.
+
+    Args:
+        column_names (list): Result column names
+        rows (list): Result tuples (or lists)
+        **metadata: Extra keys merged into the payload (e.g. total_rows, capped)
+
+    Returns:
+        dict: columns, types, rows, data and the metadata
+    """
+    columns = split_columns(column_names, rows)
+    types = [column_type(values) for values in columns]
+    for i, kind in enumerate(types):
+        if kind in ("blob", "mixed"):
+            columns[i] = [_json_value(value) for value in columns[i]]
+    payload = {"columns": list(column_names), "types": types, "rows": len(rows), "data": columns}
+    payload.update(metadata)
+    return payload
+
+def dumps(payload):
+    """Serialize a payload as compact UTF-8 JSON."""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+def _validity(values):
+    if None not in values:
+        return None
+    bits = bytearray(b"\xff" * ((len(values) + 7) // 8))
+    for i, value in enumerate(values):
+        if value is None:
+            bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+    return bytes(bits)
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+def _variable_width(encoded):
+    offsets = array("i", accumulate(map(len, encoded), initial=0))
+    return _little_endian(offsets), b"".join(encoded)
+
+def _column_buffers(kind, values):
+    validity = _validity(values)
+    if kind == "integer":
+        numbers = array("q", values if validity is None else [0 if v is None else v for v in values])
+        return validity, None, _little_endian(numbers)
+    if kind == "real":
+        numbers = array("d", values if validity is None else [0.0 if v is None else v for v in values])
+        return validity, None, _little_endian(numbers)
+    if kind == "text":
+        encoded = [b"" if v is None else v.encode("utf-8") for v in values]
+    elif kind == "blob":
+        encoded = [b"" if v is None else bytes(v) for v in values]
+    elif kind == "mixed":
+        encoded = [
+            b"" if v is None else json.dumps(_json_value(v), ensure_ascii=False).encode("utf-8") for v in values
+        ]
+    else:
+        return validity, None, b""
+    offsets, data = _variable_width(encoded)
+    return validity, offsets, data
+
+def encode_binary(column_names, rows, metadata=None):
+    """
+    Encode a result in the binary columnar layout.
+
+    Args:
+        column_names (list): Result column names
+        rows (list): Result tuples (or lists)
+        metadata (dict or None): JSON-serializable data stored in the header (e.g. the NL answer)
+
+    Returns:
+        bytes: Encoded result
+    """
+    buffers = []
+    size = 0
+    columns = []
+
+    def add(buffer):
+        nonlocal size
+        if buffer is None:
+            return None
+        location = [size, len(buffer)]
+        padding = -len(buffer) % _ALIGNMENT
+        buffers.append(buffer + b"\0" * padding if padding else buffer)
+        size += len(buffer) + padding
+        return location
+
+    for name, values in zip(column_names, split_columns(column_names, rows)):
+        kind = column_type(values)
+        validity, offsets, data = _column_buffers(kind, values)
+        columns.append({
+            "name": name,
+            "type": kind,
+            "validity": add(validity),
+            "offsets": add(offsets),
+            "values": add(data),
+        })
+    header = json.dumps(
+        {"rows": len(rows), "columns": columns, "metadata": metadata or {}},
+        ensure_ascii=False, separators=(",", ":"), default=str,
+    ).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % _ALIGNMENT)
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header] + buffers)
+
+def _numbers(typecode, buffer):
+    values = array(typecode)
+    values.frombytes(buffer)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+def decode_binary(data):
+    """
+    Decode the binary columnar layout (the inverse of encode_binary).
+
+    Args:
+        data (bytes): Encoded result
+
+    Returns:
+        dict: columns, types, rows, data (values per column) and metadata
+
+    Raises:
+        ValueError: If data is not in the binary columnar layout
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a columnar result")
+    (header_length,) = struct.unpack_from("<I", data, len(MAGIC))
+    body_start = len(MAGIC) + 4 + header_length
+    header = json.loads(data[len(MAGIC) + 4:body_start])
+    body = memoryview(data)[body_start:]
+    count = header["rows"]
+
+    def buffer(location):
+        return bytes(body[location[0]:location[0] + location[1]])
+
+    names, types, columns = [], [], []
+    for column in header["columns"]:
+        kind = column["type"]
+        if kind == "null":
+            values = [None] * count
+        elif kind in ("integer", "real"):
+            values = _numbers("q" if kind == "integer" else "d", buffer(column["values"]))
+        else:
+            offsets = _numbers("i", buffer(column["offsets"]))
+            raw = buffer(column["values"])
+            values = [raw[start:end] for start, end in zip(offsets, offsets[1:])]
+            if kind == "text":
+                values = [value.decode("utf-8") for value in values]
+            elif kind == "mixed":
+                values = [json.loads(value) if value else None for value in values]
+        if column["validity"] is not None:
+            bits = buffer(column["validity"])
+            values = [value if bits[i >> 3] >> (i & 7) & 1 else None for i, value in enumerate(values)]
+        names.append(column["name"])
+        types.append(kind)
+        columns.append(values)
+    return {"columns": names, "types": types, "rows": count, "data": columns, "metadata": header["metadata"]}
+
+def _accepted(accept_encoding):
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the response compression for an Accept-Encoding header.
+
+    Brotli is preferred when the optional brotli module is installed, then gzip.
+
+    Args:
+        accept_encoding (str): Accept-Encoding request header
+
+    Returns:
+        str or None: "br", "gzip" or None for an uncompressed response
+    """
+    accepted = _accepted(accept_encoding or "")
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body, encoding, level=5):
+    """
+    Compress a response body.
+
+    Args:
+        body (bytes): Uncompressed body
+        encoding (str): "br" or "gzip" (from negotiate_encoding)
+        level (int): gzip level 1-9, used as the brotli quality for br
+
+    Returns:
+        bytes: Compressed body
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=min(11, max(0, level)))
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
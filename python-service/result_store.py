@@ -0,0 +1,474 @@
+import os
+import json
+import base64
+import time
+import uuid
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+
+current_handles = contextvars.ContextVar("current_result_handles", default=None)
+
+class CollectedHandles(list):
+    """Result ids in creation order; rows maps a result id to the rows of that result held in memory."""
+    def __init__(self):
+        super().__init__()
+        self.rows = {}
+
+@contextmanager
+def collect_handles():
+    """
+    Collect the result handles created while the block runs (including in worker threads).
+
+    Yields:
+        CollectedHandles: Result ids in creation order
+    """
+    handles = CollectedHandles()
+    token = current_handles.set(handles)
+    try:
+        yield handles
+    finally:
+        current_handles.reset(token)
+
+def note_handle(result_id, rows=None):
+    """
+    Report a result handle to the enclosing collect_handles() block, if any.
+
+    Args:
+        result_id (str): Result id
+        rows (list or None): Rows of the result still in memory, served to structured responses without a store read
+    """
+    handles = current_handles.get()
+    if handles is not None and result_id:
+        handles.append(result_id)
+        if rows is not None:
+            handles.rows[result_id] = rows
+
+def latest_handle():
+    """Return the most recent handle collected by the enclosing collect_handles() block, or None."""
+    handles = current_handles.get()
+    return handles[-1] if handles else None
+
+def _version_key(version):
+    return json.dumps(version, default=str)
+
+def _encode_value(value):
+    # SQLite only returns int, float, str, bytes and None, so a dict can only be a blob
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"base64": base64.b64encode(value).decode("ascii")}
+    return str(value)
+
+def _decode_value(obj):
+    return base64.b64decode(obj["base64"])
+
+def _encode_row(row):
+    return json.dumps(row, separators=(",", ":"), default=_encode_value)
+
+def _insert_rows(conn, result_id, start, rows):
+    conn.executemany(
+        "INSERT OR IGNORE INTO result_rows (handle, seq, data) VALUES (?, ?, ?)",
+        ((result_id, start + i, _encode_row(row)) for i, row in enumerate(rows)),
+    )
+
+class SpillWriter:
+    """
+    Stores the rows of one result while it is exported, once it is large enough.
+
+    Below the store's spill_min_rows only the handle (SQL and database
+    version) is kept and rows are reproduced by re-running the SQL on the
+    first page request. Rows stay invisible until the result is registered.
+    A storage error stops spilling instead of failing the query.
+    """
+    def __init__(self, store, result_id):
+        self.store = store
+        self.result_id = result_id
+        self.rows = 0
+        self.failed = False
+        self.registered = False
+        self._pending = []
+
+    def write(self, rows):
+        """Take a chunk of result tuples (spilled once more than spill_min_rows have been seen)."""
+        if self.failed or not rows or not self.store.spill_min_rows:
+            return
+        if not self.rows:
+            self._pending.extend(rows)
+            if len(self._pending) <= self.store.spill_min_rows:
+                return
+            rows, self._pending = self._pending, []
+        try:
+            conn = self.store._connection()
+            with conn:
+                if self.rows == 0:
+                    # A pending handle lets the purge clean up rows of a spill that never finished
+                    now = time.time()
+                    conn.execute(
+                        "INSERT INTO handles (id, created, expires) VALUES (?, ?, ?)",
+                        (self.result_id, now, now + self.store.ttl),
+                    )
+                _insert_rows(conn, self.result_id, self.rows, rows)
+            self.rows += len(rows)
+        except sqlite3.Error as e:
+            print(f"⚠ Result rows could not be spilled: {e}")
+            self.failed = True
+
+    def discard(self):
+        """Drop whatever was spilled for a result that is not registered."""
+        self._pending = []
+        if not self.rows:
+            return
+        try:
+            conn = self.store._connection()
+            with conn:
+                conn.execute("DELETE FROM result_rows WHERE handle = ?", (self.result_id,))
+                conn.execute("DELETE FROM handles WHERE id = ?", (self.result_id,))
+        except sqlite3.Error:
+            pass
+
+class ResultStore:
+    """
+    Server-side result handles backed by a compact on-disk copy of the rows.
+
+    A handle records the SQL and database version of a result; its rows are
+    stored on the first page request (or while exporting, for results above
+    spill_min_rows). Rows are stored as JSON arrays keyed by (handle,
+    position), blobs as {"base64": ...}, so a page is a primary-key range
+    read whatever its depth (keyset pagination). Handle metadata lives in
+    the same SQLite file, which lets every worker process serve pages of
+    results produced by another. Handles expire ttl seconds after they were
+    last read.
+    """
+    def __init__(self, path, ttl=900.0, max_page_rows=1000, purge_interval=60.0, spill_min_rows=0):
+        """
+        Args:
+            path (str): SQLite file holding handles and spilled rows
+            ttl (float): Seconds an unread handle is kept
+            max_page_rows (int): Upper bound for the page size
+            purge_interval (float): Minimum seconds between purges of expired handles
+            spill_min_rows (int): Results with more rows are stored while they are exported (0: only on the first page request)
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_page_rows = max_page_rows
+        self.purge_interval = purge_interval
+        self.spill_min_rows = spill_min_rows
+        self._local = threading.local()
+        self._last_purge = 0.0
+        self._created = False
+        self._create_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self._create()
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _create(self):
+        # The file and its tables are created on first use, not when the service starts
+        if self._created:
+            return
+        with self._create_lock:
+            if self._created:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self._open()
+            try:
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS handles (id TEXT PRIMARY KEY, sql TEXT, version TEXT, columns TEXT, "
+                        "total_rows INTEGER, spilled_rows INTEGER, capped INTEGER, created REAL, expires REAL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS handles_lookup ON handles (sql, version)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS handles_expires ON handles (expires)")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS result_rows (handle TEXT, seq INTEGER, data TEXT, "
+                        "PRIMARY KEY (handle, seq)) WITHOUT ROWID"
+                    )
+                    conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, handle TEXT, expires REAL)")
+                    columns = {row[1] for row in conn.execute("PRAGMA table_info(handles)")}
+                    if "csv_path" not in columns:
+                        conn.execute("ALTER TABLE handles ADD COLUMN csv_path TEXT")
+            finally:
+                conn.close()
+            self._created = True
+
+    def writer(self):
+        """
+        Start spilling a new result.
+
+        Returns:
+            SpillWriter: Writer whose write() can be passed to export_cursor as its sink
+        """
+        return SpillWriter(self, uuid.uuid4().hex)
+
+    def register(self, writer, sql_query, version, column_names, total_rows, capped=False, csv_path=None):
+        """
+        Make a spilled result available under its handle.
+
+        Args:
+            writer (SpillWriter): Writer that received the rows
+            sql_query (str): Query that produced the result
+            version (tuple): Database version token the result belongs to
+            column_names (list): Result column names
+            total_rows (int): Rows in the full result
+            capped (bool): Whether the result stopped at the row cap
+            csv_path (str or None): CSV export of the result, downloadable by result id
+
+        Returns:
+            str: Result id
+        """
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO handles (id, sql, version, columns, total_rows, spilled_rows, capped, "
+                "created, expires, csv_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    writer.result_id, sql_query, _version_key(version), json.dumps(column_names),
+                    total_rows, writer.rows, int(bool(capped)), now, now + self.ttl, csv_path,
+                ),
+            )
+        writer.registered = True
+        self.purge()
+        return writer.result_id
+
+    def register_rows(self, sql_query, version, column_names, rows, total_rows=None, capped=False, csv_path=None):
+        """
+        Store rows already in memory (e.g. a result cache hit) under a new handle.
+
+        Returns:
+            str: Result id
+        """
+        writer = self.writer()
+        writer.write(list(rows))
+        total_rows = len(rows) if total_rows is None else total_rows
+        return self.register(writer, sql_query, version, column_names, total_rows, capped, csv_path)
+
+    def find(self, sql_query, version):
+        """
+        Return a live handle for the same query and database version, extending its lifetime.
+
+        Returns:
+            str or None: Result id
+        """
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT id FROM handles WHERE sql = ? AND version = ? AND expires > ? ORDER BY created DESC LIMIT 1",
+            (sql_query, _version_key(version), now),
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE handles SET expires = ? WHERE id = ?", (now + self.ttl, row[0]))
+        return row[0]
+
+    def describe(self, result_id):
+        """
+        Return the metadata of a handle.
+
+        Returns:
+            dict or None: id, columns, total_rows, capped and csv_available, or None if unknown or expired
+        """
+        row = self._connection().execute(
+            "SELECT columns, total_rows, capped, csv_path FROM handles WHERE id = ? AND expires > ? AND sql IS NOT NULL",
+            (result_id, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": result_id,
+            "columns": json.loads(row[0]),
+            "total_rows": row[1],
+            "capped": bool(row[2]),
+            "csv_available": bool(row[3]) and os.path.exists(row[3]),
+        }
+
+    def csv_path(self, result_id):
+        """
+        Return the CSV export of a result, whichever worker produced it.
+
+        Returns:
+            str or None: Path of the CSV file, or None if the handle is unknown or has no CSV
+        """
+        row = self._connection().execute(
+            "SELECT csv_path FROM handles WHERE id = ? AND expires > ? AND sql IS NOT NULL", (result_id, time.time())
+        ).fetchone()
+        return row[0] if row and row[0] else None
+
+    def remember_session(self, session_id, result_id):
+        """Record result_id as the latest answer of a session, for lookups from any worker."""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, handle, expires) VALUES (?, ?, ?)",
+                (session_id, result_id, time.time() + self.ttl),
+            )
+
+    def session_handle(self, session_id):
+        """
+        Return the result id of a session's latest answer.
+
+        Returns:
+            str or None: Result id, or None if the session recorded none or it expired
+        """
+        row = self._connection().execute(
+            "SELECT handle FROM sessions WHERE id = ? AND expires > ?", (session_id, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def read(self, result_id, start=0, limit=None, rerun=None, version=None, spill=False):
+        """
+        Read a range of a result's rows.
+
+        Args:
+            result_id (str): Handle returned with the chat response
+            start (int): Zero-based position of the first row
+            limit (int or None): Rows to read, all remaining rows if None
+            rerun (callable or None): rerun(sql, offset, limit) -> rows, for rows that were not spilled
+            version (tuple or None): Current database version token, required for rerun
+            spill (bool): Re-run all rows that were not spilled and store them, instead of only the range
+
+        Returns:
+            dict or None: columns, rows, total_rows and capped; None if the handle is unknown
+
+        Raises:
+            ValueError: If the unspilled rows can no longer be reproduced
+        """
+        now = time.time()
+        conn = self._connection()
+        meta = conn.execute(
+            "SELECT sql, version, columns, total_rows, spilled_rows, capped FROM handles "
+            "WHERE id = ? AND expires > ? AND sql IS NOT NULL",
+            (result_id, now),
+        ).fetchone()
+        if meta is None:
+            return None
+        sql_query, stored_version, columns, total_rows, spilled_rows, capped = meta
+        end = total_rows if limit is None else min(start + limit, total_rows)
+        # One JSON document for the whole range parses much faster than one per row
+        rows = json.loads("[" + ",".join(
+            data for (data,) in conn.execute(
+                "SELECT data FROM result_rows WHERE handle = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (result_id, start, min(end, spilled_rows)),
+            )
+        ) + "]", object_hook=_decode_value)
+        missing_start = max(start, spilled_rows)
+        if end > missing_start:
+            if rerun is None or _version_key(version) != stored_version:
+                raise ValueError("The rest of this result is no longer available; please run the question again")
+            if spill:
+                fetched = rerun(sql_query, spilled_rows, total_rows - spilled_rows)
+                self._spill(conn, result_id, spilled_rows, fetched)
+                fetched = fetched[missing_start - spilled_rows:end - spilled_rows]
+            else:
+                fetched = rerun(sql_query, missing_start, end - missing_start)
+            rows.extend(list(row) for row in fetched)
+        with conn:
+            conn.execute("UPDATE handles SET expires = ? WHERE id = ?", (now + self.ttl, result_id))
+        return {
+            "result_id": result_id,
+            "columns": json.loads(columns),
+            "rows": rows,
+            "total_rows": total_rows,
+            "capped": bool(capped),
+        }
+
+    def _spill(self, conn, result_id, start, rows):
+        # Another worker may store the same rows at the same time; the positions make that harmless
+        try:
+            with conn:
+                _insert_rows(conn, result_id, start, rows)
+                conn.execute(
+                    "UPDATE handles SET spilled_rows = MAX(spilled_rows, ?) WHERE id = ?", (start + len(rows), result_id)
+                )
+        except sqlite3.Error as e:
+            print(f"⚠ Result rows could not be spilled: {e}")
+
+    def page(self, result_id, after=None, offset=None, limit=100, rerun=None, version=None):
+        """
+        Read one page of a result.
+
+        The first page that needs rows that were not spilled re-runs the SQL
+        once for all of them and stores them; later pages are range reads.
+
+        Args:
+            result_id (str): Handle returned with the chat response
+            after (str or None): Cursor from the previous page's "next" (keyset pagination)
+            offset (int or None): Zero-based row position to start at, used when after is not given
+            limit (int): Rows per page (capped at max_page_rows)
+            rerun (callable or None): rerun(sql, offset, limit) -> rows, for rows that were not spilled
+            version (tuple or None): Current database version token, required for rerun
+
+        Returns:
+            dict or None: columns, rows, offset, total_rows, capped and next; None if the handle is unknown
+
+        Raises:
+            ValueError: If the cursor is malformed or the unspilled rows can no longer be reproduced
+        """
+        limit = max(1, min(int(limit), self.max_page_rows))
+        start = int(after) + 1 if after not in (None, "") else int(offset or 0)
+        if start < 0:
+            raise ValueError("Cursor and offset must not be negative")
+        page = self.read(result_id, start, limit, rerun, version, spill=True)
+        if page is None:
+            return None
+        rows = page["rows"]
+        return {
+            "result_id": result_id,
+            "columns": page["columns"],
+            "rows": rows,
+            "offset": start,
+            "total_rows": page["total_rows"],
+            "capped": page["capped"],
+            "next": str(start + len(rows) - 1) if rows and start + len(rows) < page["total_rows"] else None,
+        }
+
+    def purge(self, force=False):
+        """
+        Delete expired handles and their rows.
+
+        Args:
+            force (bool): Purge even if the last purge was less than purge_interval ago
+
+        Returns:
+            int: Number of handles removed
+        """
+        now = time.time()
+        if not force and now - self._last_purge < self.purge_interval:
+            return 0
+        self._last_purge = now
+        conn = self._connection()
+        with conn:
+            expired = [row[0] for row in conn.execute("SELECT id FROM handles WHERE expires <= ?", (now,))]
+            for result_id in expired:
+                conn.execute("DELETE FROM result_rows WHERE handle = ?", (result_id,))
+            conn.execute("DELETE FROM handles WHERE expires <= ?", (now,))
+            conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+        return len(expired)
+
+    def stats(self):
+        """
+        Return the number of live handles and stored rows.
+
+        Returns:
+            dict: handles and rows
+        """
+        conn = self._connection()
+        handles = conn.execute(
+            "SELECT COUNT(*) FROM handles WHERE expires > ? AND sql IS NOT NULL", (time.time(),)
+        ).fetchone()[0]
+        rows = conn.execute("SELECT COALESCE(SUM(spilled_rows), 0) FROM handles").fetchone()[0]
+        return {"path": self.path, "handles": handles, "rows": rows}
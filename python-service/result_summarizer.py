@@ -0,0 +1,141 @@
+import json
+
+CHARS_PER_TOKEN = 4
+MAX_EDGE_ROWS = 20
+TOP_VALUES = 5
+GROUP_COUNT_MAX_CARDINALITY = 20
+
+def estimate_tokens(text):
+    """
+    Cheap local token estimate (about four characters per token for Gemini).
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def encode_columnar(sql_results, column_names):
+    """
+    Encode rows column-oriented so each column name appears only once.
+
+    Args:
+        sql_results (list): Result tuples
+        column_names (list): Column names
+
+    Returns:
+        dict: {column_name: [values...]}
+    """
+    columns = list(zip(*sql_results)) if sql_results else [() for _ in column_names]
+    return {name: list(values) for name, values in zip(column_names, columns)}
+
+def _column_statistics(df):
+    import pandas as pd
+
+    stats = {}
+    for name in df.columns:
+        series = df[name]
+        numeric = pd.to_numeric(series, errors="coerce")
+        non_null = int(series.notna().sum())
+        if non_null and int(numeric.notna().sum()) == non_null:
+            stats[name] = {
+                "type": "numeric",
+                "non_null": non_null,
+                "min": numeric.min(),
+                "max": numeric.max(),
+                "mean": round(float(numeric.mean()), 4),
+                "median": numeric.median(),
+                "sum": numeric.sum(),
+            }
+        else:
+            counts = series.value_counts(dropna=True)
+            stats[name] = {
+                "type": "text",
+                "non_null": non_null,
+                "distinct": int(counts.size),
+                "top_values": {str(k): int(v) for k, v in counts.head(TOP_VALUES).items()},
+            }
+    return stats
+
+def _group_counts(df, stats):
+    groups = {}
+    for name, column_stats in stats.items():
+        if column_stats["type"] == "text" and 1 < column_stats["distinct"] <= GROUP_COUNT_MAX_CARDINALITY:
+            groups[name] = {str(k): int(v) for k, v in df[name].value_counts().items()}
+    return groups
+
+def _to_builtin(value):
+    return value.item() if hasattr(value, "item") else value
+
+def summarize_results(sql_results, column_names, token_budget, total_rows=None, capped=False):
+    """
+    Fit a query result into a token budget for the NL Agent.
+
+    Small results are sent whole in a compact column-oriented encoding. Larger
+    ones are replaced by vectorized column statistics, group counts for
+    low-cardinality columns and the first/last rows of the result; the
+    complete data stays available in the CSV export.
+
+    Args:
+        sql_results (list): Result tuples
+        column_names (list): Column names
+        token_budget (int): Maximum estimated tokens for the serialized result
+        total_rows (int or None): Row count of the full result when sql_results is partial
+        capped (bool): The query returned more rows than were read
+
+    Returns:
+        str: JSON text describing the result
+    """
+    total_rows = len(sql_results) if total_rows is None else total_rows
+    if total_rows == len(sql_results):
+        payload = {"row_count": total_rows, "columns": encode_columnar(sql_results, column_names)}
+        if capped:
+            payload["truncated"] = True
+        full = _dumps(payload)
+        if estimate_tokens(full) <= token_budget:
+            return full
+
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(sql_results, columns=column_names)
+    stats = {
+        name: {key: _to_builtin(value) for key, value in column_stats.items()}
+        for name, column_stats in _column_statistics(df).items()
+    }
+    summary = {
+        "row_count": total_rows,
+        "note": "Result summarized to fit the response budget; the complete data is in the CSV export.",
+        "column_statistics": stats,
+        "group_counts": _group_counts(df, stats),
+    }
+    if total_rows > len(sql_results):
+        summary["statistics_sample_rows"] = len(sql_results)
+    if capped:
+        summary["truncated"] = True
+
+    edge_rows = MAX_EDGE_ROWS
+    while edge_rows >= 1:
+        summary["first_rows"] = encode_columnar(sql_results[:edge_rows], column_names)
+        if len(sql_results) > edge_rows:
+            summary["last_rows"] = encode_columnar(sql_results[-edge_rows:], column_names)
+        text = _dumps(summary)
+        if estimate_tokens(text) <= token_budget:
+            return text
+        edge_rows //= 2
+    summary.pop("group_counts")
+    summary.pop("last_rows", None)
+    summary["first_rows"] = encode_columnar(sql_results[:1], column_names)
+    text = _dumps(summary)
+    if estimate_tokens(text) <= token_budget:
+        return text
+    for column_stats in stats.values():
+        column_stats.pop("top_values", None)
+    while len(stats) > 1 and estimate_tokens(_dumps(summary)) > token_budget:
+        stats.pop(next(reversed(stats)))
+        summary["statistics_truncated"] = True
+    return _dumps(summary)
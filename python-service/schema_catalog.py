@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import deque
+from db_pool import readonly_uri
+from query_cache import normalize_question
+
+MAX_COLUMNS_IN_FULL = 12
+SEED_SCORE_RATIO = 0.2
+
+def identifier_words(identifier):
+    """
+    Split an identifier into lowercase words ("CustomerName" -> ["customer", "name"]).
+
+    Args:
+        identifier (str): Table or column name
+
+    Returns:
+        list: Words longer than one character
+    """
+    parts = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", identifier)
+    return [p.lower() for p in parts if len(p) > 1]
+
+def _stem(word):
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("es") and len(word) > 4 and word[-3] in "sxz":
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+def _word_stems(identifier):
+    return {_stem(w) for w in identifier_words(identifier) if w != "id"}
+
+class SchemaCatalog:
+    """
+    Tables, columns and foreign keys of a SQLite database.
+
+    Renders the "- Table: col, col" schema text used in prompts, either
+    for the whole database or pruned to the tables a question needs.
+    """
+    def __init__(self, tables, fingerprint):
+        """
+        Args:
+            tables (dict): {table: {"columns": [[name, type, pk]], "foreign_keys": [[column, ref_table, ref_column]]}}
+            fingerprint (str): Hash of the schema definition
+        """
+        self.tables = tables
+        self.fingerprint = fingerprint
+        self._graph = {name: set() for name in tables}
+        for name, table in tables.items():
+            for _, ref_table, _ in table["foreign_keys"]:
+                if ref_table in self._graph:
+                    self._graph[name].add(ref_table)
+                    self._graph[ref_table].add(name)
+        self._table_stems = {name: _word_stems(name) for name in tables}
+        self._column_stems = {
+            name: {column[0]: _word_stems(column[0]) for column in table["columns"]} for name, table in tables.items()
+        }
+
+    def table_names(self):
+        """Return the table names in schema order."""
+        return list(self.tables)
+
+    def describe(self, tables=None, columns=None, title="Here is the schema for the database:"):
+        """
+        Render schema text for prompts.
+
+        Args:
+            tables (list or None): Tables to include (None includes all)
+            columns (dict or None): {table: [columns]} to restrict columns per table
+            title (str): First line of the text
+
+        Returns:
+            str: Schema description with relationships
+        """
+        tables = [t for t in (tables or self.tables) if t in self.tables]
+        lines = [title]
+        for name in tables:
+            wanted = (columns or {}).get(name)
+            names = [c[0] for c in self.tables[name]["columns"] if wanted is None or c[0] in wanted]
+            lines.append(f"- {name}: {', '.join(names)}")
+        relationships = [
+            f"- {name}.{column} -> {ref_table}.{ref_column}"
+            for name in tables
+            for column, ref_table, ref_column in self.tables[name]["foreign_keys"]
+            if ref_table in tables
+        ]
+        if relationships:
+            lines.append("Relationships:")
+            lines.extend(relationships)
+        return "\n" + "\n".join(lines) + "\n"
+
+    def _join_path(self, source, target):
+        previous = {source: None}
+        pending = deque([source])
+        while pending:
+            node = pending.popleft()
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return path
+            for neighbour in sorted(self._graph[node]):
+                if neighbour not in previous:
+                    previous[neighbour] = node
+                    pending.append(neighbour)
+        return []
+
+    def rank_tables(self, question):
+        """
+        Score tables by lexical overlap with the question.
+
+        A table name match counts more than a column name match, and column
+        words shared by many tables ("name", "city") count less than rare ones.
+
+        Args:
+            question (str): User question
+
+        Returns:
+            list: (score, table) pairs with a positive score, best first
+        """
+        words = {_stem(w) for w in normalize_question(question).split()}
+        column_words = {
+            name: set().union(*columns.values()) if columns else set() for name, columns in self._column_stems.items()
+        }
+        scores = []
+        for name in self.tables:
+            score = 0.0
+            for word in words:
+                if word in self._table_stems[name]:
+                    score += 3
+                elif word in column_words[name]:
+                    score += 1 / sum(1 for stems in column_words.values() if word in stems)
+            if score:
+                scores.append((score, name))
+        order = list(self.tables)
+        scores.sort(key=lambda item: (-item[0], order.index(item[1])))
+        return scores
+
+    def prune(self, question, max_tables=6):
+        """
+        Return schema text limited to the tables and columns relevant to a question.
+
+        Tables scoring at least SEED_SCORE_RATIO of the best match are joined through the foreign-key graph so
+        the SQL Agent sees every table on the join path. Wide tables keep only
+        key columns and columns named in the question. If nothing matches,
+        the full schema is returned.
+
+        Args:
+            question (str): User question
+            max_tables (int): Maximum number of directly matched tables
+
+        Returns:
+            str: Schema description
+        """
+        ranked = self.rank_tables(question)
+        if not ranked:
+            return self.describe()
+        best = ranked[0][0]
+        seeds = [name for score, name in ranked[:max_tables] if score >= best * SEED_SCORE_RATIO]
+        selected = list(seeds)
+        for other in seeds[1:]:
+            for table in self._join_path(seeds[0], other):
+                if table not in selected:
+                    selected.append(table)
+        selected.sort(key=list(self.tables).index)
+        words = {_stem(w) for w in normalize_question(question).split()}
+        columns = {}
+        for name in selected:
+            table = self.tables[name]
+            if len(table["columns"]) <= MAX_COLUMNS_IN_FULL:
+                continue
+            keys = {c[0] for c in table["columns"] if c[2]}
+            keys.update(column for column, _, _ in table["foreign_keys"])
+            keys.update(
+                ref_column for other in selected
+                for _, ref_table, ref_column in self.tables[other]["foreign_keys"] if ref_table == name
+            )
+            keys.update(column for column, stems in self._column_stems[name].items() if stems & words)
+            columns[name] = keys
+        return self.describe(selected, columns)
+
+    def to_dict(self):
+        return {"fingerprint": self.fingerprint, "tables": self.tables}
+
+def schema_definition_hash(conn, exclude=()):
+    """
+    Hash the CREATE statements in sqlite_master; it changes whenever the schema does.
+
+    Args:
+        conn (sqlite3.Connection): Database connection
+        exclude (iterable): Table names left out of the catalog
+
+    Returns:
+        str: Hex digest
+    """
+    rows = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+    text = json.dumps([row for row in rows if row[1] not in exclude] + sorted(exclude))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def _read_tables(conn, exclude):
+    tables = {}
+    names = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+    ).fetchall()
+    for (name,) in names:
+        if name in exclude:
+            continue
+        quoted = '"' + name.replace('"', '""') + '"'
+        columns = [[c[1], c[2], c[5]] for c in conn.execute(f"PRAGMA table_info({quoted})")]
+        foreign_keys = [
+            [fk[3], fk[2], fk[4] or fk[3]] for fk in conn.execute(f"PRAGMA foreign_key_list({quoted})")
+        ]
+        tables[name] = {"columns": columns, "foreign_keys": foreign_keys}
+    return tables
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+def introspect(db_path, exclude=(), cache_path=None):
+    """
+    Read the schema of a SQLite database, reusing a cached copy when its hash is unchanged.
+
+    Args:
+        db_path (str): Path to the SQLite database
+        exclude (iterable): Table names to leave out (e.g. application tables)
+        cache_path (str or None): JSON file keeping catalogs by schema hash across restarts
+
+    Returns:
+        SchemaCatalog: The database schema
+    """
+    exclude = set(exclude)
+    conn = sqlite3.connect(readonly_uri(db_path), uri=True)
+    try:
+        fingerprint = schema_definition_hash(conn, exclude)
+        with _memo_lock:
+            if fingerprint in _memo:
+                return _memo[fingerprint]
+        stored = {}
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠ Schema cache could not be loaded: {e}")
+        if fingerprint in stored:
+            tables = stored[fingerprint]["tables"]
+        else:
+            tables = _read_tables(conn, exclude)
+            if cache_path:
+                stored[fingerprint] = {"tables": tables}
+                try:
+                    tmp_path = f"{cache_path}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(stored, f, ensure_ascii=False)
+                    os.replace(tmp_path, cache_path)
+                except OSError as e:
+                    print(f"⚠ Schema cache could not be saved: {e}")
+    finally:
+        conn.close()
+    catalog = SchemaCatalog(tables, fingerprint)
+    with _memo_lock:
+        _memo[fingerprint] = catalog
+    return catalog
@@ -0,0 +1,128 @@
+import time
+import threading
+from collections import OrderedDict
+from query_cache import estimate_result_bytes
+
+class SessionState:
+    """
+    The last answer of one conversation: question, SQL, result rows, CSV and result handle.
+
+    rows is None when the result was too large to keep; follow-ups then
+    re-run the stored SQL as a subquery instead of working on the rows.
+    """
+    __slots__ = ("question", "sql_query", "column_names", "rows", "csv_path", "result_id", "version", "size", "updated")
+
+    def __init__(self, question, sql_query, column_names, rows, csv_path, result_id, version):
+        self.question = question
+        self.sql_query = sql_query
+        self.column_names = list(column_names)
+        self.rows = rows
+        self.csv_path = csv_path
+        self.result_id = result_id
+        self.version = version
+        self.size = estimate_result_bytes(rows, column_names) if rows is not None else 0
+        self.updated = time.monotonic()
+
+class SessionStore:
+    """
+    Per-session conversation state with bounded memory.
+
+    Sessions idle for longer than idle_seconds are dropped, at most
+    max_sessions are kept (least recently used first out) and the rows held
+    across all sessions are capped at max_bytes; over budget, the oldest
+    sessions lose their rows but keep their SQL.
+    """
+    def __init__(self, max_sessions=1000, idle_seconds=1800.0, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            max_sessions (int): Maximum number of sessions kept
+            idle_seconds (float): Seconds after the last message when a session is forgotten
+            max_bytes (int): Upper bound on the summed (estimated) size of the rows kept
+        """
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.followups = {"local": 0, "subquery": 0}
+
+    def get(self, session_id):
+        """
+        Return the state of a session.
+
+        Returns:
+            SessionState or None: None if the session is unknown or idle for too long
+        """
+        if session_id is None:
+            return None
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._sessions.get(session_id)
+
+    def remember(self, session_id, state):
+        """
+        Replace the state of a session with its latest answer.
+
+        Args:
+            session_id (str): Session id sent by the client
+            state (SessionState): Latest answer
+        """
+        if session_id is None:
+            return
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+            if state.size > self.max_bytes:
+                state.rows, state.size = None, 0
+            self._sessions[session_id] = state
+            self.total_bytes += state.size
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                self.total_bytes -= evicted.size
+                self.evictions += 1
+            for other in self._sessions.values():
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if other.rows is not None and other is not state:
+                    self.total_bytes -= other.size
+                    other.rows, other.size = None, 0
+            self._expire(time.monotonic())
+
+    def forget(self, session_id):
+        """Drop a session's state."""
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+
+    def record_followup(self, kind):
+        """Count a follow-up answered on the cached rows ("local") or with a subquery ("subquery")."""
+        with self._lock:
+            self.followups[kind] = self.followups.get(kind, 0) + 1
+
+    def _expire(self, now):
+        while self._sessions:
+            session_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.updated <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self.total_bytes -= oldest.size
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Return session counters.
+
+        Returns:
+            dict: sessions, bytes, evictions and follow-ups by kind
+        """
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self.total_bytes,
+                "evictions": self.evictions,
+                "followups": dict(self.followups),
+            }
@@ -0,0 +1,1288 @@
+"""
+Parallel execution of read-only queries across partitioned SQLite shards.
+
+A shard manifest lists database files that share one schema. Partitioned
+tables hold a different slice of their rows in each shard (co-located, so
+an order and its order lines live in the same file); every other table is
+replicated in full:
+
+    {
+      "partitioned_tables": ["Orders", "OrderDetails"],
+      "partition_keys": {"OrderDate": ["Orders"], "OrderID": ["Orders", "OrderDetails"]},
+      "shards": [
+        {"name": "1996", "path": "northwind_1996.db",
+         "ranges": {"OrderDate": ["1996-07-04", "1996-12-31"], "OrderID": [10248, 10399]}},
+        ...
+      ]
+    }
+
+A query over partitioned tables runs on every shard that its WHERE clause
+does not rule out, in parallel, and the shard results are merged as they
+arrive: plain SELECTs are concatenated or merge-sorted (ORDER BY and LIMIT
+are pushed down to the shards), aggregates are split into per-shard
+partials (COUNT, SUM, TOTAL, MIN, MAX and AVG) that are combined by a
+final GROUP BY / HAVING / ORDER BY / LIMIT over the partial rows. Queries
+that cannot be decomposed (outer joins from a replicated table, partitioned
+tables inside subqueries, set operations, window functions, DISTINCT
+aggregates) run once over views that UNION ALL the shards. Split a
+database by order year and write its manifest:
+
+    python shards.py split --source ../Northwind.db --output-dir shard_data
+    python shards.py query --manifest shard_data/manifest.json "SELECT COUNT(*) FROM Orders"
+"""
+import os
+import re
+import sys
+import json
+import heapq
+import queue
+import sqlite3
+import argparse
+import threading
+import concurrent.futures
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+
+import db_pool
+import deadlines
+import query_cache
+from query_governor import table_aliases
+
+Shard = namedtuple("Shard", "name path ranges values")
+Manifest = namedtuple("Manifest", "path partitioned_tables partition_keys shards")
+ShardPlan = namedtuple("ShardPlan", "mode shards shard_sql final_sql order_keys hidden limit offset distinct")
+
+MODES = ("single", "fanout", "aggregate", "union")
+APPLICATION_TABLES = ("users", "query_history")
+SQLITE_MAX_ATTACHED = 10
+
+class QueryRejected(Exception):
+    """Raised when the query governor rejects the plan of a query on one of the shards."""
+
+def load_manifest(path):
+    """
+    Read a shard manifest; relative shard paths are resolved against its folder.
+
+    Args:
+        path (str): Manifest JSON file
+
+    Returns:
+        Manifest: (path, partitioned_tables, partition_keys, shards)
+
+    Raises:
+        ValueError: If the manifest is malformed or a shard file is missing
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    folder = os.path.dirname(os.path.abspath(path))
+    shards = []
+    for entry in data.get("shards") or []:
+        shard_path = entry["path"] if os.path.isabs(entry["path"]) else os.path.join(folder, entry["path"])
+        if not os.path.exists(shard_path):
+            raise ValueError(f"Shard file not found: {shard_path}")
+        shards.append(Shard(
+            str(entry.get("name") or len(shards)),
+            shard_path,
+            {key.lower(): tuple(bounds) for key, bounds in (entry.get("ranges") or {}).items()},
+            {key.lower(): frozenset(values) for key, values in (entry.get("values") or {}).items()},
+        ))
+    if not shards:
+        raise ValueError(f"{path} lists no shards")
+    partitioned = tuple(data.get("partitioned_tables") or ())
+    if not partitioned:
+        raise ValueError(f"{path} lists no partitioned tables")
+    keys = {
+        key.lower(): frozenset(t.lower() for t in tables)
+        for key, tables in (data.get("partition_keys") or {}).items()
+    }
+    return Manifest(os.path.abspath(path), partitioned, keys, shards)
+
+# --- SQL tokens --------------------------------------------------------------
+
+Token = namedtuple("Token", "kind text start end")
+
+_TOKEN = re.compile(
+    r"(?P<space>\s+|--[^\n]*|/\*.*?\*/)"
+    r"|(?P<string>'(?:[^']|'')*')"
+    r"|(?P<quoted>\"(?:[^\"]|\"\")*\"|`(?:[^`]|``)*`|\[[^\]]*\])"
+    r"|(?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+    r"|(?P<word>[^\W\d]\w*)"
+    r"|(?P<param>[?:@$]\w*)"
+    r"|(?P<op><=|>=|<>|!=|==|\|\||<<|>>|[-+*/%<>=(),.;&|~])",
+    re.DOTALL,
+)
+_AGGREGATES = {"COUNT", "SUM", "TOTAL", "MIN", "MAX", "AVG"}
+_UNSUPPORTED_AGGREGATES = {"GROUP_CONCAT", "STRING_AGG", "JSON_GROUP_ARRAY", "JSON_GROUP_OBJECT"}
+_CLAUSES = ("select", "from", "where", "group", "having", "order", "limit", "offset")
+_KEYWORDS = {
+    "AND", "OR", "NOT", "NULL", "IS", "IN", "AS", "CASE", "WHEN", "THEN", "ELSE", "END", "CAST", "LIKE", "GLOB",
+    "BETWEEN", "ESCAPE", "COLLATE", "NOCASE", "BINARY", "RTRIM", "TRUE", "FALSE", "INTEGER", "INT", "REAL",
+    "TEXT", "NUMERIC", "BLOB", "DISTINCT", "EXISTS", "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP",
+}
+
+def tokenize(sql):
+    """
+    Split SQL into tokens, dropping whitespace and comments.
+
+    Raises:
+        ValueError: On a character that is not valid SQL
+    """
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = _TOKEN.match(sql, position)
+        if match is None:
+            raise ValueError(f"Unexpected character {sql[position]!r}")
+        if match.lastgroup != "space":
+            tokens.append(Token(match.lastgroup, match.group(), match.start(), match.end()))
+        position = match.end()
+    return tokens
+
+def _upper(token):
+    return token.text.upper() if token.kind == "word" else token.text
+
+def _text(sql, tokens):
+    return sql[tokens[0].start:tokens[-1].end] if tokens else ""
+
+def _norm(tokens):
+    # Compare expressions regardless of case, spacing and identifier quoting
+    parts = []
+    for token in tokens:
+        if token.kind == "quoted":
+            parts.append(token.text[1:-1].upper())
+        else:
+            parts.append(_upper(token))
+    return " ".join(parts)
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+def _identifier(token):
+    if token.kind == "word":
+        return token.text
+    if token.kind == "quoted":
+        return token.text[1:-1]
+    return None
+
+def _split(tokens, separator):
+    """Split tokens at top-level occurrences of a separator ("," or "AND", which skips BETWEEN ... AND)."""
+    parts, current, depth, between = [], [], 0, 0
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and _upper(token) == "BETWEEN":
+            between += 1
+        elif depth == 0 and _upper(token) == separator:
+            if separator == "AND" and between:
+                between -= 1
+            else:
+                parts.append(current)
+                current = []
+                continue
+        current.append(token)
+    parts.append(current)
+    return parts
+
+class _Select:
+    """Top-level clauses of a single SELECT statement, as token lists."""
+    def __init__(self, sql, tokens):
+        self.sql = sql
+        self.tokens = tokens
+        self.distinct = False
+        self.clauses = {}
+        self.starts = {}
+
+    def clause(self, name):
+        return self.clauses.get(name, [])
+
+def parse_select(sql):
+    """
+    Split a single SELECT statement into its top-level clauses.
+
+    Args:
+        sql (str): SQL query
+
+    Returns:
+        _Select or None: None for anything but one plain SELECT (compound selects, CTEs, window functions)
+    """
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return None
+    while tokens and tokens[-1].text == ";":
+        tokens.pop()
+    if not tokens or _upper(tokens[0]) != "SELECT" or any(t.text == ";" for t in tokens):
+        return None
+    if any(_upper(t) in ("OVER", "FILTER", "WINDOW") for t in tokens):
+        return None
+    select = _Select(sql, tokens)
+    index = 1
+    if len(tokens) > 1 and _upper(tokens[1]) in ("DISTINCT", "ALL"):
+        select.distinct = _upper(tokens[1]) == "DISTINCT"
+        index = 2
+    current = "select"
+    select.clauses[current] = []
+    depth = 0
+    while index < len(tokens):
+        token = tokens[index]
+        word = _upper(token)
+        following = _upper(tokens[index + 1]) if index + 1 < len(tokens) else None
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and token.kind == "word":
+            if word in ("UNION", "INTERSECT", "EXCEPT"):
+                return None
+            name = None
+            if word in ("FROM", "WHERE", "HAVING", "LIMIT", "OFFSET"):
+                name = word.lower()
+            elif word in ("GROUP", "ORDER") and following == "BY":
+                name = word.lower()
+                index += 1
+            if name is not None:
+                if name in select.clauses or _CLAUSES.index(name) < _CLAUSES.index(current):
+                    return None
+                current = name
+                select.clauses[current] = []
+                select.starts[current] = token.start
+                index += 1
+                continue
+        select.clauses[current].append(token)
+        index += 1
+    if depth != 0 or not select.clause("select"):
+        return None
+    return select
+
+def _aggregate_calls(tokens):
+    """
+    Find aggregate calls in an expression.
+
+    Returns:
+        list or None: [(start, end, function, argument_tokens)] with end exclusive, or None if an
+        aggregate cannot be split into per-shard partials (DISTINCT arguments, GROUP_CONCAT)
+    """
+    calls = []
+    index = 0
+    while index < len(tokens):
+        word = _upper(tokens[index])
+        if tokens[index].kind == "word" and index + 1 < len(tokens) and tokens[index + 1].text == "(":
+            depth, end = 0, index + 1
+            while end < len(tokens):
+                depth += {"(": 1, ")": -1}.get(tokens[end].text, 0)
+                if depth == 0:
+                    break
+                end += 1
+            arguments = tokens[index + 2:end]
+            if word in _UNSUPPORTED_AGGREGATES:
+                return None
+            # min(a, b) and max(a, b) are scalar functions
+            if word in _AGGREGATES and not (word in ("MIN", "MAX") and len(_split(arguments, ",")) > 1):
+                if arguments and _upper(arguments[0]) == "DISTINCT":
+                    if word not in ("MIN", "MAX"):
+                        return None
+                    arguments = arguments[1:]
+                if any(_upper(t) == "SELECT" for t in arguments):
+                    return None
+                calls.append((index, end + 1, word, arguments))
+                index = end + 1
+                continue
+        index += 1
+    return calls
+
+def _item_alias(tokens):
+    """Split a result column into (expression tokens, alias or None)."""
+    if len(tokens) >= 3 and _upper(tokens[-2]) == "AS" and _identifier(tokens[-1]) is not None:
+        return tokens[:-2], _identifier(tokens[-1])
+    if len(tokens) >= 2 and _identifier(tokens[-1]) is not None and _upper(tokens[-1]) not in _KEYWORDS:
+        previous = tokens[-2]
+        if previous.text == ")" or previous.kind in ("word", "quoted", "string", "number") and _upper(previous) not in _KEYWORDS:
+            return tokens[:-1], _identifier(tokens[-1])
+    return tokens, None
+
+def _order_term(tokens):
+    """Split an ORDER BY term into (expression tokens, collation text, descending, nulls_first)."""
+    descending, nulls_first = False, None
+    if len(tokens) >= 3 and _upper(tokens[-2]) == "NULLS" and _upper(tokens[-1]) in ("FIRST", "LAST"):
+        nulls_first = _upper(tokens[-1]) == "FIRST"
+        tokens = tokens[:-2]
+    if tokens and _upper(tokens[-1]) in ("ASC", "DESC"):
+        descending = _upper(tokens[-1]) == "DESC"
+        tokens = tokens[:-1]
+    collation = None
+    if len(tokens) >= 3 and _upper(tokens[-2]) == "COLLATE":
+        collation = _upper(tokens[-1])
+        tokens = tokens[:-2]
+    if nulls_first is None:
+        nulls_first = not descending
+    return tokens, collation, descending, nulls_first
+
+def _integer(tokens):
+    text = "".join(t.text for t in tokens)
+    return int(text) if re.fullmatch(r"-?\d+", text) else None
+
+# --- Shard pruning -----------------------------------------------------------
+
+_INFINITY = object()
+
+def _literal(tokens):
+    if len(tokens) == 1 and tokens[0].kind == "string":
+        return True, tokens[0].text[1:-1].replace("''", "'")
+    if len(tokens) in (1, 2) and tokens[-1].kind == "number" and (len(tokens) == 1 or tokens[0].text == "-"):
+        text = "".join(t.text for t in tokens)
+        try:
+            return True, int(text, 0) if re.fullmatch(r"-?(?:\d+|0[xX][0-9a-fA-F]+)", text) else float(text)
+        except ValueError:
+            return False, None
+    return False, None
+
+def _column(tokens):
+    """(qualifier or None, column) if the tokens are a plain column reference."""
+    if len(tokens) == 1 and _identifier(tokens[0]) is not None and _upper(tokens[0]) not in _KEYWORDS:
+        return None, _identifier(tokens[0])
+    if len(tokens) == 3 and tokens[1].text == "." and _identifier(tokens[0]) and _identifier(tokens[2]):
+        return _identifier(tokens[0]), _identifier(tokens[2])
+    return None
+
+def _year_of(tokens):
+    """The column reference inside strftime('%Y', column), or None."""
+    if len(tokens) >= 6 and _upper(tokens[0]) == "STRFTIME" and tokens[1].text == "(" and tokens[-1].text == ")":
+        arguments = _split(tokens[2:-1], ",")
+        if len(arguments) == 2 and len(arguments[0]) == 1 and arguments[0][0].text == "'%Y'":
+            return _column(arguments[1])
+    return None
+
+def _interval(op, value):
+    # (low, low_inclusive, high, high_inclusive) for "column op value"
+    return {
+        "=": (value, True, value, True), "==": (value, True, value, True),
+        ">": (value, False, _INFINITY, True), ">=": (value, True, _INFINITY, True),
+        "<": (_INFINITY, True, value, False), "<=": (_INFINITY, True, value, True),
+    }.get(op)
+
+def _year_interval(op, year):
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        return None
+    low, high = str(year), str(year + 1)
+    return {
+        "=": (low, True, high, False), "==": (low, True, high, False),
+        ">": (high, True, _INFINITY, True), ">=": (low, True, _INFINITY, True),
+        "<": (_INFINITY, True, low, False), "<=": (_INFINITY, True, high, False),
+    }.get(op)
+
+def _affinity_safe(value):
+    # A numeric-looking string compared with a NUMERIC column (e.g. a DATETIME) is compared as a number
+    if not isinstance(value, str):
+        return True
+    try:
+        float(value)
+    except ValueError:
+        return True
+    return False
+
+_FLIPPED = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "=": "=", "==": "=="}
+
+def _conditions(term):
+    """
+    Partition-key conditions of one WHERE conjunct.
+
+    Returns:
+        list: [(column_reference, ("interval", bounds) or ("values", values))]
+    """
+    for at, token in enumerate(term):
+        if token.text in _FLIPPED and 0 < at < len(term) - 1:
+            left, op, right = term[:at], token.text, term[at + 1:]
+            is_literal, value = _literal(right)
+            if not is_literal:
+                is_literal, value = _literal(left)
+                left, op = right, _FLIPPED[op]
+            if not is_literal:
+                return []
+            year = _year_of(left)
+            if year is not None:
+                bounds = _year_interval(op, value)
+                return [(year, ("interval", bounds))] if bounds else []
+            column = _column(left)
+            if column is None or not _affinity_safe(value):
+                return []
+            if op in ("=", "=="):
+                return [(column, ("values", (value,)))]
+            return [(column, ("interval", _interval(op, value)))]
+    words = [_upper(t) for t in term]
+    if "IN" in words and term[-1].text == ")" and "NOT" not in words:
+        at = words.index("IN")
+        if at + 1 < len(term) and term[at + 1].text == "(":
+            values = []
+            for item in _split(term[at + 2:-1], ","):
+                is_literal, value = _literal(item)
+                if not is_literal:
+                    return []
+                values.append(value)
+            year = _year_of(term[:at])
+            if year is not None:
+                return [(year, ("years", tuple(values)))]
+            column = _column(term[:at])
+            if column is None or not values or not all(_affinity_safe(v) for v in values):
+                return []
+            return [(column, ("values", tuple(values)))]
+    if "BETWEEN" in words and "NOT" not in words:
+        at = words.index("BETWEEN")
+        bounds = _split(term[at + 1:], "AND")
+        if len(bounds) == 2:
+            (low_ok, low), (high_ok, high) = _literal(bounds[0]), _literal(bounds[1])
+            column = _column(term[:at])
+            if column and low_ok and high_ok and _affinity_safe(low) and _affinity_safe(high):
+                return [(column, ("interval", (low, True, high, True)))]
+    if len(words) >= 3 and words[-2] == "LIKE" and term[-1].kind == "string":
+        pattern = term[-1].text[1:-1]
+        prefix = pattern[:-1]
+        column = _column(term[:-2])
+        # LIKE is case-insensitive, so only prefixes without letters give exact bounds (e.g. '1997-%')
+        if column and pattern.endswith("%") and prefix and not re.search(r"[%_a-zA-Z]", prefix):
+            return [(column, ("interval", (prefix, True, prefix + "\U0010ffff", True)))]
+    return []
+
+def _comparable(a, b):
+    numeric = (int, float)
+    if isinstance(a, bool) or isinstance(b, bool):
+        return False
+    return (isinstance(a, numeric) and isinstance(b, numeric)) or (isinstance(a, str) and isinstance(b, str))
+
+def _outside(bounds, low_value, high_value):
+    """True if the interval bounds cannot contain any value in [low_value, high_value]."""
+    low, low_inclusive, high, high_inclusive = bounds
+    if low is not _INFINITY and _comparable(low, high_value):
+        if low > high_value or (low == high_value and not low_inclusive):
+            return True
+    if high is not _INFINITY and _comparable(high, low_value):
+        if high < low_value or (high == low_value and not high_inclusive):
+            return True
+    return False
+
+def _excludes(shard, key, condition):
+    kind, argument = condition
+    if kind == "years":
+        return all(_excludes(shard, key, ("interval", _year_interval("=", y) or (_INFINITY, True, _INFINITY, True)))
+                   for y in argument)
+    listed = shard.values.get(key)
+    if listed is not None:
+        if kind == "values":
+            return all(v not in listed for v in argument)
+        return all(_outside(argument, v, v) for v in listed if _comparable(v, v))
+    bounds = shard.ranges.get(key)
+    if bounds is None:
+        return False
+    low_value, high_value = bounds
+    if kind == "values":
+        return all(_comparable(v, low_value) and _outside((v, True, v, True), low_value, high_value) for v in argument)
+    return _outside(argument, low_value, high_value)
+
+def prune(manifest, select, aliases):
+    """
+    Drop the shards that a query's WHERE clause rules out.
+
+    Only top-level AND conditions on a partition key are used: comparisons,
+    BETWEEN, IN and equality with literals, strftime('%Y', key) and LIKE
+    prefixes.
+
+    Args:
+        manifest (Manifest): Shard manifest
+        select (_Select): Parsed query
+        aliases (dict): {alias_or_table_lowercase: table} of the query
+
+    Returns:
+        list: Shards that may hold matching rows (at least one)
+    """
+    referenced = {table.lower() for table in aliases.values()}
+    conditions = []
+    for term in _split(select.clause("where"), "AND"):
+        for (qualifier, column), condition in _conditions(term):
+            tables = manifest.partition_keys.get(column.lower())
+            if not tables:
+                continue
+            if qualifier is not None:
+                if aliases.get(qualifier.lower(), qualifier).lower() not in tables:
+                    continue
+            elif not tables & referenced:
+                continue
+            conditions.append((column.lower(), condition))
+    kept = [
+        shard for shard in manifest.shards
+        if not any(_excludes(shard, key, condition) for key, condition in conditions)
+    ]
+    return kept or manifest.shards[:1]
+
+# --- Query planning -----------------------------------------------------------
+
+def _subqueries(tokens):
+    """Token lists of every parenthesized SELECT, at any depth."""
+    found = []
+    for at, token in enumerate(tokens):
+        if token.text == "(" and at + 1 < len(tokens) and _upper(tokens[at + 1]) == "SELECT":
+            depth, end = 0, at
+            while end < len(tokens):
+                depth += {"(": 1, ")": -1}.get(tokens[end].text, 0)
+                if depth == 0:
+                    break
+                end += 1
+            found.append(tokens[at + 1:end])
+    return found
+
+def _outer_join_needs_union(from_tokens, partitioned):
+    """True if an outer join could produce its NULL-extended rows on several shards."""
+    seen_partitioned = left = False
+    expect_relation = True
+    depth = 0
+    for token in from_tokens:
+        word = _upper(token)
+        if token.text == "(":
+            # A derived table; subqueries over partitioned tables already run as a union
+            if depth == 0 and expect_relation:
+                left = expect_relation = False
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth:
+            continue
+        elif word in ("RIGHT", "FULL"):
+            return True
+        elif word == "LEFT":
+            left = True
+        elif word == "JOIN" or token.text == ",":
+            expect_relation = True
+        elif expect_relation and _identifier(token) and word not in ("OUTER", "INNER", "CROSS", "NATURAL"):
+            if _identifier(token).lower() in partitioned:
+                # Preserved rows from replicated tables would be NULL-extended on every shard
+                if left and not seen_partitioned:
+                    return True
+                seen_partitioned = True
+            left = expect_relation = False
+    return False
+
+def plan_query(manifest, sql_query):
+    """
+    Decide how a query runs across the shards and rewrite it for that.
+
+    Args:
+        manifest (Manifest): Shard manifest
+        sql_query (str): Validated SELECT query
+
+    Returns:
+        ShardPlan: mode is "single" (no partitioned table), "fanout" (rows merged),
+        "aggregate" (partials re-aggregated) or "union" (one query over UNION ALL views)
+    """
+    sql_query = sql_query.strip().rstrip(";").strip()
+    aliases = table_aliases(sql_query)
+    partitioned = {t.lower() for t in manifest.partitioned_tables}
+    referenced = {table.lower() for table in aliases.values()}
+    union = ShardPlan("union", manifest.shards, sql_query, None, (), 0, None, 0, False)
+    if not referenced & partitioned:
+        return ShardPlan("single", manifest.shards[:1], sql_query, None, (), 0, None, 0, False)
+    select = parse_select(sql_query)
+    if select is None:
+        return union
+    for subquery in _subqueries(select.tokens):
+        # The outer WHERE says nothing about the rows a subquery reads, so nothing is pruned
+        if {t.lower() for t in table_aliases(" ".join(t.text for t in subquery)).values()} & partitioned:
+            return union
+    union = union._replace(shards=prune(manifest, select, aliases))
+    if _outer_join_needs_union(select.clause("from"), partitioned):
+        return union
+    items = [_item_alias(item) for item in _split(select.clause("select"), ",")]
+    limit = _integer(select.clause("limit")) if "limit" in select.clauses else None
+    offset = _integer(select.clause("offset")) if "offset" in select.clauses else 0
+    if "limit" in select.clauses and limit is None:
+        limit_parts = _split(select.clause("limit"), ",")
+        if len(limit_parts) != 2 or "offset" in select.clauses:
+            return union
+        offset, limit = _integer(limit_parts[0]), _integer(limit_parts[1])
+    if ("limit" in select.clauses and limit is None) or offset is None:
+        return union
+    if limit is not None and limit < 0:
+        limit = None
+    calls = [_aggregate_calls(expression) for expression, _ in items]
+    having_calls = _aggregate_calls(select.clause("having"))
+    if any(c is None for c in calls) or having_calls is None:
+        return union
+    if "group" in select.clauses or any(calls) or having_calls:
+        plan = _plan_aggregate(select, items, limit, offset)
+    else:
+        plan = _plan_fanout(select, items, limit, offset)
+    if plan is None:
+        return union
+    return plan._replace(shards=union.shards)
+
+def _plan_fanout(select, items, limit, offset):
+    sql = select.sql
+    order_keys, hidden = [], []
+    for term in _split(select.clause("order"), ","):
+        if not term:
+            continue
+        expression, collation, descending, nulls_first = _order_term(term)
+        position = _integer(expression)
+        if position is not None:
+            index = position - 1
+        else:
+            name = _identifier(expression[0]) if len(expression) == 1 else None
+            index = next((i for i, (_, alias) in enumerate(items) if name and alias and alias.lower() == name.lower()), None)
+            if index is None:
+                index = next((i for i, (item, _) in enumerate(items) if _norm(item) == _norm(expression)), None)
+        if index is None:
+            # An extra sort column would change which rows DISTINCT keeps
+            if select.distinct:
+                return None
+            hidden.append(_text(sql, expression))
+            index = ("hidden", len(hidden) - 1)
+        order_keys.append((index, collation, descending, nulls_first))
+    select_end = select.clause("select")[-1].end
+    shard_sql = sql[:select_end]
+    shard_sql += "".join(f", {expression} AS __shard_key{i}" for i, expression in enumerate(hidden))
+    shard_sql += sql[select_end:select.starts.get("limit", len(sql))].rstrip()
+    # Every shard returns its first limit + offset rows; the merge applies OFFSET once
+    if limit is not None:
+        shard_sql += f" LIMIT {limit + offset}"
+    return ShardPlan("fanout", None, shard_sql, None, tuple(order_keys), len(hidden), limit, offset, select.distinct)
+
+def _is_star(expression):
+    return [t.text for t in expression] == ["*"] or (len(expression) == 3 and expression[2].text == "*")
+
+def _plan_aggregate(select, items, limit, offset):
+    sql = select.sql
+    partials = []
+    names = {}
+
+    def partial(expression):
+        """Name of the partial column computing an expression on every shard."""
+        if expression not in names:
+            names[expression] = f"__p{len(partials)}"
+            partials.append(f"{expression} AS {names[expression]}")
+        return names[expression]
+
+    def alias_at(tokens, at):
+        """The result column alias a token refers to, e.g. Revenue in HAVING Revenue > 100, or None."""
+        name = _identifier(tokens[at])
+        if name is None or name.lower() not in aliases:
+            return None
+        if at + 1 < len(tokens) and tokens[at + 1].text in ("(", "."):
+            return None
+        if at > 0 and tokens[at - 1].text == ".":
+            return None
+        return aliases[name.lower()]
+
+    def merged(tokens, with_aliases=False):
+        """
+        Final expression over the partial columns, or None if it reads a column outside an aggregate.
+
+        With with_aliases (HAVING and ORDER BY), result column aliases are kept as references to the final columns.
+        """
+        calls = _aggregate_calls(tokens)
+        if calls is None:
+            return None
+        references = with_aliases and any(alias_at(tokens, i) for i in range(len(tokens)))
+        if not calls and not references:
+            return partial(groups.get(_norm(tokens), _text(sql, tokens)))
+        parts, at = [], 0
+        for start, end, function, arguments in calls + [(len(tokens), len(tokens), None, None)]:
+            residual = tokens[at:start]
+            run = []
+            for i, token in enumerate(residual):
+                alias = alias_at(residual, i) if with_aliases else None
+                if alias is None and _column_like(residual, i):
+                    return None
+                if alias is None:
+                    run.append(token)
+                    continue
+                parts.append(_text(sql, run))
+                parts.append(_quote(alias))
+                run = []
+            parts.append(_text(sql, run))
+            if function is None:
+                break
+            argument = _text(sql, arguments) or "*"
+            if function == "AVG":
+                parts.append(f"(TOTAL({partial(f'TOTAL({argument})')}) / SUM({partial(f'COUNT({argument})')}))")
+            elif function == "COUNT":
+                parts.append(f"SUM({partial(f'COUNT({argument})')})")
+            else:
+                parts.append(f"{function}({partial(f'{function}({argument})')})")
+            at = end
+        return " ".join(p for p in parts if p)
+
+    if any(_is_star(expression) for expression, _ in items):
+        return None
+    aliases = {alias.lower(): alias for _, alias in items if alias}
+    # GROUP BY 2 and GROUP BY <alias> name result columns; the partial query groups by the expressions
+    group_terms = []
+    for term in _split(select.clause("group"), ","):
+        if not term:
+            continue
+        position = _integer(term)
+        if position is not None:
+            if not 1 <= position <= len(items):
+                return None
+            term = items[position - 1][0]
+        elif len(term) == 1 and _identifier(term[0]):
+            term = next((e for e, a in items if a and a.lower() == _identifier(term[0]).lower()), term)
+        if _aggregate_calls(term):
+            return None
+        group_terms.append(term)
+    groups = {_norm(term): _text(sql, term) for term in group_terms}
+    group_names = [partial(_text(sql, term)) for term in group_terms]
+
+    final_items = [merged(expression) for expression, _ in items]
+    having = merged(select.clause("having"), with_aliases=True) if select.clause("having") else ""
+    if None in final_items or having is None:
+        return None
+    order = []
+    for term in _split(select.clause("order"), ","):
+        if not term:
+            continue
+        expression, collation, descending, nulls_first = _order_term(term)
+        position = _integer(expression)
+        name = _identifier(expression[0]) if len(expression) == 1 else None
+        alias = next((a for _, a in items if name and a and a.lower() == name.lower()), None)
+        if position is not None:
+            text = str(position)
+        elif alias is not None:
+            text = _quote(alias)
+        else:
+            matching = next((i for i, (item, _) in enumerate(items) if _norm(item) == _norm(expression)), None)
+            text = str(matching + 1) if matching is not None else merged(expression, with_aliases=True)
+            if text is None:
+                return None
+        if collation:
+            text += f" COLLATE {collation}"
+        text += " DESC" if descending else ""
+        if nulls_first != (not descending):
+            text += " NULLS FIRST" if nulls_first else " NULLS LAST"
+        order.append(text)
+
+    shard_sql = "SELECT " + ", ".join(partials)
+    shard_sql += " " + sql[select.starts["from"]:select.starts.get("group", select.starts.get("having",
+        select.starts.get("order", select.starts.get("limit", len(sql)))))].strip()
+    if group_terms:
+        shard_sql += " GROUP BY " + ", ".join(_text(sql, term) for term in group_terms)
+    tail = " FROM __shard_partials"
+    if group_names:
+        tail += " GROUP BY " + ", ".join(group_names)
+    if having:
+        tail += f" HAVING {having}"
+    if order:
+        tail += " ORDER BY " + ", ".join(order)
+    if limit is not None or offset:
+        tail += f" LIMIT {-1 if limit is None else limit} OFFSET {offset}"
+    # The result column names come from the original query (LIMIT 0 stops before any row is computed)
+    probe_sql = sql[:select.starts.get("limit", len(sql))].rstrip() + " LIMIT 0"
+    merge = (final_items, tail, [p.rsplit(" AS ", 1)[1] for p in partials], probe_sql)
+    return ShardPlan("aggregate", None, shard_sql, merge, (), 0, limit, offset, select.distinct)
+
+def _column_like(tokens, at):
+    # A word outside an aggregate that is neither a keyword nor a function name reads a column
+    token = tokens[at]
+    if token.kind not in ("word", "quoted") or _upper(token) in _KEYWORDS:
+        return False
+    if at + 1 < len(tokens) and tokens[at + 1].text == "(":
+        return False
+    if at > 0 and _upper(tokens[at - 1]) in ("AS", "COLLATE"):
+        return False
+    return True
+
+# --- Merging -----------------------------------------------------------------
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+def _type_rank(value):
+    # SQLite sort order across storage classes: NULL < numbers < text < blobs
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    return 3
+
+class _SortKey:
+    """Orders merged rows like SQLite's ORDER BY (per-term direction, NULL placement and NOCASE)."""
+    __slots__ = ("values", "descending")
+
+    def __init__(self, values, descending):
+        self.values = values
+        self.descending = descending
+
+    def __lt__(self, other):
+        for a, b, descending in zip(self.values, other.values, self.descending):
+            if a == b:
+                continue
+            return (b < a) if descending else (a < b)
+        return False
+
+def _sort_key(order_keys, width):
+    terms = []
+    for index, collation, descending, nulls_first in order_keys:
+        position = width + index[1] if isinstance(index, tuple) else index
+        null_rank = -1 if nulls_first != descending else 4
+        terms.append((position, collation == "NOCASE", descending, null_rank))
+    descending = tuple(term[2] for term in terms)
+
+    def key(row):
+        values = []
+        for position, nocase, _, null_rank in terms:
+            value = row[position]
+            if value is None:
+                values.append((null_rank, 0))
+            elif nocase and isinstance(value, str):
+                # NOCASE only folds ASCII letters
+                values.append((2, value.translate(_ASCII_LOWER)))
+            else:
+                values.append((_type_rank(value), value))
+        return _SortKey(values, descending)
+    return key
+
+class ShardCursor:
+    """Cursor-like reader over merged shard results (what csv_export.export_cursor needs)."""
+    def __init__(self, description, rows, on_close=None):
+        self.description = description
+        self._rows = iter(rows)
+        self._on_close = on_close
+
+    def fetchmany(self, size=1000):
+        return list(islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
+
+_DESCRIPTION, _ROWS, _ERROR, _DONE = range(4)
+
+class _Fanout:
+    """The per-shard result streams of one query, produced on the router's worker threads."""
+    def __init__(self, router, tasks, version):
+        self.router = router
+        # Worker threads do not inherit the request's context, so its deadline is handed over explicitly
+        self.deadline = deadlines.current()
+        self.cancelled = threading.Event()
+        self.queues = [queue.SimpleQueue() for _ in tasks]
+        self._lock = threading.Lock()
+        self._running = set()
+        for index, (name, connect, sql) in enumerate(tasks):
+            router.executor.submit(self._produce, index, name, connect, sql, version)
+
+    def _produce(self, index, name, connect, sql, version):
+        out = self.queues[index]
+        try:
+            if self.cancelled.is_set():
+                return
+            with connect() as conn:
+                with self._lock:
+                    self._running.add(conn)
+                try:
+                    governor = self.router.governor
+                    if governor is not None:
+                        plan = governor.check_plan(conn, sql, (version, name))
+                        for warning in plan.warnings:
+                            print(f"⚠ Query plan on shard {name}: {warning}")
+                        if not plan.allowed:
+                            raise QueryRejected(plan.reason)
+                    with governor.budget(conn, self.deadline) if governor is not None else nullcontext():
+                        cursor = conn.execute(sql)
+                        try:
+                            out.put((_DESCRIPTION, cursor.description))
+                            while not self.cancelled.is_set():
+                                rows = cursor.fetchmany(self.router.chunk_size)
+                                if not rows:
+                                    break
+                                out.put((_ROWS, rows))
+                        finally:
+                            cursor.close()
+                finally:
+                    with self._lock:
+                        self._running.discard(conn)
+        except Exception as e:
+            out.put((_ERROR, e))
+        finally:
+            out.put((_DONE, None))
+
+    def description(self, index):
+        """Wait until a shard's query has started and return its cursor description."""
+        kind, value = self.queues[index].get()
+        if kind == _ERROR:
+            self.cancel()
+            raise value
+        if kind == _DONE:
+            raise RuntimeError("Shard query ended before it started")
+        return value
+
+    def rows(self, index):
+        """Rows of one shard in the order the shard produced them."""
+        while True:
+            kind, value = self.queues[index].get()
+            if kind == _ROWS:
+                yield from value
+            elif kind == _ERROR:
+                self.cancel()
+                raise value
+            else:
+                return
+
+    def cancel(self):
+        """Stop every shard query of this fan-out."""
+        self.cancelled.set()
+        with self._lock:
+            for conn in self._running:
+                conn.interrupt()
+
+class ShardRouter:
+    """
+    Runs queries across the shards of a manifest on a shared thread pool.
+
+    Each shard has its own bounded connection pool; sqlite3 releases the
+    GIL while a statement runs, so shard queries execute in parallel.
+    """
+    def __init__(self, manifest, pool_size=2, wait_timeout=10.0, pragmas=None, governor=None,
+                 chunk_size=1000, max_workers=None):
+        """
+        Args:
+            manifest (Manifest): Shard manifest
+            pool_size (int): Connections per shard
+            wait_timeout (float): Seconds to wait for a free shard connection
+            pragmas (dict or None): PRAGMA overrides for shard connections
+            governor (QueryGovernor or None): Plan check and execution budget applied on every shard
+            chunk_size (int): Rows a shard hands to the merge at a time
+            max_workers (int or None): Worker threads (defaults to shards * pool_size)
+        """
+        self.manifest = manifest
+        self.governor = governor
+        self.chunk_size = chunk_size
+        self.pragmas = dict(db_pool.DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.pools = {
+            shard.name: db_pool.ConnectionPool(shard.path, size=pool_size, wait_timeout=wait_timeout, pragmas=pragmas)
+            for shard in manifest.shards
+        }
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or len(manifest.shards) * pool_size, thread_name_prefix="shard"
+        )
+        self._lock = threading.Lock()
+        self._next_single = 0
+        self.queries = {mode: 0 for mode in MODES}
+        self.shards_scanned = 0
+        self.shards_pruned = 0
+
+    def version_watcher(self):
+        """Return a version watcher over every shard file."""
+        return query_cache.MultiDatabaseVersionWatcher([shard.path for shard in self.manifest.shards])
+
+    def execute(self, sql_query, version=None):
+        """
+        Start a query on the shards and return a cursor over the merged rows.
+
+        Args:
+            sql_query (str): Validated SELECT query
+            version (hashable): Database version token (keys the governor's table-size cache)
+
+        Returns:
+            ShardCursor: description, fetchmany() and close() (stops the shard queries)
+
+        Raises:
+            QueryRejected: If the governor rejected the plan on a shard
+            QueryInterrupted: If a shard query ran out of its budget
+            sqlite3.Error: If a shard query failed
+        """
+        plan = plan_query(self.manifest, sql_query)
+        with self._lock:
+            self.queries[plan.mode] += 1
+            self.shards_scanned += len(plan.shards)
+            if plan.mode != "single":
+                self.shards_pruned += len(self.manifest.shards) - len(plan.shards)
+            if plan.mode == "single":
+                shard = self.manifest.shards[self._next_single % len(self.manifest.shards)]
+                self._next_single += 1
+        if plan.mode == "single":
+            return self._stream(self._fanout([(shard.name, self.pools[shard.name].connection, plan.shard_sql)], version))
+        if plan.mode == "union":
+            return self._union(plan, version)
+        fanout = self._fanout(
+            [(shard.name, self.pools[shard.name].connection, plan.shard_sql) for shard in plan.shards], version
+        )
+        if plan.mode == "aggregate":
+            return self._aggregate(fanout, plan)
+        return self._merge(fanout, plan)
+
+    def explain(self, sql_query):
+        """
+        Return how a query would run, without running it.
+
+        Returns:
+            dict: mode, shards, shard_sql and merge_sql (how aggregate partials are combined)
+        """
+        plan = plan_query(self.manifest, sql_query)
+        return {
+            "mode": plan.mode,
+            "shards": [shard.name for shard in plan.shards],
+            "shard_sql": plan.shard_sql,
+            "merge_sql": "SELECT " + ", ".join(plan.final_sql[0]) + plan.final_sql[1] if plan.mode == "aggregate" else None,
+        }
+
+    def _fanout(self, tasks, version):
+        return _Fanout(self, tasks, version)
+
+    def _stream(self, fanout):
+        try:
+            description = fanout.description(0)
+        except BaseException:
+            fanout.cancel()
+            raise
+        return ShardCursor(description, fanout.rows(0), fanout.cancel)
+
+    def _merge(self, fanout, plan):
+        try:
+            descriptions = [fanout.description(i) for i in range(len(fanout.queues))]
+        except BaseException:
+            fanout.cancel()
+            raise
+        width = len(descriptions[0]) - plan.hidden
+        streams = [fanout.rows(i) for i in range(len(fanout.queues))]
+        if plan.order_keys:
+            rows = heapq.merge(*streams, key=_sort_key(plan.order_keys, width))
+        else:
+            rows = (row for stream in streams for row in stream)
+        return ShardCursor(descriptions[0][:width], self._finish(rows, width, plan), fanout.cancel)
+
+    def _finish(self, rows, width, plan):
+        # Drop hidden sort keys, de-duplicate DISTINCT results and apply the global LIMIT/OFFSET
+        seen = set() if plan.distinct else None
+        skipped = produced = 0
+        for row in rows:
+            if plan.hidden:
+                row = row[:width]
+            if seen is not None:
+                if row in seen:
+                    continue
+                seen.add(row)
+            if skipped < plan.offset:
+                skipped += 1
+                continue
+            if plan.limit is not None and produced >= plan.limit:
+                return
+            produced += 1
+            yield row
+
+    def _aggregate(self, fanout, plan):
+        final_items, tail, columns, probe_sql = plan.final_sql
+        merge = sqlite3.connect(":memory:", check_same_thread=False)
+        try:
+            with self.pools[plan.shards[0].name].connection() as conn:
+                names = [d[0] for d in conn.execute(probe_sql).description]
+            final_sql = ("SELECT DISTINCT " if plan.distinct else "SELECT ") + ", ".join(
+                f"{item} AS {_quote(name)}" for item, name in zip(final_items, names)
+            ) + tail
+            merge.execute(f"CREATE TABLE __shard_partials ({', '.join(columns)})")
+            insert = f"INSERT INTO __shard_partials VALUES ({', '.join('?' for _ in columns)})"
+            # Partial rows are loaded as each shard delivers them; the final query runs once all are in
+            for index in range(len(fanout.queues)):
+                fanout.description(index)
+                rows = fanout.rows(index)
+                while True:
+                    chunk = list(islice(rows, self.chunk_size))
+                    if not chunk:
+                        break
+                    merge.executemany(insert, chunk)
+            cursor = merge.execute(final_sql)
+        except BaseException:
+            fanout.cancel()
+            merge.close()
+            raise
+        return ShardCursor(cursor.description, _chain_chunks(cursor, self.chunk_size), merge.close)
+
+    def _union(self, plan, version):
+        shards = plan.shards
+        if len(shards) > SQLITE_MAX_ATTACHED + 1:
+            raise sqlite3.OperationalError(
+                f"the query cannot be split across shards and spans {len(shards)} shards "
+                f"(at most {SQLITE_MAX_ATTACHED + 1} can be combined)"
+            )
+        names = "-".join(shard.name for shard in shards)
+
+        @contextmanager
+        def connect():
+            conn = sqlite3.connect(db_pool.readonly_uri(shards[0].path), uri=True, check_same_thread=False)
+            try:
+                for name, value in self.pragmas.items():
+                    if name != "query_only":
+                        conn.execute(f"PRAGMA {name} = {value}")
+                for i, shard in enumerate(shards[1:]):
+                    conn.execute(f"ATTACH DATABASE ? AS shard{i}", (db_pool.readonly_uri(shard.path),))
+                for table in self.manifest.partitioned_tables:
+                    sources = [f"SELECT * FROM main.{_quote(table)}"]
+                    sources += [f"SELECT * FROM shard{i}.{_quote(table)}" for i in range(len(shards) - 1)]
+                    # Temp views shadow the main tables, so the query runs unchanged
+                    conn.execute(f"CREATE TEMP VIEW {_quote(table)} AS {' UNION ALL '.join(sources)}")
+                conn.execute("PRAGMA query_only = ON")
+                yield conn
+            finally:
+                conn.close()
+        return self._stream(self._fanout([(f"union:{names}", connect, plan.shard_sql)], version))
+
+    def stats(self):
+        """
+        Return fan-out counters.
+
+        Returns:
+            dict: shards, queries by mode, shards scanned and pruned
+        """
+        with self._lock:
+            return {
+                "shards": len(self.manifest.shards),
+                "queries": dict(self.queries),
+                "shards_scanned": self.shards_scanned,
+                "shards_pruned": self.shards_pruned,
+            }
+
+    def close(self):
+        """Stop the worker threads and close idle shard connections."""
+        self.executor.shutdown(wait=False)
+        for pool in self.pools.values():
+            pool.close()
+
+def _chain_chunks(cursor, size):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+# --- Splitting a database ----------------------------------------------------
+
+def split_by_year(source_path, output_dir, parent="Orders", key="OrderID", date_column="OrderDate",
+                  children=("OrderDetails",), years_per_shard=1):
+    """
+    Partition a database into one shard per year of a date column and write its manifest.
+
+    The parent table is split by the year of date_column, child tables follow
+    their parent rows through key, and every other table is copied to each shard.
+
+    Args:
+        source_path (str): Database to split
+        output_dir (str): Folder for the shard files and manifest.json (shard files must not exist)
+        parent (str): Table partitioned by date
+        key (str): Column linking child rows to their parent row
+        date_column (str): Date column of the parent table
+        children (tuple): Tables co-located with their parent rows
+        years_per_shard (int): Consecutive years stored in one shard
+
+    Returns:
+        str: Path of the manifest
+    """
+    import northwind_scale
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    try:
+        years = [int(y) for (y,) in source.execute(
+            f"SELECT DISTINCT strftime('%Y', {date_column}) FROM {parent} WHERE {date_column} IS NOT NULL ORDER BY 1"
+        )]
+    finally:
+        source.close()
+    groups = [years[i:i + years_per_shard] for i in range(0, len(years), max(1, years_per_shard))]
+    partitioned = (parent,) + tuple(children)
+    entries = []
+    for group in groups:
+        name = str(group[0]) if len(group) == 1 else f"{group[0]}-{group[-1]}"
+        path = os.path.join(output_dir, f"{stem}_{name}.db")
+        if os.path.exists(path):
+            raise ValueError(f"{path} already exists")
+        target = sqlite3.connect(path)
+        try:
+            target.execute("PRAGMA journal_mode = OFF")
+            source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+            try:
+                tables = northwind_scale._copy_schema(source, target)
+            finally:
+                source.close()
+            target.execute("ATTACH DATABASE ? AS src", (f"file:{os.path.abspath(source_path)}?mode=ro",))
+            target.execute(
+                f"INSERT INTO main.{parent} SELECT * FROM src.{parent} "
+                f"WHERE CAST(strftime('%Y', {date_column}) AS INTEGER) BETWEEN ? AND ?",
+                (group[0], group[-1]),
+            )
+            for child in children:
+                target.execute(f"INSERT INTO main.{child} SELECT * FROM src.{child} WHERE {key} IN (SELECT {key} FROM main.{parent})")
+            for table in tables:
+                if table not in partitioned and table not in APPLICATION_TABLES:
+                    target.execute(f"INSERT INTO main.{table} SELECT * FROM src.{table}")
+            target.commit()
+            target.execute("DETACH DATABASE src")
+            ranges = {}
+            for column in (date_column, key):
+                bounds = target.execute(f"SELECT MIN({column}), MAX({column}) FROM {parent}").fetchone()
+                if bounds[0] is not None:
+                    ranges[column] = list(bounds)
+            target.execute("PRAGMA journal_mode = DELETE")
+        except BaseException:
+            target.close()
+            os.remove(path)
+            raise
+        target.close()
+        entries.append({"name": name, "path": os.path.basename(path), "ranges": ranges})
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "partitioned_tables": list(partitioned),
+            "partition_keys": {date_column: [parent], key: list(partitioned)},
+            "shards": entries,
+        }, f, indent=2)
+    return manifest_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a database into shards or run a query across shards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    split = commands.add_parser("split", help="Partition Orders/OrderDetails by order year")
+    split.add_argument("--source", default=os.getenv("DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Northwind.db"))
+    split.add_argument("--output-dir", required=True)
+    split.add_argument("--years-per-shard", type=int, default=1)
+    run = commands.add_parser("query", help="Run a SELECT across the shards of a manifest")
+    run.add_argument("--manifest", default=os.getenv("SHARD_MANIFEST"), required=not os.getenv("SHARD_MANIFEST"))
+    run.add_argument("--limit", type=int, default=20, help="Rows printed")
+    run.add_argument("sql")
+    args = parser.parse_args(argv)
+
+    if args.command == "split":
+        try:
+            manifest_path = split_by_year(args.source, args.output_dir, years_per_shard=args.years_per_shard)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        manifest = load_manifest(manifest_path)
+        print(f"✅ {len(manifest.shards)} shards written, manifest {manifest_path}")
+        for shard in manifest.shards:
+            print(f"  {shard.name:<12}{os.path.basename(shard.path)}")
+        return 0
+
+    router = ShardRouter(load_manifest(args.manifest))
+    try:
+        explained = router.explain(args.sql)
+        print(f"🔀 {explained['mode']} on {len(explained['shards'])} shard(s): {', '.join(explained['shards'])}")
+        cursor = router.execute(args.sql)
+        try:
+            print(" | ".join(d[0] for d in cursor.description))
+            for row in cursor.fetchmany(args.limit):
+                print(" | ".join("NULL" if v is None else str(v) for v in row))
+        finally:
+            cursor.close()
+    except (sqlite3.Error, QueryRejected) as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        router.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Startup profile and regression check for the Python service.
+
+Imports the service in a fresh interpreter with -X importtime, then reports
+the packages that cost the most import time, the total import time and the
+peak RSS. Exits with status 1 when a threshold is exceeded or a module that
+must stay lazy (Gradio, the Gemini SDK, pandas) was loaded at startup, so it
+can run as a check in CI:
+
+    python startup_profile.py
+    python startup_profile.py --module chatbot_service --top 20 --max-seconds 1.5
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+
+MAX_IMPORT_SECONDS = float(os.getenv("STARTUP_MAX_IMPORT_SECONDS", "3"))
+MAX_RSS_MB = float(os.getenv("STARTUP_MAX_RSS_MB", "200"))
+FORBIDDEN_MODULES = [
+    m.strip() for m in os.getenv("STARTUP_FORBIDDEN_MODULES", "gradio,google.generativeai,pandas").split(",") if m.strip()
+]
+
+REPORT_MARKER = "STARTUP_PROFILE "
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+try:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+except ImportError:
+    peak_mb = None
+print({marker!r} + json.dumps({{"seconds": seconds, "peak_rss_mb": peak_mb, "modules": sorted(sys.modules)}}))
+"""
+
+def profile_startup(module="app", cwd=None):
+    """
+    Import a module in a fresh interpreter and measure its startup cost.
+
+    Args:
+        module (str): Module to import (app.py by default, i.e. the Flask path)
+        cwd (str or None): Directory to run in (defaults to this file's directory)
+
+    Returns:
+        dict: seconds, peak_rss_mb, modules and imports [(package, self_us, cumulative_us, depth), ...]
+
+    Raises:
+        RuntimeError: If the import failed
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT.format(module=module, marker=REPORT_MARKER)],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    report_lines = [line for line in proc.stdout.splitlines() if line.startswith(REPORT_MARKER)]
+    imports = []
+    errors = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+        elif not line.startswith("import time:"):
+            errors.append(line)
+    if proc.returncode != 0 or not report_lines:
+        raise RuntimeError(f"Importing {module} failed:\n" + "\n".join(errors[-20:]))
+    report = json.loads(report_lines[-1][len(REPORT_MARKER):])
+    report["imports"] = imports
+    return report
+
+def heaviest_packages(imports, top=15):
+    """
+    Sum self import time per top-level package.
+
+    Args:
+        imports (list): (package, self_us, cumulative_us, depth) tuples from profile_startup()
+        top (int): Number of packages to return
+
+    Returns:
+        list: (package, seconds, module_count) sorted by time, slowest first
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for name, self_us, _, _ in imports:
+        entry = totals[name.split(".")[0]]
+        entry[0] += self_us
+        entry[1] += 1
+    ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    return [(name, us / 1e6, count) for name, (us, count) in ranked[:top]]
+
+def check_startup(report, max_seconds=MAX_IMPORT_SECONDS, max_rss_mb=MAX_RSS_MB, forbidden=FORBIDDEN_MODULES):
+    """
+    Compare a startup profile against the budgets.
+
+    Returns:
+        list: Failure messages (empty when startup is within budget)
+    """
+    failures = []
+    if max_seconds and report["seconds"] > max_seconds:
+        failures.append(f"import took {report['seconds']:.2f}s (limit {max_seconds:.2f}s)")
+    if max_rss_mb and report["peak_rss_mb"] is not None and report["peak_rss_mb"] > max_rss_mb:
+        failures.append(f"peak RSS {report['peak_rss_mb']:.1f} MB (limit {max_rss_mb:.1f} MB)")
+    loaded = set(report["modules"])
+    for module in forbidden:
+        if module in loaded:
+            failures.append(f"{module} was imported at startup")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the Python service's startup and check it against budgets.")
+    parser.add_argument("--module", default="app", help="Module to import (default: app)")
+    parser.add_argument("--top", type=int, default=15, help="Packages to list")
+    parser.add_argument("--max-seconds", type=float, default=MAX_IMPORT_SECONDS, help="Import time budget (0 disables)")
+    parser.add_argument("--max-rss-mb", type=float, default=MAX_RSS_MB, help="Peak RSS budget in MB (0 disables)")
+    args = parser.parse_args(argv)
+
+    try:
+        report = profile_startup(args.module)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    rss = "n/a" if report["peak_rss_mb"] is None else f"{report['peak_rss_mb']:.1f} MB"
+    print(f"⏱ import {args.module}: {report['seconds']:.3f}s, peak RSS {rss}, {len(report['modules'])} modules")
+    print(f"{'package':<32}{'self s':>10}{'modules':>10}")
+    for name, seconds, count in heaviest_packages(report["imports"], args.top):
+        print(f"{name:<32}{seconds:>10.3f}{count:>10}")
+
+    failures = check_startup(report, args.max_seconds, args.max_rss_mb)
+    for failure in failures:
+        print(f"❌ Startup budget exceeded: {failure}")
+    if not failures:
+        print("✅ Startup within budget")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NORTHWIND_DB = os.path.join(SERVICE_DIR, "..", "Northwind.db")
+
+# The service modules are imported by name, as app.py does
+sys.path.insert(0, SERVICE_DIR)
@@ -0,0 +1,128 @@
+"""
+Follow-up refinements: which questions parse as a sort / limit / filter /
+projection of the previous answer, and the SQL they become over the cached
+rows or the previous query.
+"""
+import sqlite3
+
+import pytest
+
+import followup
+from conftest import NORTHWIND_DB
+
+COLUMNS = ["ProductName", "Price", "Country"]
+ROWS = [("Chais", 18.0, "UK"), ("Chang", 19.0, "UK"), ("Aniseed Syrup", 10.0, "Germany"), ("Tofu", 23.25, "Japan")]
+PREVIOUS_SQL = (
+    "SELECT p.ProductName, p.Price, s.Country FROM Products p "
+    "JOIN Suppliers s ON s.SupplierID = p.SupplierID ORDER BY p.Price DESC"
+)
+
+def parse(question):
+    return followup.parse_followup(question, COLUMNS, ROWS)
+
+@pytest.mark.parametrize("question, order", [
+    ("now sort those by price", [("Price", False)]),
+    ("sort by price descending", [("Price", True)]),
+    ("order them by product name from highest to lowest", [("ProductName", True)]),
+    ("rank by country ascending", [("Country", False)]),
+])
+def test_sort(question, order):
+    assert parse(question).order == order
+
+@pytest.mark.parametrize("question, limit", [
+    ("top 5", 5),
+    ("just show the first 3", 3),
+    ("limit those to 10 rows", 10),
+    ("only 2", 2),
+])
+def test_limit(question, limit):
+    assert parse(question).limit == limit
+
+@pytest.mark.parametrize("question, condition", [
+    ("only the ones where price is greater than 18", ("Price", ">", 18)),
+    ("those with a price at most 19.5 dollars", ("Price", "<=", 19.5)),
+    ("keep only rows where country is not UK", ("Country", "!=", "uk")),
+])
+def test_compare(question, condition):
+    assert parse(question).filters == [condition]
+
+def test_membership_finds_the_column_of_a_value():
+    assert parse("only the ones from Germany").filters == [("Country", "=", "Germany")]
+
+def test_exclude():
+    assert parse("excluding UK").filters == [("Country", "!=", "UK")]
+
+@pytest.mark.parametrize("question, columns", [
+    ("just show the product names and prices", ["ProductName", "Price"]),
+    ("show only the country column", ["Country"]),
+    ("give me the price of those", ["Price"]),
+])
+def test_project(question, columns):
+    assert parse(question).columns == columns
+
+def test_clauses_combine():
+    refinement = parse("only the ones from UK, sort by price descending and then top 1")
+    assert refinement.filters == [("Country", "=", "UK")]
+    assert refinement.order == [("Price", True)]
+    assert refinement.limit == 1
+
+@pytest.mark.parametrize("question", [
+    "list order details",
+    "sort those by shipping date",
+    "only the ones from France",
+    "which employee sold the most?",
+    "show the products by price",
+    "top sellers",
+    "",
+])
+def test_not_a_followup(question):
+    assert parse(question) is None
+
+def test_no_previous_result():
+    assert followup.parse_followup("top 5", [], []) is None
+
+def run_local(refinement):
+    conn = sqlite3.connect(":memory:")
+    followup.load_rows(conn, COLUMNS, ROWS)
+    return conn.execute(refinement.to_sql(followup.LOCAL_TABLE)).fetchall()
+
+def test_local_sql_keeps_previous_order():
+    assert run_local(parse("only the ones from UK")) == ROWS[:2]
+    assert run_local(parse("just show the product names")) == [(row[0],) for row in ROWS]
+
+def test_local_sql_sorts_filters_and_limits():
+    assert run_local(parse("sort by price descending, top 2")) == [ROWS[3], ROWS[1]]
+    assert run_local(parse("only the ones where price is below 19")) == [ROWS[0], ROWS[2]]
+
+def test_subquery_restates_previous_order():
+    sql = parse("top 3").to_sql(PREVIOUS_SQL)
+    assert sql == f'SELECT * FROM ({PREVIOUS_SQL}) AS previous ORDER BY "Price" DESC LIMIT 3'
+
+def test_subquery_matches_previous_result_on_northwind():
+    conn = sqlite3.connect(f"file:{NORTHWIND_DB}?mode=ro", uri=True)
+    previous = conn.execute(PREVIOUS_SQL).fetchall()
+    refinement = followup.parse_followup("only the ones from USA, top 4", COLUMNS, previous)
+
+    assert conn.execute(refinement.to_sql(PREVIOUS_SQL)).fetchall() == [row for row in previous if row[2] == "USA"][:4]
+    projected = followup.parse_followup("just show the product names", COLUMNS, previous)
+    assert conn.execute(projected.to_sql(PREVIOUS_SQL)).fetchall() == [(row[0],) for row in previous]
+
+def test_new_sort_breaks_ties_with_previous_order():
+    sql = parse("sort by country").to_sql(PREVIOUS_SQL)
+    assert sql.endswith('ORDER BY "Country", "Price" DESC')
+
+@pytest.mark.parametrize("sql, order", [
+    ("SELECT Country, COUNT(*) AS Suppliers FROM Suppliers GROUP BY Country ORDER BY Suppliers DESC, 1",
+     [("Suppliers", " DESC"), ("Country", "")]),
+    ("SELECT Country, COUNT(*) FROM Suppliers GROUP BY Country ORDER BY COUNT(*) DESC",
+     [("COUNT(*)", " DESC")]),
+    ("SELECT * FROM Products ORDER BY Price NULLS LAST, ProductName COLLATE NOCASE DESC",
+     [("Price", " NULLS LAST"), ("ProductName", " COLLATE NOCASE DESC")]),
+    # The order stops at the first term that is not a result column
+    ("SELECT ProductName FROM Products ORDER BY Price DESC", []),
+    ("SELECT ProductName FROM Products", []),
+    ("SELECT ProductName FROM Products UNION SELECT CategoryName FROM Categories ORDER BY 1", []),
+])
+def test_previous_order(sql, order):
+    column_names = [d[0] for d in sqlite3.connect(f"file:{NORTHWIND_DB}?mode=ro", uri=True).execute(sql).description]
+    assert followup.previous_order(sql, column_names) == order
@@ -0,0 +1,80 @@
+"""
+Query governor tests on the bundled Northwind database: plans above
+max_plan_rows are rejected before they run, and running queries are
+interrupted once they use up their VM-step, time or request budget.
+"""
+import sqlite3
+
+import pytest
+
+import deadlines
+import query_governor
+from conftest import NORTHWIND_DB
+
+CROSS_JOIN = "SELECT COUNT(*) FROM OrderDetails a, OrderDetails b"
+INDEXED_JOIN = (
+    "SELECT o.OrderID, d.ProductID, d.Quantity FROM OrderDetails d "
+    "JOIN Orders o ON o.OrderID = d.OrderID"
+)
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(f"file:{NORTHWIND_DB}?mode=ro", uri=True)
+    yield conn
+    conn.close()
+
+def test_cross_join_rejected_above_max_plan_rows(conn):
+    governor = query_governor.QueryGovernor(max_plan_rows=100_000)
+    report = governor.check_plan(conn, CROSS_JOIN)
+
+    assert not report.allowed
+    assert "cartesian product" in report.reason
+    # 518 x 518 OrderDetails rows
+    assert report.estimated_rows == 518 * 518
+    assert governor.stats()["rejected"] == 1
+
+def test_indexed_join_allowed(conn):
+    governor = query_governor.QueryGovernor(max_plan_rows=100_000)
+    report = governor.check_plan(conn, INDEXED_JOIN)
+
+    assert report.allowed
+    assert report.reason is None
+    # Orders is looked up by primary key, so only the OrderDetails scan counts
+    assert report.estimated_rows == 518
+    assert governor.stats()["rejected"] == 0
+
+def test_table_aliases_resolve_join_aliases():
+    assert query_governor.table_aliases(INDEXED_JOIN) == {
+        "orderdetails": "OrderDetails", "d": "OrderDetails", "orders": "Orders", "o": "Orders",
+    }
+
+def test_vm_step_budget_interrupts_query(conn):
+    governor = query_governor.QueryGovernor(max_seconds=0, max_vm_steps=5_000, progress_interval=100)
+    with pytest.raises(query_governor.QueryInterrupted, match="VM steps"):
+        with governor.budget(conn):
+            conn.execute(CROSS_JOIN).fetchall()
+    assert governor.stats()["interrupted"] == 1
+
+def test_time_budget_interrupts_query(conn):
+    governor = query_governor.QueryGovernor(max_seconds=1e-6, progress_interval=100)
+    with pytest.raises(query_governor.QueryInterrupted, match="time budget"):
+        with governor.budget(conn):
+            conn.execute(CROSS_JOIN).fetchall()
+    assert governor.stats()["interrupted"] == 1
+
+def test_expired_request_deadline_raises_deadline_exceeded(conn):
+    governor = query_governor.QueryGovernor(max_seconds=0, progress_interval=100)
+    with deadlines.scope(0):
+        with pytest.raises(deadlines.DeadlineExceeded) as excinfo:
+            with governor.budget(conn):
+                conn.execute(CROSS_JOIN).fetchall()
+    assert excinfo.value.stage == "sql_execution"
+    # Running out of request time is not counted as a query over its own budget
+    assert governor.stats()["interrupted"] == 0
+
+def test_budget_removed_after_block(conn):
+    governor = query_governor.QueryGovernor(max_seconds=0, max_vm_steps=5_000, progress_interval=100)
+    with governor.budget(conn):
+        pass
+    # Without the progress handler the same query runs to completion
+    assert conn.execute(CROSS_JOIN).fetchone() == (518 * 518,)
@@ -0,0 +1,33 @@
+"""
+Rate limiter tests: shared bucket state must not touch disk until the first
+request, since the module-level limiter is built at import, before workers fork.
+"""
+import os
+
+import pytest
+
+import rate_limiter
+
+def test_state_file_is_created_on_first_request(tmp_path):
+    path = str(tmp_path / "rate.db")
+    limiter = rate_limiter.RateLimiter(rpm=60, state_path=path)
+    assert not os.path.exists(path)
+
+    with limiter.slot(tokens=10):
+        pass
+    assert os.path.exists(path)
+    assert limiter.stats()["admitted"] == 1
+
+def test_limiters_share_one_state_file(tmp_path):
+    path = str(tmp_path / "rate.db")
+    first = rate_limiter.RateLimiter(rpm=2, state_path=path, wait_timeout=0.1)
+    second = rate_limiter.RateLimiter(rpm=2, state_path=path, wait_timeout=0.1)
+
+    with first.slot():
+        pass
+    with second.slot():
+        pass
+    # Both requests of the minute were taken, one by each limiter
+    with pytest.raises(rate_limiter.RateLimitExceeded):
+        with first.slot():
+            pass
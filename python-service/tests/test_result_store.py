@@ -0,0 +1,137 @@
+"""
+Result store paging: offset and keyset ("after") pages, expiry of unread
+handles, and rows that were not spilled being re-run from the stored SQL.
+"""
+import time
+
+import pytest
+
+import result_store
+
+SQL = "SELECT id, name, picture FROM things ORDER BY id"
+VERSION = ("things.db", 1)
+COLUMNS = ["id", "name", "picture"]
+ROWS = [(i, f"thing {i}", bytes([i % 256, 0, 255])) for i in range(25)]
+
+class Rerun:
+    """Stands in for re-running the stored SQL against the database."""
+    def __init__(self, rows=ROWS):
+        self.rows = rows
+        self.calls = []
+
+    def __call__(self, sql_query, offset, limit):
+        self.calls.append((sql_query, offset, limit))
+        return self.rows[offset:offset + limit]
+
+def store_at(tmp_path, **kwargs):
+    return result_store.ResultStore(str(tmp_path / "results.db"), **kwargs)
+
+def register(store, rows=ROWS):
+    writer = store.writer()
+    # Chunks as export_cursor hands them to its sink
+    for start in range(0, len(rows), 10):
+        writer.write(rows[start:start + 10])
+    return store.register(writer, SQL, VERSION, COLUMNS, len(rows))
+
+def as_lists(rows):
+    return [list(row) for row in rows]
+
+def test_offset_pages(tmp_path):
+    store = store_at(tmp_path, spill_min_rows=1)
+    result_id = register(store)
+
+    page = store.page(result_id, offset=20, limit=10)
+    assert page["offset"] == 20
+    assert page["rows"] == as_lists(ROWS[20:])
+    assert page["total_rows"] == 25
+    assert page["next"] is None
+
+def test_after_cursor_walks_every_row(tmp_path):
+    store = store_at(tmp_path, spill_min_rows=1)
+    result_id = register(store)
+
+    rows, after = [], None
+    while True:
+        page = store.page(result_id, after=after, limit=7)
+        rows.extend(page["rows"])
+        after = page["next"]
+        if after is None:
+            break
+    assert rows == as_lists(ROWS)
+
+def test_blobs_round_trip_as_bytes(tmp_path):
+    store = store_at(tmp_path, spill_min_rows=1)
+    result_id = register(store)
+
+    picture = store.page(result_id, offset=3, limit=1)["rows"][0][2]
+    assert picture == bytes([3, 0, 255])
+
+def test_negative_offset_rejected(tmp_path):
+    store = store_at(tmp_path, spill_min_rows=1)
+    result_id = register(store)
+    with pytest.raises(ValueError):
+        store.page(result_id, offset=-1)
+
+def test_unread_handle_expires(tmp_path):
+    store = store_at(tmp_path, ttl=0.05, spill_min_rows=1)
+    result_id = register(store)
+    assert store.page(result_id, limit=5) is not None
+
+    time.sleep(0.1)
+    assert store.page(result_id, limit=5) is None
+    assert store.describe(result_id) is None
+    assert store.purge(force=True) == 1
+    assert store.stats()["rows"] == 0
+
+def test_small_result_keeps_only_the_handle(tmp_path):
+    store = store_at(tmp_path)
+    result_id = register(store)
+
+    assert store.stats() == {"path": store.path, "handles": 1, "rows": 0}
+    assert store.describe(result_id)["total_rows"] == 25
+
+def test_first_page_reruns_and_stores_the_rows(tmp_path):
+    store = store_at(tmp_path)
+    result_id = register(store)
+    rerun = Rerun()
+
+    first = store.page(result_id, offset=5, limit=5, rerun=rerun, version=VERSION)
+    assert first["rows"] == as_lists(ROWS[5:10])
+    # One re-run for every row, later pages read the stored copy
+    assert rerun.calls == [(SQL, 0, 25)]
+    second = store.page(result_id, after=first["next"], limit=5, rerun=rerun, version=VERSION)
+    assert second["rows"] == as_lists(ROWS[10:15])
+    assert len(rerun.calls) == 1
+    assert store.stats()["rows"] == 25
+
+def test_rerun_after_partial_spill(tmp_path):
+    store = store_at(tmp_path, spill_min_rows=15)
+    writer = store.writer()
+    writer.write(ROWS[:20])
+    # The export stopped storing rows, e.g. after a storage error
+    writer.failed = True
+    writer.write(ROWS[20:])
+    result_id = store.register(writer, SQL, VERSION, COLUMNS, len(ROWS))
+    rerun = Rerun()
+
+    page = store.page(result_id, offset=15, limit=10, rerun=rerun, version=VERSION)
+    assert page["rows"] == as_lists(ROWS[15:25])
+    assert rerun.calls == [(SQL, 20, 5)]
+
+def test_rerun_refused_after_the_database_changed(tmp_path):
+    store = store_at(tmp_path)
+    result_id = register(store)
+
+    with pytest.raises(ValueError, match="no longer available"):
+        store.page(result_id, limit=5, rerun=Rerun(), version=("things.db", 2))
+    with pytest.raises(ValueError, match="no longer available"):
+        store.page(result_id, limit=5)
+
+def test_read_without_spill_reruns_only_the_range(tmp_path):
+    store = store_at(tmp_path)
+    result_id = register(store)
+    rerun = Rerun()
+
+    assert store.read(result_id, 3, 4, rerun=rerun, version=VERSION)["rows"] == as_lists(ROWS[3:7])
+    assert rerun.calls == [(SQL, 3, 4)]
+    assert store.stats()["rows"] == 0
@@ -0,0 +1,45 @@
+"""
+Startup regression test: the Flask path must import quickly, stay small and
+leave Gradio, the Gemini SDK and pandas unloaded until they are needed.
+
+Limits come from STARTUP_MAX_IMPORT_SECONDS, STARTUP_MAX_RSS_MB and
+STARTUP_FORBIDDEN_MODULES (see startup_profile.py):
+
+    cd python-service && python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+import startup_profile
+
+LAZY_MODULES = ("gradio", "google.generativeai", "pandas")
+
+@pytest.fixture(scope="module")
+def report():
+    # The child interpreter inherits the environment; without a DB_PATH the bundled Northwind.db is used
+    os.environ.setdefault("DB_PATH", os.path.join(SERVICE_DIR, "..", "Northwind.db"))
+    return startup_profile.profile_startup("app", SERVICE_DIR)
+
+def test_import_time_within_budget(report):
+    assert report["seconds"] <= startup_profile.MAX_IMPORT_SECONDS, (
+        f"import app took {report['seconds']:.2f}s (limit {startup_profile.MAX_IMPORT_SECONDS:.2f}s)"
+    )
+
+def test_peak_rss_within_budget(report):
+    if report["peak_rss_mb"] is None:
+        pytest.skip("peak RSS is not available on this platform")
+    assert report["peak_rss_mb"] <= startup_profile.MAX_RSS_MB, (
+        f"peak RSS {report['peak_rss_mb']:.1f} MB (limit {startup_profile.MAX_RSS_MB:.1f} MB)"
+    )
+
+@pytest.mark.parametrize("module", sorted(set(LAZY_MODULES) | set(startup_profile.FORBIDDEN_MODULES)))
+def test_module_stays_lazy(report, module):
+    assert module not in report["modules"], f"{module} was imported at startup"
+
+def test_check_startup_passes(report):
+    assert startup_profile.check_startup(report) == []